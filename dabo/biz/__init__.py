@@ -22,6 +22,7 @@ So, dabo.biz sits in between dabo.db and dabo.ui
 """
 from dBizobj import dBizobj
 from RemoteBizobj import RemoteBizobj
+from dRequeryExecutor import dRequeryExecutor, getRequeryExecutor
 
 from dAutoBizobj import dAutoBizobj
 from dAutoBizobj import autoCreateTables
@@ -3,6 +3,7 @@ import types
 import re
 import warnings
 import time
+import threading
 import dabo
 import dabo.dConstants as kons
 from dabo.db.dCursorMixin import dCursorMixin
@@ -11,6 +12,7 @@ from dabo.lib.utils import ustr
 import dabo.dException as dException
 from dabo.dObject import dObject
 from dabo.lib.RemoteConnector import RemoteConnector
+from dRequeryExecutor import getRequeryExecutor
 
 
 NO_RECORDS_PK = "75426755-2f32-4d3d-86b6-9e2a1ec47f2c"	## Can't use None
@@ -34,6 +36,14 @@ class dBizobj(dObject):
 		self._cascadeDeleteFromParent = True
 		# Collection of cursor objects. MUST be defined first.
 		self.__cursors = {}
+		# The cursors that hold changed records, and those that hold new records.
+		self._changedCursors = set()
+		self._newCursors = set()
+		# Whether anything in this bizobj or its children is changed, for each
+		# value of the includeNewUnchanged argument of isAnyChanged(), and the
+		# number of children for which it is.
+		self._subtreeChanged = {False: False, True: False, None: False}
+		self._changedChildCounts = {False: 0, True: 0, None: 0}
 		# PK of the currently-selected cursor
 		self.__currentCursorKey = None
 		# Description of the data represented by this bizobj
@@ -96,6 +106,13 @@ class dBizobj(dObject):
 		self.exitScan = False
 		self.dbapiCursorClass = None
 		self._childCacheInterval = None
+		self._columnarStorage = False
+		self._fetchWindowSize = 0
+		self._resultCacheInterval = None
+		self._pageSize = 0
+		self._parallelChildRequery = False
+		# The pending requeryAsync() request.
+		self._asyncRequery = None
 
 		##########################################
 		### referential integrity stuff ####
@@ -183,6 +200,10 @@ class dBizobj(dObject):
 		self.__cursors = cursors
 		if flush_current:
 			self.__currentCursorKey = None
+		kept = set(cursors.values())
+		self._changedCursors &= kept
+		self._newCursors &= kept
+		self._updateChangedState()
 		for child in self._children:
 			child._flushCursors(flush_changed, flush_current)
 
@@ -455,6 +476,17 @@ class dBizobj(dObject):
 		return ret
 
 
+	def _isTransactionPending(self):
+		"""
+		Returns True/False, depending on whether any bizobj holds the
+		transaction token for this bizobj's connection.
+		"""
+		try:
+			return self.Application.isTransactionPending(self)
+		except AttributeError:
+			return hasattr(dabo, "_bizTransactionToken")
+
+
 	def _releaseTransactionToken(self):
 		"""
 		Ask the Application to give up the transaction token. Once this is done,
@@ -719,16 +751,23 @@ class dBizobj(dObject):
 
 
 	def deleteAll(self, startTransaction=True):
-		"""Delete all rows in the data set."""
+		"""
+		Delete all rows in the data set. If the bizobj has no children, the rows
+		are deleted with a few set-based statements instead of one at a time.
+		"""
 		rp = self._RemoteProxy
 		if rp:
 			return rp.deleteAll()
 		cursorKey = self.__currentCursorKey
 		startTransaction = startTransaction and self.beginTransaction()
 		try:
-			while self.RowCount > 0:
-				self.first()
-				self.delete(startTransaction=False, inLoop=True)
+			if self._children:
+				# The child records have to be dealt with for each row.
+				while self.RowCount > 0:
+					self.first()
+					self.delete(startTransaction=False, inLoop=True)
+			elif self.RowCount > 0:
+				self.__deleteAllRows()
 			if startTransaction:
 				self.commitTransaction()
 
@@ -748,6 +787,51 @@ class dBizobj(dObject):
 		self._CurrentCursor = cursorKey
 
 
+	def bulkLoad(self, rows, columns, startTransaction=True):
+		"""
+		Insert the rows, which are sequences of values ordered like the passed
+		column names, straight into the DataSource table using the fastest way
+		the backend has, and return the number of rows inserted. The rows are
+		read from the iterable as they are sent, so a csv.reader() over a large
+		file can be passed. The data set isn't changed; call requery() to see
+		the new records.
+		"""
+		startTransaction = startTransaction and self.beginTransaction()
+		try:
+			ret = self._CurrentCursor.bulkLoad(rows, columns)
+			if startTransaction:
+				self.commitTransaction()
+		except dException.DBQueryException:
+			if startTransaction:
+				self.rollbackTransaction()
+			raise
+		except StandardError:
+			if startTransaction:
+				self.rollbackTransaction()
+			raise
+		return ret
+
+
+	def __deleteAllRows(self):
+		"""Delete all the rows of a bizobj without children in bulk."""
+		if self.KeyField is None:
+			raise dException.dException(
+					_("No key field defined for table: ") + self.DataSource)
+		cursor = self._CurrentCursor
+		errMsg = self.beforePointerMove()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		for row in xrange(self.RowCount):
+			cursor.RowNumber = row
+			errMsg = self.beforeDelete()
+			if errMsg:
+				raise dException.BusinessRuleViolation(errMsg)
+		cursor.deleteRows()
+		if self.RowCount == 0:
+			# Hook method for handling the deletion of the last record in the cursor.
+			self.onDeleteLastRecord()
+
+
 	def execute(self, sql, params=None):
 		"""Execute the sql on the cursor. Dangerous. Use executeSafe instead."""
 		self._syncWithCursors()
@@ -794,19 +878,20 @@ class dBizobj(dObject):
 		if not self.RowCount:
 			# If there are no records, there can be no changes
 			return []
-		if self._children:
-			rows = []
-
-			def _isRowChanged():
-				if self.isChanged(includeNewUnchanged):
-					rows.append(self.RowNumber)
-
-			# Must iterate all records to find potential changes in children:
-			self.scan(_isRowChanged, scanRequeryChildren=False)
+		cursor = self._CurrentCursor
+		rows = cursor.getChangedRows(includeNewUnchanged)
+		if not self._children:
 			return rows
-		else:
-			# Can use the much faster cursor.getChangedRows():
-			return self._CurrentCursor.getChangedRows(includeNewUnchanged)
+		# Add the rows whose child records have changes. Only the children
+		# that have changes somewhere need to be looked at.
+		rows = set(rows)
+		for child in self._children:
+			if not child._isAnyChanged_fast(includeNewUnchanged):
+				continue
+			for childRows, crs in child._getLinkedCursors(cursor):
+				if child._hasChanges([crs], includeNewUnchanged):
+					rows.update(childRows)
+		return sorted(rows)
 
 
 	def _listChangedRows(self, includeNewUnchanged=False):
@@ -952,20 +1037,32 @@ class dBizobj(dObject):
 		Iterate over the specified keys (defined in KeyField) and apply
 		the passed function to each.
 
-		If a passed key doesn't exist, it is ignored.
+		If a passed key doesn't exist, it is ignored. The matching records are
+		visited in row order.
 
 		Set self.exitScan to True to exit the scan on the next iteration.
 		"""
 		# Flag that the function can set to prematurely exit the scan
 		self.exitScan = False
-		keys = set(keys)
 		requeryChildren = kwargs.pop("scanRequeryChildren", self.ScanRequeryChildren)
 		currentStatus = self.__getCurrentStatus()
 		ret = None
+		cursor = self._CurrentCursor
+		# Resolve the keys to rows up front so that they can be visited in order.
+		keyRows = []
+		for key in set(keys):
+			row, rec = cursor._getRecordByPk(key, raiseRowNotFound=False)
+			if row is not None:
+				keyRows.append((row, key))
+		keyRows.sort()
 
 		try:
-			for key in keys:
-				if self.locate(key, self.KeyField):
+			for row, key in keyRows:
+				# The called function may have moved rows around (e.g. by cancelling
+				# a new record), so look the key up again before moving to it.
+				row, rec = cursor._getRecordByPk(key, raiseRowNotFound=False)
+				if row is not None:
+					self._moveToRowNum(row, updateChildren=requeryChildren)
 					ret = func(*args, **kwargs)
 				if self.exitScan:
 					break
@@ -996,8 +1093,9 @@ class dBizobj(dObject):
 
 		If you want to end the scan on the next iteration, set self.exitScan=True.
 
-		Records are scanned in arbitrary order. Any exception raised by calling
-		func() will be passed	up to the caller.
+		Records are scanned in row order, or in reverse row order if 'reverse'
+		is passed as True. Any exception raised by calling func() will be passed
+		up to the caller.
 		"""
 		if not self.RowCount:
 			return
@@ -1018,7 +1116,14 @@ class dBizobj(dObject):
 		try:
 			for key in cursors:
 				self._CurrentCursor = key
-				ret = self.scan(_callFunc, reverse=reverse, scanRequeryChildren=False)
+				if self._children:
+					# Changes may be buried in child records, so every row must be checked.
+					ret = self.scan(_callFunc, reverse=reverse, scanRequeryChildren=False)
+				else:
+					rows = sorted(self._CurrentCursor.getChangedRows(includeNewUnchanged))
+					if rows:
+						ret = self.scanRows(_callFunc, rows, reverse=reverse,
+								scanRequeryChildren=False)
 		except Exception, e:
 			if self._logScanException(e):
 				nm = self.Name
@@ -1209,6 +1314,8 @@ class dBizobj(dObject):
 		If convertQMarks is True (default is False), any ?'s in the sql will
 		get converted to whatever the marker is for the database backend.
 		"""
+		# A pending background requery would overwrite the newer records.
+		self.cancelRequery()
 		rp = self._RemoteProxy
 		if rp:
 			return rp.requery()
@@ -1265,6 +1372,138 @@ class dBizobj(dObject):
 			raise uiException
 
 
+	def nextPage(self):
+		"""
+		Requery the next PageSize records, after the last current one in the
+		order of the order-by clause and the KeyField. Returns False, keeping
+		the current records, if there are no more. See dCursorMixin.nextPage().
+		"""
+		return self.__requeryPage(True)
+
+
+	def previousPage(self):
+		"""
+		Requery the PageSize records before the first current one. Returns
+		False, keeping the current records, if there are none.
+		"""
+		return self.__requeryPage(False)
+
+
+	def __requeryPage(self, forward):
+		cursor = self._CurrentCursor
+		keyset = cursor._getKeyset(forward)
+		if keyset is None:
+			return False
+		cursor._pendingKeyset = keyset
+		try:
+			self.requery()
+		finally:
+			cursor._pendingKeyset = None
+		return cursor._pageFound
+
+
+	def requeryAsync(self, callback=None):
+		"""
+		Requery the data set in a background thread, so that the calling thread
+		isn't blocked while the query runs and its rows are fetched. The query
+		runs on a thread of the shared dRequeryExecutor, on a connection from
+		the Pool of the bizobj's connection, and its
+		records are swapped into the cursor at once when they are all fetched,
+		on the UI thread if a UI is loaded. Then the children are requeried and
+		afterRequery() is called, as with requery().
+
+		If passed, callback is called once the records have been swapped in,
+		with the exception that made the requery fail, or None. Calling
+		requeryAsync() again before that supersedes the pending requery, whose
+		results are dropped, as does calling cancelRequery(). When no UI is
+		loaded, call waitForRequery() to swap in the results.
+		"""
+		self.cancelRequery()
+		errMsg = self.beforeRequery()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		if self.KeyField is None:
+			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
+			raise dException.MissingPKException(errMsg)
+		_childParamTuple = self.setChildLinkFilter()
+		params = _childParamTuple + self.getParams()
+		if self._RemoteProxy or (self.Parent and self.LinkField and _childParamTuple
+				and max(_childParamTuple) is None):
+			# Nothing to run in the background.
+			self.requery()
+			if callback:
+				callback(None)
+			return
+		cursor = self._CurrentCursor
+		req = self._asyncRequery = _AsyncRequery(self, cursor, cursor.CurrentSQL,
+				params, callback)
+		getRequeryExecutor().submit(req.process)
+
+
+	def cancelRequery(self):
+		"""
+		Drop the requery started by requeryAsync(), if it hasn't been applied
+		yet. Its callback isn't called.
+		"""
+		req = self._asyncRequery
+		if req is not None:
+			req.cancelled = True
+			self._asyncRequery = None
+
+
+	def waitForRequery(self, timeout=None):
+		"""
+		Wait for the pending requeryAsync() to finish, up to timeout seconds,
+		and swap its records into the cursor. Returns True if it was applied,
+		or False if there is none or it timed out. Errors of the requery are
+		raised, unless it was passed a callback, which gets them instead.
+		"""
+		req = self._asyncRequery
+		if req is None or not req.done.wait(timeout):
+			return False
+		err = self._applyAsyncRequery(req)
+		if err is not None:
+			if req.callback is None:
+				raise err
+			return False
+		return True
+
+
+	def _applyAsyncRequery(self, req):
+		"""
+		Swap the records fetched by the background requery into the cursor,
+		unless the request was superseded. Returns the exception that made the
+		requery fail, or None.
+		"""
+		if req is not self._asyncRequery:
+			return None
+		self._asyncRequery = None
+		err = req.error
+		if err is None:
+			try:
+				currPK = self.getPK()
+			except dException.NoRecordsException:
+				currPK = None
+			oldDataStructure = hash(self.DataStructure)
+			req.cursor.requeryFrom(req.source, req.sql, req.params)
+			self._visitedKeys.clear()
+			if self.RestorePositionOnRequery:
+				self._positionUsingPK(currPK, updateChildren=False)
+			if hash(self.DataStructure) != oldDataStructure:
+				self._clearCursorRecord()
+			try:
+				self.requeryAllChildren()
+			except dException.NoRecordsException:
+				pass
+			except dException.dException, e:
+				err = e
+			self.afterRequery()
+			self._addVisitedKey()
+		if req.callback:
+			req.callback(err)
+		return err
+
+
 	def _clearCursorRecord(self):
 		## The Record object must be reinstantiated to reflect the new structure:
 		try:
@@ -1575,6 +1814,10 @@ class dBizobj(dObject):
 			| True	- do both, update child cursor's parent and requery child cursor.
 		"""
 		if updateChildren is not None:
+			# Other connections can't see the changes of a pending transaction.
+			parallel = updateChildren and self._parallelChildRequery \
+					and not self._isTransactionPending()
+			pending = []
 			for child in self._children:
 				# Let the child update to the current record:
 				child.setCurrentParent()
@@ -1588,15 +1831,33 @@ class dBizobj(dObject):
 				# and self.RowNumber = 0.
 				if updateChildren and child.RequeryWithParent and child.cacheExpired() \
 						and not child.isAnyChanged():
+					if parallel:
+						# Queue all the queries before waiting for any of them; the
+						# shared dRequeryExecutor runs up to MaxWorkers at once.
+						child.requeryAsync()
+						pending.append(child)
+						continue
 					child.requery()
 				child.afterSetCurrentParent()
+			try:
+				for child in pending:
+					child.waitForRequery()
+					child.afterSetCurrentParent()
+			except StandardError:
+				for child in pending:
+					child.cancelRequery()
+				raise
 
 
 	def moveToPK(self, pk):
 		"""Move to the row with the specified pk value, or raise RowNotFoundException."""
-		row = self.seek(pk, self.KeyField, caseSensitive=True, near=False,
-				runRequery=True)
-		if row == -1:
+		cursor = self._CurrentCursor
+		row, rec = cursor._getRecordByPk(pk, raiseRowNotFound=False)
+		if row is not None:
+			cursor.RowNumber = row
+			self.requeryAllChildren()
+			self._afterPointerMove()
+		else:
 			# Need to use ustr(pk) because pk might be a tuple.
 			upk = ustr(pk)
 			nm = self.Name
@@ -1683,6 +1944,53 @@ class dBizobj(dObject):
 		return False
 
 
+	def _onCursorChangeStateChanged(self, cursor):
+		"""
+		Called by a cursor of this bizobj when it gets its first change or new
+		record, or loses its last one.
+		"""
+		if cursor not in self.__cursors.values():
+			# Not one of the data cursors, such as a many-to-many cursor.
+			return
+		for cursorSet, changes in ((self._changedCursors, cursor._mementos),
+				(self._newCursors, cursor._newRecords)):
+			if changes:
+				cursorSet.add(cursor)
+			else:
+				cursorSet.discard(cursor)
+		self._updateChangedState()
+
+
+	def _updateChangedState(self):
+		"""
+		Recompute whether anything is changed in this bizobj or its children,
+		and pass any difference on to the parent's count of changed children.
+		"""
+		changed = bool(self._changedCursors)
+		new = bool(self._newCursors)
+		counts = self._changedChildCounts
+		state = {False: changed or counts[False] > 0,
+				True: changed or new or counts[True] > 0,
+				None: changed or (new and self.SaveNewUnchanged) or counts[None] > 0}
+		oldState = self._subtreeChanged
+		self._subtreeChanged = state
+		parent = self.Parent
+		if parent is not None and self in parent._children:
+			diffs = [mode for mode in state if state[mode] != oldState[mode]]
+			for mode in diffs:
+				parent._changedChildCounts[mode] += (1 if state[mode] else -1)
+			if diffs:
+				parent._updateChangedState()
+
+
+	def _adjustChangedChildCounts(self, child, step):
+		"""Add the changed state of the passed child to the counts, or remove it."""
+		for mode, changed in child._subtreeChanged.items():
+			if changed:
+				self._changedChildCounts[mode] += step
+		self._updateChangedState()
+
+
 	def _isAnyChanged_fast(self, includeNewUnchanged=None):
 		"""
 		INTERNAL USE ONLY: This checks all the cursors including the ones
@@ -1690,19 +1998,12 @@ class dBizobj(dObject):
 		like:
 				if self._isAnyChanged_fast() or self._isAnyChanged_precise()...
 
-		Which will at least be much faster (and still correct) in the case of
-		_isAnyChanged_fast() returning False, and not much slower otherwise.
+		The answer is kept up to date by the cursors and child bizobjs as they
+		get or lose changes, so this doesn't depend on the amount of data.
 		"""
-		withNewUnchanged = includeNewUnchanged
-		if withNewUnchanged is None:
-			withNewUnchanged = self.SaveNewUnchanged
-		for cursor in self.__cursors.values():
-			if cursor.isChanged(allRows=True, includeNewUnchanged=withNewUnchanged):
-				return True
-		for child in self._children:
-			if child._isAnyChanged_fast(includeNewUnchanged=includeNewUnchanged):
-				return True
-		return False
+		if includeNewUnchanged is not None:
+			includeNewUnchanged = bool(includeNewUnchanged)
+		return self._subtreeChanged[includeNewUnchanged]
 
 
 	def _isAnyChanged_precise(self, includeNewUnchanged=None, withChildren=True):
@@ -1710,11 +2011,70 @@ class dBizobj(dObject):
 		Return True if at least one record in the current record set
 		has been changed.
 		"""
-		def _isThisChanged():
-			self.exitScan = self._isChanged(True, includeNewUnchanged, withChildren)
-			return self.exitScan
+		cursor = self._CurrentCursor
+		if cursor is None or cursor.RowCount == 0:
+			return False
+		if not withChildren:
+			return cursor.isChanged(allRows=True,
+					includeNewUnchanged=self._withNewUnchanged(includeNewUnchanged))
+		return self._hasChanges([cursor], includeNewUnchanged)
+
 
-		return self.scan(_isThisChanged, scanRequeryChildren=False) or False
+	def _withNewUnchanged(self, includeNewUnchanged):
+		if includeNewUnchanged is None:
+			return self.SaveNewUnchanged
+		return includeNewUnchanged
+
+
+	def _hasChanges(self, cursors, includeNewUnchanged):
+		"""
+		Return True if any of the passed cursors of this bizobj, or any of the
+		cursors of the child bizobjs holding the children of their records, has
+		changes. Only the children that have changes somewhere are looked at.
+		"""
+		withNewUnchanged = self._withNewUnchanged(includeNewUnchanged)
+		for cursor in cursors:
+			if cursor.isChanged(allRows=True, includeNewUnchanged=withNewUnchanged):
+				return True
+		for child in self._children:
+			if not child._isAnyChanged_fast(includeNewUnchanged):
+				continue
+			childCursors = []
+			for cursor in cursors:
+				childCursors += [crs for rows, crs in child._getLinkedCursors(cursor)]
+			if child._hasChanges(childCursors, includeNewUnchanged):
+				return True
+		return False
+
+
+	def _getLinkedCursors(self, parentCursor):
+		"""
+		Return a list of (rows, cursor) tuples, one for each of the cursors of
+		this bizobj that holds the children of records of the passed cursor of
+		the parent bizobj, with the list of the rows of those records.
+		"""
+		cursors = self.__cursors
+		if not self.LinkField:
+			# The same child records go with every parent record.
+			rows = range(parentCursor.RowCount)
+			return [(rows, crs) for crs in cursors.values()]
+		fld = self.ParentLinkField
+		if not fld:
+			ret = []
+			for key, crs in cursors.items():
+				row, rec = parentCursor._getRecordByPk(key, raiseRowNotFound=False)
+				if row is not None:
+					ret.append(([row], crs))
+			return ret
+		flds = fld.replace(" ", "").split(",")
+		rowsByKey = {}
+		for row in xrange(parentCursor.RowCount):
+			key = tuple([parentCursor.getFieldVal(linkFld, row) for linkFld in flds])
+			if len(key) == 1:
+				key = key[0]
+			rowsByKey.setdefault(key, []).append(row)
+		return [(rowsByKey[key], crs) for key, crs in cursors.items()
+				if key in rowsByKey]
 
 
 	def isAnyChanged(self, includeNewUnchanged=None, withChildren=True):
@@ -1862,6 +2222,7 @@ class dBizobj(dObject):
 		if child not in self._children:
 			self._children.append(child)
 			child.Parent = self
+			self._adjustChangedChildCounts(child, 1)
 		return child
 
 
@@ -1875,6 +2236,7 @@ class dBizobj(dObject):
 		children = self._children
 		child = children.pop(children.index(child))
 		child.Parent = None
+		self._adjustChangedChildCounts(child, -1)
 
 
 	def removeAllChildren(self):
@@ -1884,6 +2246,7 @@ class dBizobj(dObject):
 		while self._children:
 			child = self._children.pop()
 			child.Parent = None
+			self._adjustChangedChildCounts(child, -1)
 
 
 	def addMMBizobj(self, mmBizobj, assocTable, assocPKColThis, assocPKColOther,
@@ -2144,6 +2507,59 @@ class dBizobj(dObject):
 		return None
 
 
+	def getColumnArrays(self, flds=(), rowStart=0, rows=None):
+		"""
+		Returns a dict of NumPy arrays holding the values of the passed fields.
+		See dCursorMixin.getColumnArrays().
+		"""
+		cc = self._CurrentCursor
+		if cc is not None:
+			return cc.getColumnArrays(flds, rowStart, rows,
+					_rowChangeCallback=self._changeRowNumCallback)
+		return None
+
+
+	def getDataSetView(self, flds=(), rowStart=0, rows=None, returnInternals=False):
+		"""
+		Like getDataSet(), but returns a read-only view of the records instead
+		of copies of them. See dCursorMixin.getDataSetView().
+		"""
+		cc = self._CurrentCursor
+		if cc is not None:
+			return cc.getDataSetView(flds, rowStart, rows,
+					returnInternals=returnInternals,
+					_rowChangeCallback=self._changeRowNumCallback)
+		return None
+
+
+	def getVirtualFieldValues(self, fld, rowStart=0, rows=None):
+		"""
+		Return a list of the values of the passed virtual field for the rows
+		starting at rowStart, or for all of them if rows is None, computed with
+		a single call when the field has a 'batch_func'. See VirtualFields.
+		"""
+		oldRow = self.RowNumber
+		ret = self._CurrentCursor.getVirtualFieldValues(fld, rowStart, rows,
+				_rowChangeCallback=self._changeRowNumCallback)
+		if oldRow != self.RowNumber:
+			self._moveToRowNum(oldRow, updateChildren=False)
+		return ret
+
+
+	def iterRecords(self, fields=None, chunkSize=1000, asDict=True):
+		"""
+		Generator that yields the records of the bizobj's query straight from
+		the backend, chunkSize rows at a time, for a single forward pass over
+		a large result. The query is run with the same parameters as requery(),
+		but the records aren't loaded into the bizobj: its data set, record
+		pointer and child bizobjs are left alone. See dCursorMixin.iterRecords().
+		"""
+		params = self.setChildLinkFilter() + self.getParams()
+		cursor = self._CurrentCursor
+		return cursor.iterRecords(fields, chunkSize, asDict,
+				sql=cursor.CurrentSQL, params=params)
+
+
 	def appendDataSet(self, ds, updateInternals=False):
 		"""
 		Appends the rows in the passed dataset to this bizobj's dataset. No checking
@@ -2154,6 +2570,44 @@ class dBizobj(dObject):
 		self._CurrentCursor.appendDataSet(ds, updateInternals=updateInternals)
 
 
+	def loadRecords(self, records, fields=None):
+		"""
+		Add all the passed records as new records in one operation, which is
+		much faster than calling new() and setting the fields of each one, and
+		return the list of their (temporary) PK values.
+
+		The records can be dicts, or sequences of values ordered like the passed
+		list of field names, such as the rows read from a CSV file. The new
+		records get the DefaultValues and the link to the parent record, and are
+		inserted by the next save(). The beforeNew(), onNew() and afterNew()
+		hooks are not called for them.
+		"""
+		cursor = self._CurrentCursor
+		defaults = self.DefaultValues
+		cursor._nullDefaults = (defaults is None)
+		if defaults is None:
+			kf = self.KeyField
+			if not isinstance(kf, tuple):
+				kf = (kf,)
+			defaults = dict([(fld, None) for fld in cursor._getBlankRecord()
+					if fld not in kf])
+		else:
+			defaults = dict(defaults)
+		if self.Parent and self.FillLinkFromParent and self.LinkField:
+			val = self.getParentLinkValue()
+			if not isinstance(val, (list, tuple)):
+				val = (val,)
+			links = self.LinkField.replace(" ", "").split(",")
+			defaults.update(zip(links, val))
+		pks = cursor.loadRecords(records, fields, markNew=True, defaults=defaults)
+		if pks:
+			if self.AutoPopulatePK and self.__currentCursorKey is None:
+				self._updateCursorKey(pks[0])
+			self.requeryAllChildren()
+			self._afterPointerMove()
+		return pks
+
+
 	def cloneRecord(self):
 		"""
 		Creates a copy of the current record and adds it to the dataset. The KeyField
@@ -2181,6 +2635,15 @@ class dBizobj(dObject):
 		return self._CurrentCursor.getDataTypes()
 
 
+	def getMemoryUsage(self):
+		"""
+		Returns a dict with the number of rows in the current cursor ('rows'),
+		and the approximate number of bytes used to hold them, in total ('bytes')
+		and per row ('bytesPerRow').
+		"""
+		return self._CurrentCursor.getMemoryUsage()
+
+
 	def _storeData(self, data, typs, stru):
 		"""Accepts a data set and type defintion dict, and updates the cursor
 		with these values.
@@ -2706,6 +3169,10 @@ afterDelete() which is only called after a delete().""")
 		crs.KeyField = self._keyField
 		crs.AutoPopulatePK = self._autoPopulatePK
 		crs.AutoQuoteNames = self._autoQuoteNames
+		crs.ColumnarStorage = self._columnarStorage
+		crs.FetchWindowSize = self._fetchWindowSize
+		crs.ResultCacheInterval = self._resultCacheInterval
+		crs.PageSize = self._pageSize
 		if self._dataStructure is not None:
 			crs.DataStructure = self._dataStructure
 		if not self._RemoteProxy:
@@ -2790,6 +3257,14 @@ afterDelete() which is only called after a delete().""")
 		self._childCacheInterval = val
 
 
+	def _getColumnarStorage(self):
+		return self._columnarStorage
+
+	def _setColumnarStorage(self, val):
+		self._columnarStorage = bool(val)
+		self._syncWithCursors()
+
+
 	def _getCurrentSQL(self):
 		return self._CurrentCursor.CurrentSQL
 
@@ -2902,6 +3377,14 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getFetchWindowSize(self):
+		return self._fetchWindowSize
+
+	def _setFetchWindowSize(self, val):
+		self._fetchWindowSize = max(0, int(val or 0))
+		self._syncWithCursors()
+
+
 	def _getFillLinkFromParent(self):
 		try:
 			return self._fillLinkFromParent
@@ -2916,6 +3399,10 @@ afterDelete() which is only called after a delete().""")
 		return self._CurrentCursor.IsAdding
 
 
+	def _isRequerying(self):
+		return self._asyncRequery is not None
+
+
 	def _getKeyField(self):
 		try:
 			return self._keyField
@@ -2975,6 +3462,21 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getPageSize(self):
+		return self._pageSize
+
+	def _setPageSize(self, val):
+		self._pageSize = val or 0
+		self._syncWithCursors()
+
+
+	def _getParallelChildRequery(self):
+		return self._parallelChildRequery
+
+	def _setParallelChildRequery(self, val):
+		self._parallelChildRequery = bool(val)
+
+
 	def _getParent(self):
 		try:
 			return self._parent
@@ -3069,6 +3571,14 @@ afterDelete() which is only called after a delete().""")
 		self._requeryWithParent = bool(val)
 
 
+	def _getResultCacheInterval(self):
+		return self._resultCacheInterval
+
+	def _setResultCacheInterval(self, val):
+		self._resultCacheInterval = val
+		self._syncWithCursors()
+
+
 	def _getRowCount(self):
 		try:
 			ret = self._CurrentCursor.RowCount
@@ -3104,6 +3614,7 @@ afterDelete() which is only called after a delete().""")
 
 	def _setSaveNewUnchanged(self, val):
 		self._saveNewUnchanged = val
+		self._updateChangedState()
 
 
 	def _getScanRestorePosition(self):
@@ -3174,6 +3685,11 @@ afterDelete() which is only called after a delete().""")
 			requery from parent.requeryAllChildren() will be ignored.  (int)
 			"""))
 
+	ColumnarStorage = property(_getColumnarStorage, _setColumnarStorage, None,
+			_("""When True, the cursors store their records by column instead of as
+			one dict per record, which uses much less memory for large data sets.
+			Default=False  (bool)"""))
+
 	Connection = property(_getConnection, None, None,
 			_("The dConnection object used to connect with the backend database."))
 
@@ -3236,6 +3752,12 @@ afterDelete() which is only called after a delete().""")
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Name of encoding to use for unicode	(str)"))
 
+	FetchWindowSize = property(_getFetchWindowSize, _setFetchWindowSize, None,
+			_("""The number of rows to fetch at a time from the results of a requery.
+			When set, only the first rows are fetched by requery(), and the rest are
+			fetched as they are needed, which makes the first rows of a large query
+			available right away. Default=0, which fetches all the rows at once  (int)"""))
+
 	FillLinkFromParent = property(_getFillLinkFromParent, _setFillLinkFromParent, None,
 			_("""In the onNew() method, do we fill in the foreign key field specified by the
 			LinkField property with the value returned by calling the bizobj's	getParentPK()
@@ -3245,6 +3767,10 @@ afterDelete() which is only called after a delete().""")
 	IsAdding = property(_isAdding, None, None,
 			_("Returns True if the current record is new and unsaved."))
 
+	IsRequerying = property(_isRequerying, None, None,
+			_("""Returns True while a requery started by requeryAsync() hasn't been
+			applied yet.  (bool)"""))
+
 	KeyField = property(_getKeyField, _setKeyField, None,
 			_("""Name of field that is the PK. If multiple fields make up the key,
 			separate the fields with commas. (str)
@@ -3265,6 +3791,23 @@ afterDelete() which is only called after a delete().""")
 	NonUpdateFields = property(_getNonUpdateFields, _setNonUpdateFields, None,
 			_("Fields in the cursor to be ignored during updates"))
 
+	PageSize = property(_getPageSize, _setPageSize, None,
+			_("""When set, requery() only gets the first PageSize records, ordered by
+			the order-by clause and the KeyField, and nextPage() and previousPage()
+			get the records next to them. Only works with the SQL built from the
+			clauses, not with UserSQL. Default=0, which doesn't page the records  (int)"""))
+
+	ParallelChildRequery = property(_getParallelChildRequery, _setParallelChildRequery, None,
+			_("""When True, the children that are requeried along with this bizobj run
+			their queries at the same time, on the worker threads of the shared
+			dRequeryExecutor (up to its MaxWorkers at once) and on pooled connections,
+			so that moving to another record takes as long as the slowest child
+			query rather than the sum of them. The records are applied to the
+			children in the calling thread. The database must accept several
+			connections, so this can't be used with in-memory SQLite databases.
+			The children are requeried one at a time while a transaction is
+			pending. Default=False  (bool)"""))
+
 	Parent = property(_getParent, _setParent, None,
 			_("Reference to the parent bizobj to this one. (dBizobj)"))
 
@@ -3315,6 +3858,14 @@ afterDelete() which is only called after a delete().""")
 	RestorePositionOnRequery = property(_getRestorePositionOnRequery, _setRestorePositionOnRequery, None,
 			_("After a requery, do we try to restore the record position to the same PK?"))
 
+	ResultCacheInterval = property(_getResultCacheInterval, _setResultCacheInterval, None,
+			_("""The number of seconds that the results of a requery may be reused by
+			the cursors of any bizobj on the same connection that run the same SQL
+			with the same parameters, such as lookup tables used by several forms.
+			The cached results are dropped when rows of one of the tables they were
+			read from are saved or deleted through the connection. Default=None,
+			which always runs the query  (int)"""))
+
 	RowCount = property(_getRowCount, None, None,
 			_("""The number of records in the cursor's data set. It will be -1 if the
 			cursor hasn't run any successful queries yet. (int)
@@ -3351,7 +3902,11 @@ afterDelete() which is only called after a delete().""")
 			_("""A dictionary mapping virtual_field_name to function to call.
 
 			The specified function will be called when getFieldVal() is called on
-			the specified virtual field name.
+			the specified virtual field name. Instead of a function, you can assign
+			a dict with 'func', 'args', 'kwargs', 'requery_children', 'depends_on'
+			and 'batch_func' keys; see dCursorMixin.VirtualFields for their meaning.
+			Declaring the fields a virtual field 'depends_on' lets its values be
+			memoized until one of those fields changes.
 			"""))
 
 
@@ -3442,6 +3997,69 @@ class _bizIterator(object):
 
 
 
+class _AsyncRequery(object):
+	"""A requery started by dBizobj.requeryAsync()."""
+	def __init__(self, bizobj, cursor, sql, params, callback):
+		self.bizobj = bizobj
+		self.cursor = cursor
+		self.sql = sql
+		self.params = params
+		self.callback = callback
+		self.cancelled = False
+		# The cursor holding the fetched records, or the exception raised.
+		self.source = None
+		self.error = None
+		self.done = threading.Event()
+
+
+	def process(self):
+		"""
+		Run the query on a connection checked out from the pool of the
+		bizobj's connection. Called in a thread of the dRequeryExecutor.
+		"""
+		if self.cancelled:
+			return
+		connection = self.bizobj._connection
+		try:
+			conn = connection.checkout()
+		except Exception, e:
+			self.error = e
+			self.finish()
+			return
+		try:
+			self.run(conn)
+		finally:
+			connection.checkin(conn)
+
+
+	def run(self, conn):
+		"""Run the query on the passed dConnection."""
+		biz = self.bizobj
+		try:
+			crs = conn.getCursor(biz._getCursorClass(biz.dCursorMixinClass,
+					biz.dbapiCursorClass))
+			crs.BackendObject = conn.getBackendObject()
+			biz._syncCursorProps(crs)
+			# All the rows are needed before the records are swapped in.
+			crs.FetchWindowSize = 0
+			crs.ResultCacheInterval = None
+			crs.execute(self.sql, self.params)
+			self.source = crs
+		except Exception, e:
+			self.error = e
+		self.finish()
+
+
+	def finish(self):
+		"""Have the results swapped in by the UI thread, or by waitForRequery()."""
+		self.done.set()
+		biz = self.bizobj
+		import dabo.ui
+		if dabo.ui.getUIType() is not None:
+			dabo.ui.callAfter(biz._applyAsyncRequery, self)
+
+
+
 def _getBaseXML():
 	"""Template for exporting data to XML"""
 	return """<?xml version="1.0" encoding="%(encoding)s"?>
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import atexit
+import collections
+import threading
+import time
+import traceback
+import dabo
+from dabo.dLocalize import _
+
+
+
+class dRequeryExecutor(object):
+	"""
+	Runs the background queries of all the bizobjs of the process, such as
+	those of dBizobj.requeryAsync() and of ParallelChildRequery, on a bounded
+	set of worker threads shared by all of them.
+
+	Tasks are callables, run in the order they were submitted by at most
+	MaxWorkers threads at once. Threads are started when tasks are waiting
+	and none is idle, and end after being idle for IdleTimeout seconds, so no
+	thread is left running when there is nothing to do. An error raised by a
+	task is logged, and doesn't affect the other tasks.
+	"""
+	def __init__(self, maxWorkers=4, idleTimeout=30):
+		self._lock = threading.Condition(threading.Lock())
+		self._tasks = collections.deque()
+		self._workers = set()
+		# The number of workers waiting for a task.
+		self._idle = 0
+		self._maxWorkers = maxWorkers
+		self._idleTimeout = idleTimeout
+
+
+	def submit(self, task):
+		"""Run the passed callable in a worker thread."""
+		with self._lock:
+			self._tasks.append(task)
+			if self._idle >= len(self._tasks):
+				self._lock.notify()
+			elif len(self._workers) < self._maxWorkers:
+				thd = threading.Thread(target=self._run, name="dRequeryExecutor")
+				thd.daemon = True
+				self._workers.add(thd)
+				thd.start()
+
+
+	def stop(self):
+		"""
+		Drop the tasks that haven't started, and end the worker threads once
+		their current task is done. Tasks submitted afterwards start new ones.
+		"""
+		with self._lock:
+			self._tasks.clear()
+			workers, self._workers = self._workers, set()
+			self._lock.notifyAll()
+		current = threading.current_thread()
+		for thd in workers:
+			if thd is not current:
+				thd.join()
+
+
+	def _run(self):
+		thd = threading.current_thread()
+		while True:
+			with self._lock:
+				deadline = time.time() + self._idleTimeout
+				while True:
+					if len(self._workers) > self._maxWorkers:
+						# MaxWorkers was lowered.
+						self._workers.discard(thd)
+						return
+					if self._tasks:
+						break
+					remaining = deadline - time.time()
+					if thd not in self._workers or remaining <= 0:
+						self._workers.discard(thd)
+						return
+					self._idle += 1
+					self._lock.wait(remaining)
+					self._idle -= 1
+				if thd not in self._workers:
+					return
+				task = self._tasks.popleft()
+			try:
+				task()
+			except Exception:
+				dabo.log.error(_("Background task failed: %s") % traceback.format_exc())
+
+
+	def _getIdleTimeout(self):
+		return self._idleTimeout
+
+	def _setIdleTimeout(self, val):
+		with self._lock:
+			self._idleTimeout = val
+			self._lock.notifyAll()
+
+
+	def _getMaxWorkers(self):
+		return self._maxWorkers
+
+	def _setMaxWorkers(self, val):
+		with self._lock:
+			self._maxWorkers = max(1, val)
+			self._lock.notifyAll()
+
+
+	def _getSize(self):
+		return len(self._workers)
+
+
+	IdleTimeout = property(_getIdleTimeout, _setIdleTimeout, None,
+			_("""The number of seconds after which a worker thread without tasks
+			ends. Default=30  (int)"""))
+
+	MaxWorkers = property(_getMaxWorkers, _setMaxWorkers, None,
+			_("""The maximum number of tasks that run at once, each in its own
+			thread. Default=4  (int)"""))
+
+	Size = property(_getSize, None, None,
+			_("The number of running worker threads. Read-only.  (int)"))
+
+
+
+_executor = None
+_executorLock = threading.Lock()
+
+def getRequeryExecutor():
+	"""Return the dRequeryExecutor shared by all the bizobjs of the process."""
+	global _executor
+	with _executorLock:
+		if _executor is None:
+			_executor = dRequeryExecutor()
+			# Idle workers must not outlive the interpreter's modules.
+			atexit.register(_executor.stop)
+		return _executor
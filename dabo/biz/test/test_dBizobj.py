@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
 import unittest
 import dabo
 import dabo.db
@@ -103,6 +107,39 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		biz.Record.combined_name = "shouldn't be able to set this"
 		self.assertEqual(biz.Record.combined_name, "PaulKeithMcNett:23")
 
+	def testVirtualFieldsMemoized(self):
+		biz = self.biz
+		calls = []
+		def getDouble():
+			calls.append(biz.RowNumber)
+			return biz.Record.iField * 2
+		def getDoubles(recs):
+			calls.append(len(recs))
+			return [rec["iField"] * 2 for rec in recs]
+		biz.VirtualFields["double"] = {"func": getDouble, "depends_on": ("iField",)}
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		self.assertEqual(calls, [1])
+		# Changing another field keeps the value; changing a dependency drops it.
+		biz.setFieldVal("cField", "changed", row=1)
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		biz.setFieldVal("iField", 5, row=1)
+		self.assertEqual(biz.getFieldVal("double", 1), 10)
+		self.assertEqual(calls, [1, 1])
+		biz.cancel()
+		biz.requery()
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		self.assertEqual(calls, [1, 1, 1])
+		# A batch function computes the missing values of a column in one call.
+		calls[:] = []
+		biz.VirtualFields = {"double": {"func": getDouble, "batch_func": getDoubles,
+				"depends_on": ("iField",)}}
+		self.assertEqual(biz.getFieldVal("double", 0), 46)
+		self.assertEqual([rec["double"] for rec in biz.getDataSet(flds=("double",))],
+				[46, 84, 20446])
+		self.assertEqual(biz.getVirtualFieldValues("double", rowStart=1), [84, 20446])
+		self.assertEqual(calls, [0, 2])
+
 	def test_Encoding(self):
 		biz = self.biz
 		self.assertEqual(biz.Encoding, dabo.getEncoding())
@@ -220,6 +257,302 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		self.assertEqual(biz.Record.cField, newVal)
 		self.assertRaises(dabo.dException.FieldNotFoundException, biz.oldVal, "bogusField")
 
+	def test_scanKeys(self):
+		biz = self.biz
+		visited = []
+		def visit():
+			visited.append(biz.Record.pk)
+		biz.scanKeys(visit, [3, 99, 1, 2])
+		self.assertEqual(visited, [1, 2, 3])
+		self.assertEqual(biz.RowNumber, 0)
+
+	def test_saveAllVisitedKeys(self):
+		biz = self.biz
+		for row in (2, 0):
+			biz.RowNumber = row
+			biz.Record.cField = "changed %s" % row
+		biz.new()
+		biz.Record.cField = "new"
+		biz.saveAll()
+		self.assertEqual(biz.isAnyChanged(), False)
+		biz.requery()
+		self.assertEqual(biz.RowCount, 4)
+		self.assertEqual([biz.getFieldVal("cField", row) for row in xrange(4)],
+				["changed 0", "Edward Leafe", "changed 2", "new"])
+
+	def test_FetchWindowSize(self):
+		biz = self.biz
+		biz.FetchWindowSize = 1
+		biz.requery()
+		cur = biz._CurrentCursor
+		self.assertEqual(cur.FetchWindowSize, 1)
+		self.assertEqual(biz.RowCount, 3)
+		self.assertEqual(biz.Record.cField, "Paul Keith McNett")
+		self.assertTrue(cur._pendingFetch)
+		biz.last()
+		self.assertEqual(biz.Record.cField, "Carl Karsten")
+		self.assertEqual(biz.RowNumber, 2)
+		biz.Record.cField = "changed"
+		biz.save()
+		biz.requery()
+		self.assertEqual(biz.getFieldVal("cField", 2), "changed")
+
+	def test_ResultCacheInterval(self):
+		biz = self.biz
+		biz.ResultCacheInterval = 60
+		self.assertEqual(biz._CurrentCursor.ResultCacheInterval, 60)
+		biz.requery()
+		other = dabo.biz.dBizobj(self.con)
+		other.KeyField = "pk"
+		other.DataSource = self.temp_table_name
+		other.ResultCacheInterval = 60
+		resultCache = self.con.getBackendObject().ResultCache
+		self.assertEqual(len(resultCache), 1)
+		other.requery()
+		self.assertEqual(other.RowCount, 3)
+		# Saving through one bizobj drops the result shared by both.
+		other.Record.cField = "changed"
+		other.save()
+		self.assertEqual(len(resultCache), 0)
+		biz.requery()
+		self.assertEqual(biz.Record.cField, "changed")
+
+	def test_iterRecords(self):
+		biz = self.biz
+		biz.RowNumber = 1
+		self.assertEqual([rec["cField"] for rec in biz.iterRecords(chunkSize=1)],
+				["Paul Keith McNett", "Edward Leafe", "Carl Karsten"])
+		self.assertEqual(biz.RowNumber, 1)
+		self.assertEqual(biz.isAnyChanged(), False)
+
+	def test_loadRecords(self):
+		biz = self.biz
+		biz.DefaultValues["nField"] = 1
+		pks = biz.loadRecords([("Alice", "7"), ("Bob", 8)], fields=("cField", "iField"))
+		self.assertEqual(len(pks), 2)
+		self.assertEqual(biz.RowCount, 5)
+		self.assertEqual(biz.RowNumber, 4)
+		self.assertEqual(biz.Record.cField, "Bob")
+		self.assertEqual(sorted(biz.getChangedRows()), [3, 4])
+		biz.RowNumber = 3
+		self.assertEqual(biz.Record.iField, 7)
+		self.assertRaises(dabo.dException.FieldNotFoundException,
+				biz.loadRecords, [{"bogus": 1}])
+		self.assertRaises(dabo.dException.dException,
+				biz.loadRecords, [("Carol",)], fields=("cField", "iField"))
+		self.assertEqual(biz.RowCount, 5)
+		# Dict records may have different keys.
+		biz.loadRecords([{"cField": "Carol"}, {"iField": 9}])
+		self.assertEqual(biz.RowCount, 7)
+		self.assertEqual(biz.Record.iField, 9)
+		self.assertEqual(biz.Record.nField, 1)
+		biz.RowNumber = 5
+		self.assertEqual(biz.Record.cField, "Carol")
+		biz.RowNumber = 6
+		biz.delete()
+		biz.RowNumber = 5
+		biz.delete()
+		self.assertEqual(biz.RowCount, 5)
+		biz.saveAll()
+		biz.requery()
+		self.assertEqual(biz.RowCount, 5)
+		biz.RowNumber = 4
+		self.assertEqual((biz.Record.cField, biz.Record.iField, biz.Record.nField),
+				("Bob", 8, 1))
+
+		# Child records are linked to the current parent record.
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		biz.addChild(bizChild)
+		biz.requery()
+		biz.RowNumber = 1
+		self.assertEqual(bizChild.RowCount, 0)
+		bizChild.loadRecords([{"cInvNum": "IN1"}, {"cInvNum": "IN2"}])
+		self.assertEqual(bizChild.RowCount, 2)
+		biz.saveAll()
+		bizChild.requery()
+		self.assertEqual([(rec["parent_fk"], rec["cInvNum"]) for rec in bizChild.getDataSet()],
+				[(2, "IN1"), (2, "IN2")])
+
+	def test_bulkLoad(self):
+		biz = self.biz
+		rows = iter([("Alice", 1), ("Bob", 2)])
+		self.assertEqual(biz.bulkLoad(rows, ("cField", "iField")), 2)
+		self.assertEqual(biz.RowCount, 3)
+		self.assertEqual(biz.isAnyChanged(), False)
+		biz.requery()
+		self.assertEqual(biz.RowCount, 5)
+		self.assertRaises(dabo.dException.DBQueryException, biz.bulkLoad,
+				[("Carol", 3)], ("bogus", "iField"))
+
+	def test_PageSize(self):
+		biz = self.biz
+		biz.setOrderByClause("iField desc")
+		biz.PageSize = 2
+		biz.requery()
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [10223, 42])
+		self.assertEqual(biz.nextPage(), True)
+		self.assertEqual(biz.RowCount, 1)
+		self.assertEqual(biz.Record.iField, 23)
+		self.assertEqual(biz.nextPage(), False)
+		self.assertEqual(biz.previousPage(), True)
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [10223, 42])
+		biz.PageSize = 0
+		biz.requery()
+		self.assertEqual(biz.RowCount, 3)
+
+	def test_requeryAsync(self):
+		# The background connection can't reach an in-memory database.
+		fd, path = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		try:
+			con = dabo.db.dConnection(DbType="SQLite", Database=path)
+			biz = dabo.biz.dBizobj(con)
+			biz._CurrentCursor.executescript("""
+create table people (pk INTEGER PRIMARY KEY AUTOINCREMENT, name CHAR);
+insert into people (name) values ("Alice");
+insert into people (name) values ("Bob");
+""")
+			biz.KeyField = "pk"
+			biz.DataSource = "people"
+			biz.requery()
+			biz._CurrentCursor.AuxCursor.execute(
+					"insert into people (name) values ('Carol')")
+			results = []
+			biz.requeryAsync(results.append)
+			self.assertEqual(biz.IsRequerying, True)
+			self.assertEqual(biz.waitForRequery(5), True)
+			self.assertEqual(results, [None])
+			self.assertEqual(biz.IsRequerying, False)
+			self.assertEqual(biz.RowCount, 3)
+			self.assertEqual(biz.isAnyChanged(), False)
+			# A second requery supersedes the pending one.
+			superseded = []
+			biz.setWhereClause("name = 'Alice'")
+			biz.requeryAsync(superseded.append)
+			biz.setWhereClause("name <> 'Alice'")
+			biz.requeryAsync(results.append)
+			self.assertEqual(biz.waitForRequery(5), True)
+			self.assertEqual(superseded, [])
+			self.assertEqual([rec["name"] for rec in biz.getDataSet()], ["Bob", "Carol"])
+			biz.setWhereClause("")
+			biz.requeryAsync()
+			biz.cancelRequery()
+			self.assertEqual(biz.waitForRequery(5), False)
+			self.assertEqual(biz.RowCount, 2)
+			# A plain requery drops the pending one too.
+			biz.requeryAsync(superseded.append)
+			biz.setWhereClause("name = 'Alice'")
+			biz.requery()
+			self.assertEqual(biz.IsRequerying, False)
+			self.assertEqual(biz.waitForRequery(5), False)
+			self.assertEqual(superseded, [])
+			self.assertEqual(biz.RowCount, 1)
+			biz.setWhereClause("")
+			biz.requery()
+			biz.setWhereClause("name <> 'Alice'")
+			biz.requery()
+			biz.setWhereClause("bogus = 1")
+			biz.requeryAsync()
+			self.assertRaises(dabo.dException.DBQueryException, biz.waitForRequery, 5)
+			self.assertEqual(biz.RowCount, 2)
+		finally:
+			os.remove(path)
+
+	def test_RequeryExecutor(self):
+		executor = dabo.biz.dRequeryExecutor(maxWorkers=2, idleTimeout=0.2)
+		lock = threading.Lock()
+		running = [0, 0]
+		done = []
+		def task(num):
+			with lock:
+				running[0] += 1
+				running[1] = max(running[1], running[0])
+			time.sleep(0.02)
+			with lock:
+				running[0] -= 1
+			if num == 3:
+				raise ValueError("bad task")
+			done.append(num)
+		for num in range(8):
+			executor.submit(lambda num=num: task(num))
+		deadline = time.time() + 5
+		while len(done) < 7 and time.time() < deadline:
+			time.sleep(0.01)
+		# A failing task doesn't stop the others, and at most two ran at once.
+		self.assertEqual(sorted(done), [0, 1, 2, 4, 5, 6, 7])
+		self.assertEqual(running[1], 2)
+		# Idle workers end.
+		while executor.Size and time.time() < deadline:
+			time.sleep(0.01)
+		self.assertEqual(executor.Size, 0)
+		executor.submit(lambda: done.append(8))
+		executor.stop()
+		self.assertEqual(executor.Size, 0)
+
+	def test_ParallelChildRequery(self):
+		fd, path = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		try:
+			con = dabo.db.dConnection(DbType="SQLite", Database=path)
+			bizMain = dabo.biz.dBizobj(con)
+			bizMain._CurrentCursor.executescript("""
+create table orders (pk INTEGER PRIMARY KEY AUTOINCREMENT, cust CHAR);
+insert into orders (cust) values ("Alice");
+insert into orders (cust) values ("Bob");
+create table lines (pk INTEGER PRIMARY KEY AUTOINCREMENT, order_fk INT, item CHAR);
+insert into lines (order_fk, item) values (1, "pen");
+insert into lines (order_fk, item) values (1, "ink");
+insert into lines (order_fk, item) values (2, "pad");
+create table notes (pk INTEGER PRIMARY KEY AUTOINCREMENT, order_fk INT, note CHAR);
+insert into notes (order_fk, note) values (2, "rush");
+""")
+			bizMain.KeyField = "pk"
+			bizMain.DataSource = "orders"
+			children = []
+			for table in ("lines", "notes"):
+				bizChild = dabo.biz.dBizobj(con)
+				bizChild.KeyField = "pk"
+				bizChild.DataSource = table
+				bizChild.LinkField = "order_fk"
+				bizMain.addChild(bizChild)
+				children.append(bizChild)
+			bizLines, bizNotes = children
+			self.assertEqual(bizMain.ParallelChildRequery, False)
+			bizMain.ParallelChildRequery = True
+			bizMain.requery()
+			self.assertEqual([rec["item"] for rec in bizLines.getDataSet()], ["pen", "ink"])
+			self.assertEqual(bizNotes.RowCount, 0)
+			bizMain.next()
+			self.assertEqual([rec["item"] for rec in bizLines.getDataSet()], ["pad"])
+			self.assertEqual(bizNotes.Record.note, "rush")
+			self.assertEqual(bizLines.IsRequerying or bizNotes.IsRequerying, False)
+			# The children share the bounded executor; a single worker runs
+			# their queries one after the other.
+			executor = dabo.biz.getRequeryExecutor()
+			maxWorkers = executor.MaxWorkers
+			executor.MaxWorkers = 1
+			try:
+				bizMain.prior()
+				self.assertEqual([rec["item"] for rec in bizLines.getDataSet()], ["pen", "ink"])
+				self.assertEqual(bizNotes.RowCount, 0)
+			finally:
+				executor.MaxWorkers = maxWorkers
+		finally:
+			os.remove(path)
+
+	def test_deleteAll(self):
+		biz = self.biz
+		biz.new()
+		biz.deleteAll()
+		self.assertEqual(biz.RowCount, 0)
+		self.assertEqual(biz.isAnyChanged(), False)
+		biz.requery()
+		self.assertEqual(biz.RowCount, 0)
+
 	## - End method unit tests -
 
 	def testDeleteNewSave(self):
@@ -640,6 +973,42 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		self.assertEqual(bizMain.RowNumber, 0)
 		self.assertEqual(bizChild.RowNumber, 0)
 
+	def testChangeTracking(self):
+		"""Changes in child records are tracked up to the parent as they are made."""
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+
+		self.assertEqual(bizMain._isAnyChanged_fast(), False)
+		self.assertEqual(bizMain.isAnyChanged(), False)
+		bizMain.RowNumber = 2
+		bizChild.Record.cInvNum = "IN99999"
+		bizMain.RowNumber = 0
+		self.assertEqual(bizMain._isAnyChanged_fast(), True)
+		self.assertEqual(bizMain.isAnyChanged(), True)
+		self.assertEqual(bizMain.isChanged(), False)
+		self.assertEqual(bizMain.getChangedRows(), [2])
+		bizMain.Record.cField = "changed"
+		self.assertEqual(bizMain.getChangedRows(), [0, 2])
+		self.assertEqual(bizMain.RowNumber, 0)
+
+		bizMain.cancelAll()
+		self.assertEqual(bizMain._isAnyChanged_fast(), False)
+		self.assertEqual(bizMain.isAnyChanged(), False)
+		self.assertEqual(bizMain.getChangedRows(), [])
+
+		# New unchanged child records only count when asked for.
+		bizChild.new()
+		self.assertEqual(bizMain.isAnyChanged(), False)
+		self.assertEqual(bizMain.isAnyChanged(includeNewUnchanged=True), True)
+		bizMain.removeChild(bizChild)
+		self.assertEqual(bizMain._isAnyChanged_fast(includeNewUnchanged=True), False)
+
 	def testChangesToTwoChildRecords(self, mode="save"):
 		"""After the dabo web server stuff and the @remote calls got added, only
 		a single record from child bizobjs seem to get saved.
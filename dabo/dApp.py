@@ -412,6 +412,8 @@ try again when it is running.
 		self._persistMRU()
 		self.uiApp.finish()
 		self.closeConnections()
+		dabo.db.getKeepAliveScheduler().stop()
+		dabo.biz.getRequeryExecutor().stop()
 		self._tempFileHolder.release()
 		dabo.log.info(_("Application finished."))
 		self._finished = True
@@ -1134,6 +1136,14 @@ try again when it is running.
 		return (self._transactionTokens.get(cn) is biz)
 
 
+	def isTransactionPending(self, biz):
+		"""
+		Returns True/False, depending on whether any bizobj holds the
+		transaction token for the connection of the specified bizobj.
+		"""
+		return self._transactionTokens.get(biz._connection) is not None
+
+
 	def releaseTransactionToken(self, biz):
 		"""
 		When a process that would normally close a transaction happens, the
@@ -31,10 +31,16 @@ some rows from a backend database in a script. Here's an example of that::
 import datetime
 from decimal import Decimal
 from dConnection import dConnection
+from dConnectionPool import dConnectionPool
 from dCursorMixin import dCursorMixin
 from dConnectInfo import dConnectInfo
 from dTable import dTable
-from dDataSet import dDataSet
+from dDataSet import dDataSet, dMutableDataSet
+from dColumnarDataSet import dColumnarDataSet
+from dDataSetView import dDataSetView
+from dMetadataCache import dMetadataCache
+from dResultCache import dResultCache
+from dKeepAliveScheduler import dKeepAliveScheduler, getKeepAliveScheduler
 import dabo
 from dabo.dException import FieldNotFoundException
 
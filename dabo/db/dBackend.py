@@ -3,14 +3,17 @@ import sys
 import time
 import re
 import datetime
-import threading
 import decimal
+from itertools import islice
 import dabo
 from dabo.dLocalize import _
 import dabo.dException as dException
 from dabo.dObject import dObject
 from dabo.db import dTable
 from dNoEscQuoteStr import dNoEscQuoteStr
+from dMetadataCache import dMetadataCache
+from dResultCache import dResultCache
+from dKeepAliveScheduler import getKeepAliveScheduler
 from dabo.lib.utils import ustr
 from dCursorMixin import dCursorMixin
 
@@ -24,6 +27,13 @@ class dBackend(dObject):
 	nameEnclosureChar = '"'
 	# The character used in sql to represent parameters to be substituted
 	paramPlaceholder = "%s"
+	# Extra arguments to getConnection() for the connections of a pool, which
+	# may be used by a different thread after each checkout.
+	poolConnectionArgs = {}
+	# Compiled patterns that split the keywords passed to encloseNames().
+	_keywordPatterns = {}
+	# The maximum number of expressions whose enclosed form is remembered.
+	_enclosedNamesSize = 500
 
 	def __init__(self):
 		self._baseClass = dBackend
@@ -33,6 +43,12 @@ class dBackend(dObject):
 		# Reference to the cursor that is using this object
 		self._cursor = None
 		self.lastExecuteTime = time.time() # For keep alive interval
+		# Table metadata shared by all the cursors of this connection
+		self._metadataCache = dMetadataCache()
+		# Results of the selects of the cursors that cache them
+		self._resultCache = dResultCache()
+		# (exp, keywords) -> the result of encloseNames()
+		self._enclosedNames = {}
 
 
 	def isValidModule(self):
@@ -222,6 +238,7 @@ class dBackend(dObject):
 	def commitTransaction(self, cursor):
 		"""Commit a SQL transaction."""
 		self._connection.commit()
+		self._resultCache.commit()
 		dabo.dbActivityLog.info("SQL: commit")
 		return True
 
@@ -229,6 +246,7 @@ class dBackend(dObject):
 	def rollbackTransaction(self, cursor):
 		"""Roll back (revert) a SQL transaction."""
 		self._connection.rollback()
+		self._resultCache.rollback()
 		dabo.dbActivityLog.info("SQL: rollback")
 		return True
 
@@ -270,12 +288,22 @@ class dBackend(dObject):
 		within the field name, pass them as a tuple to the keywords parameter.
 		"""
 		if autoQuote:
+			if keywords is not None:
+				keywords = tuple(keywords)
+			key = (exp, keywords)
+			try:
+				return self._enclosedNames[key]
+			except KeyError:
+				pass
 			if keywords is None:
 				parts = [exp]
 				subs = lowkeys = tuple()
 			else:
 				# First separate any keywords: e.g., 'foo as bar'.
-				pat = re.compile(r"(\b%s\b)" % r"\b|\b".join(keywords), re.I)
+				pat = self._keywordPatterns.get(keywords)
+				if pat is None:
+					pat = self._keywordPatterns[keywords] = re.compile(
+							r"(\b%s\b)" % r"\b|\b".join(keywords), re.I)
 				parts = pat.split(exp)
 				subs = tuple(pat.findall(exp))
 				lowkeys = [k.lower() for k in keywords]
@@ -283,9 +311,12 @@ class dBackend(dObject):
 			def encPart(part):
 				qtd = [delim + pt.strip() + delim for pt in part.split(".") if pt]
 				return ".".join(qtd)
-			exp = " %s ".join([encPart(pt) for pt in parts
-					if pt.lower() not in lowkeys])
-			return exp % subs
+			ret = " %s ".join([encPart(pt) for pt in parts
+					if pt.lower() not in lowkeys]) % subs
+			if len(self._enclosedNames) >= self._enclosedNamesSize:
+				self._enclosedNames.clear()
+			self._enclosedNames[key] = ret
+			return ret
 		return exp
 
 
@@ -365,6 +396,14 @@ class dBackend(dObject):
 		return "limit"
 
 
+	def getLimitPosition(self):
+		"""
+		Return where the limit clause goes in the SQL: 'bottom' (the default)
+		or 'top'. Override for backends that put it before the field clause.
+		"""
+		return "bottom"
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""
@@ -496,12 +535,9 @@ class dBackend(dObject):
 			auxCrs.execute(auxCrs.getSQL())
 			auxCrs._whereClause = holdWhere
 		descFlds = auxCrs.FieldDescription
-		# Get the raw version of the table
-		sql = "select * from %s where 1=0 " % self.encloseNames(cursor.Table,
-				autoQuote=autoQuote)
-		auxCrs.execute(sql)
 		# This is the clean version of the table.
-		stdFlds = auxCrs.FieldDescription
+		stdFlds = self.MetadataCache.getOrCreate("tableDescription", cursor.Table,
+				lambda: self._getTableDescription(cursor.Table, auxCrs, autoQuote))
 
 		# Get all the fields that are not in the table.
 		ret0 = [d[0] for d in descFlds
@@ -518,6 +554,14 @@ class dBackend(dObject):
 		return ret0
 
 
+	def _getTableDescription(self, tableName, cursor, autoQuote=True):
+		"""Return the description of a query of all the fields of the table."""
+		sql = "select * from %s where 1=0 " % self.encloseNames(tableName,
+				autoQuote=autoQuote)
+		cursor.execute(sql)
+		return cursor.FieldDescription
+
+
 	def getStructureDescription(self, cursor):
 		"""Return the basic field structure."""
 		field_structure = {}
@@ -527,9 +571,12 @@ class dBackend(dObject):
 		if not field_description:
 			# No query run yet: execute the structure-only sql:
 			structure_only_sql = cursor.getStructureOnlySql()
-			aux = cursor.AuxCursor
-			aux.execute(structure_only_sql)
-			field_description = aux.FieldDescription
+			def getDescription():
+				aux = cursor.AuxCursor
+				aux.execute(structure_only_sql)
+				return aux.FieldDescription
+			field_description = self.MetadataCache.getOrCreate("structure",
+					cursor.Table, getDescription, extra=structure_only_sql)
 		for field_info in field_description:
 			field_name = ustr(field_info[0])
 			field_type = self.getDaboFieldType(field_info[1])
@@ -562,6 +609,31 @@ class dBackend(dObject):
 		return tuple(ret)
 
 
+	def bulkLoad(self, table, rows, columns, cursor, chunkSize=1000):
+		"""
+		Insert the rows, which are sequences of values ordered like the passed
+		column names, into the table, and return the number of rows inserted.
+
+		The rows are read from the iterable as they are inserted, chunkSize at
+		a time with executemany(), so they never have to be all in memory.
+		Backends with a faster native way of loading data override this.
+		"""
+		aq = cursor.AutoQuoteNames
+		flds = ", ".join([self.encloseNames(col, aq) for col in columns])
+		placeHolders = ", ".join([self.paramPlaceholder] * len(columns))
+		sql = "insert into %s (%s) values (%s)" % (self.encloseNames(table, aq),
+				flds, placeHolders)
+		rows = iter(rows)
+		ret = 0
+		while True:
+			chunk = [tuple(row) for row in islice(rows, chunkSize)]
+			if not chunk:
+				break
+			cursor.executemany(sql, chunk)
+			ret += len(chunk)
+		return ret
+
+
 	##########		Created by Echo 	##############
 	def isExistingTable(self, table):
 		"""Returns whether or not the table exists."""
@@ -577,6 +649,31 @@ class dBackend(dObject):
 		return False
 
 
+	def shareCaches(self, other):
+		"""
+		Use the metadata and result caches of the other backend object, which
+		is connected to the same database, instead of separate ones.
+		"""
+		self._metadataCache = other.MetadataCache
+		self._resultCache = other.ResultCache
+
+
+	def ping(self, cursor):
+		"""
+		Run a trivial query with the passed DB-API cursor, which raises an
+		error if the connection was lost.
+		"""
+		cursor.execute("select 1")
+
+
+	def clearMetadataCache(self, tableName=None):
+		"""
+		Drop the cached metadata of the passed table, or of all the tables if
+		None. Call this after changing the structure of a table outside of Dabo.
+		"""
+		self.MetadataCache.clear(tableName)
+
+
 	def createJustTable(self, tabledef, cursor):
 		self.createTableAndIndex(tabledef, cursor, createIndexes=False)
 
@@ -616,43 +713,35 @@ class dBackend(dObject):
 		return clause
 	###########################################
 
-	def _applyKeepAlive(self):
-		"""Start a thread to keep the connection alive."""
-
-		class WorkerThread(threading.Thread):
-			def __init__(self, backendObj):
-				threading.Thread.__init__(self)
-				self._toStop = False
-				self.backendObj = backendObj
-
-			def run(self):
-				kal = self.backendObj.KeepAliveInterval
-				app = self.backendObj.Application
-
-				while self.backendObj._connection is None:
-				    time.sleep(5)
-
-				con = self.backendObj._connection
-				cur = con.cursor()
-
-				while True:
-					time.sleep(5)
-
-					if kal is None or not app or getattr(app, "_finished", False):
-						self._toStop = True
-					if self._toStop:
-						return
+	def keepAlive(self):
+		"""
+		Called by the keep-alive scheduler. Pings the connection if it has been
+		idle for KeepAliveInterval seconds, and returns the number of seconds
+		until it needs to be checked again.
+		"""
+		kal = self.KeepAliveInterval
+		if kal is None:
+			return None
+		idle = time.time() - self.lastExecuteTime
+		if idle < kal:
+			return kal - idle
+		if self._connection is not None:
+			cur = self._connection.cursor()
+			try:
+				self.ping(cur)
+			finally:
+				cur.close()
+			self.lastExecuteTime = time.time()
+		return kal
 
-					if time.time() - self.backendObj.lastExecuteTime > kal:
-						cur.execute("select 1")
-						self.backendObj.lastExecuteTime = time.time()
 
-		existingThread = getattr(self, "_keepAliveThread", None)
-		if existingThread:
-			existingThread._toStop = True
-		if self.KeepAliveInterval is not None:
-			wt = self._keepAliveThread = WorkerThread(self)
-			wt.start()
+	def _applyKeepAlive(self):
+		"""Have the connection pinged by the keep-alive scheduler when it is idle."""
+		scheduler = getKeepAliveScheduler()
+		if self.KeepAliveInterval is None:
+			scheduler.unregister(self)
+		else:
+			scheduler.register(self, self.KeepAliveInterval)
 
 	def _getEncoding(self):
 		"""Get backend encoding."""
@@ -670,6 +759,14 @@ class dBackend(dObject):
 		self._encoding = enc
 
 
+	def _getMetadataCache(self):
+		return self._metadataCache
+
+
+	def _getResultCache(self):
+		return self._resultCache
+
+
 	def _getKeepAliveInterval(self):
 		try:
 			ret = self._keepAliveInterval
@@ -691,3 +788,11 @@ class dBackend(dObject):
 			Defaults to None, meaning we never send a KeepAlive query. The interval
 			is expressed in seconds.
 			"""))
+
+	MetadataCache = property(_getMetadataCache, None, None,
+			_("""Cache of the table metadata looked up by the cursors of this
+			connection, such as their field lists.  (dMetadataCache)"""))
+
+	ResultCache = property(_getResultCache, None, None,
+			_("""Cache of the query results of the cursors of this connection that
+			have a ResultCacheInterval.  (dResultCache)"""))
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+import sys
+from array import array
+from itertools import islice
+
+from dabo.db.dDataSet import dDataSetMixin
+
+
+# Marks a cell for a field that the record doesn't have.
+_MISSING = object()
+# The exact value type stored by each kind of array column.
+_ARRAY_TYPES = {"l": int, "d": float}
+
+
+
+class _ColumnStore(object):
+	"""
+	Holds the values of a dColumnarDataSet, one sequence per field. Rows are
+	identified by a row id that never changes, so that record views stay valid
+	when rows are removed from or reordered in a data set sharing the store.
+
+	Rows removed from the data sets aren't freed from the store, as other data
+	sets and records may still refer to them; the store, and the rows, go away
+	with the last data set using it, e.g. when the cursor is requeried.
+	"""
+	def __init__(self):
+		self.columns = {}
+		self.fieldNames = []
+		self.size = 0
+		# For each list column, the types of its values up to the number of
+		# rows in _checkedRows, or None once it is known that it can't be
+		# stored as an array, so that compact() only looks at new values.
+		self._valueTypes = {}
+		self._checkedRows = {}
+
+
+	def _addColumn(self, fld):
+		self.columns[fld] = [_MISSING] * self.size
+		self.fieldNames.append(fld)
+		if self.size:
+			# Rows without the field can't be in an array.
+			self._valueTypes[fld] = None
+
+
+	def _listColumn(self, fld):
+		"""Return the column as a list, converting it from an array if needed."""
+		col = self.columns[fld]
+		if isinstance(col, array):
+			self._valueTypes[fld] = set([_ARRAY_TYPES[col.typecode]])
+			self._checkedRows[fld] = len(col)
+			col = self.columns[fld] = list(col)
+		return col
+
+
+	def _typeChanged(self, fld, rowId, val):
+		"""Track the type of a value stored in a list column."""
+		typs = self._valueTypes.get(fld)
+		if typs is not None and rowId < self._checkedRows.get(fld, 0):
+			typs.add(type(val))
+
+
+	def addRow(self, rec):
+		"""Store the values of the passed mapping as a new row; return its id."""
+		columns = self.columns
+		for fld in rec:
+			if fld not in columns:
+				self._addColumn(fld)
+		for fld in self.fieldNames:
+			col = columns[fld]
+			val = rec.get(fld, _MISSING)
+			if isinstance(col, array):
+				if type(val) is _ARRAY_TYPES[col.typecode]:
+					col.append(val)
+					continue
+				col = self._listColumn(fld)
+			col.append(val)
+		rowId = self.size
+		self.size += 1
+		return rowId
+
+
+	def addRows(self, fieldNames, rows):
+		"""
+		Store a sequence of value tuples, ordered like fieldNames, without
+		going through a dict for each row. Returns the list of new row ids.
+		"""
+		for fld in fieldNames:
+			if fld not in self.columns:
+				self._addColumn(fld)
+		start = self.size
+		numRows = 0
+		positions = dict((fld, pos) for pos, fld in enumerate(fieldNames))
+		for fld in self.fieldNames:
+			col = self.columns[fld]
+			pos = positions.get(fld)
+			if pos is None:
+				vals = [_MISSING] * len(rows)
+			else:
+				vals = [row[pos] for row in rows]
+			if isinstance(col, array):
+				typ = _ARRAY_TYPES[col.typecode]
+				if not [val for val in vals if type(val) is not typ]:
+					# The new values fit in the array.
+					col.extend(vals)
+					numRows = len(col) - start
+					continue
+				col = self._listColumn(fld)
+			col.extend(vals)
+			numRows = len(col) - start
+		self.size += numRows
+		return range(start, self.size)
+
+
+	def compact(self):
+		"""
+		Store the columns holding only plain ints or floats as arrays. Only
+		the values added or changed since the last call are checked.
+		"""
+		for fld, col in self.columns.items():
+			if isinstance(col, array) or not col:
+				continue
+			typs = self._valueTypes.get(fld, set())
+			if typs is None:
+				continue
+			checked = self._checkedRows.get(fld, 0)
+			typs.update([type(val) for val in islice(col, checked, None)])
+			if typs == set([int]):
+				self.columns[fld] = array("l", col)
+			elif typs == set([float]):
+				self.columns[fld] = array("d", col)
+			elif len(typs) > 1 or not typs.issubset(_ARRAY_TYPES.values()):
+				# It will never be an array.
+				self._valueTypes[fld] = None
+				continue
+			else:
+				self._valueTypes[fld] = typs
+				self._checkedRows[fld] = len(col)
+				continue
+			self._valueTypes.pop(fld, None)
+			self._checkedRows.pop(fld, None)
+
+
+	def getValue(self, rowId, fld):
+		try:
+			val = self.columns[fld][rowId]
+		except KeyError:
+			raise KeyError(fld)
+		if val is _MISSING:
+			raise KeyError(fld)
+		return val
+
+
+	def setValue(self, rowId, fld, val):
+		try:
+			col = self.columns[fld]
+		except KeyError:
+			self._addColumn(fld)
+			col = self.columns[fld]
+		if isinstance(col, array):
+			if type(val) is _ARRAY_TYPES[col.typecode]:
+				col[rowId] = val
+				return
+			col = self._listColumn(fld)
+		col[rowId] = val
+		self._typeChanged(fld, rowId, val)
+
+
+	def mapColumn(self, rowIds, fld, func):
+		"""Replace the values of the field in the passed rows with func(value)."""
+		col = self.columns[fld]
+		typ = None
+		if isinstance(col, array):
+			typ = _ARRAY_TYPES[col.typecode]
+		_typeChanged = self._typeChanged
+		for rowId in rowIds:
+			val = col[rowId]
+			if val is _MISSING:
+				continue
+			val = func(val)
+			if typ is not None:
+				if type(val) is typ:
+					col[rowId] = val
+					continue
+				col = self._listColumn(fld)
+				typ = None
+			col[rowId] = val
+			_typeChanged(fld, rowId, val)
+
+
+	def getSizeOf(self, rowIds):
+		"""Approximate number of bytes used by the passed rows."""
+		ret = sys.getsizeof(self) + sys.getsizeof(self.columns)
+		seen = set()
+		for fld, col in self.columns.items():
+			ret += sys.getsizeof(col)
+			if isinstance(col, array):
+				continue
+			for rowId in rowIds:
+				val = col[rowId]
+				if id(val) not in seen:
+					seen.add(id(val))
+					ret += sys.getsizeof(val)
+		return ret
+
+
+
+class dColumnarRecord(object):
+	"""
+	A lightweight view of one row of a dColumnarDataSet. It behaves like the
+	record dicts of a regular dDataSet, but holds no values itself.
+	"""
+	__slots__ = ("_store", "_rowId")
+
+	def __init__(self, store, rowId):
+		self._store = store
+		self._rowId = rowId
+
+
+	def __getitem__(self, fld):
+		return self._store.getValue(self._rowId, fld)
+
+
+	def __setitem__(self, fld, val):
+		self._store.setValue(self._rowId, fld, val)
+
+
+	def __delitem__(self, fld):
+		# Make sure that it exists.
+		self[fld]
+		self._store.setValue(self._rowId, fld, _MISSING)
+
+
+	def __contains__(self, fld):
+		col = self._store.columns.get(fld)
+		return col is not None and col[self._rowId] is not _MISSING
+	has_key = __contains__
+
+
+	def __iter__(self):
+		rowId = self._rowId
+		columns = self._store.columns
+		for fld in self._store.fieldNames:
+			if columns[fld][rowId] is not _MISSING:
+				yield fld
+	iterkeys = __iter__
+
+
+	def __len__(self):
+		rowId = self._rowId
+		columns = self._store.columns
+		return len([fld for fld in self._store.fieldNames
+				if columns[fld][rowId] is not _MISSING])
+
+
+	def __eq__(self, other):
+		if isinstance(other, dColumnarRecord):
+			return (self._store is other._store) and (self._rowId == other._rowId)
+		return dict(self.iteritems()) == other
+
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+
+	def __repr__(self):
+		return repr(dict(self.iteritems()))
+
+
+	def get(self, fld, default=None):
+		try:
+			return self[fld]
+		except KeyError:
+			return default
+
+
+	def keys(self):
+		return [fld for fld in self]
+
+
+	def values(self):
+		return [self[fld] for fld in self]
+
+
+	def items(self):
+		return list(self.iteritems())
+
+
+	def itervalues(self):
+		for fld in self:
+			yield self[fld]
+
+
+	def iteritems(self):
+		for fld in self:
+			yield (fld, self[fld])
+
+
+	def copy(self):
+		return dict(self.iteritems())
+
+
+	def pop(self, fld, *default):
+		try:
+			val = self[fld]
+		except KeyError:
+			if default:
+				return default[0]
+			raise
+		del self[fld]
+		return val
+
+
+	def setdefault(self, fld, default=None):
+		try:
+			return self[fld]
+		except KeyError:
+			self[fld] = default
+			return default
+
+
+	def update(self, other=None, **kwargs):
+		if other is not None:
+			if hasattr(other, "keys"):
+				other = [(fld, other[fld]) for fld in other.keys()]
+			for fld, val in other:
+				self[fld] = val
+		for fld, val in kwargs.items():
+			self[fld] = val
+
+
+
+class dColumnarDataSet(dDataSetMixin):
+	"""
+	A mutable data set that stores its values by column instead of as one
+	dict per record, which takes a fraction of the memory for large data sets.
+	Columns holding only ints or floats are kept in compact arrays.
+
+	Indexing or iterating returns dColumnarRecord views, which support the
+	same mapping interface as the record dicts of a dDataSet. Data sets
+	created from views of an existing columnar data set, such as the result
+	of filter(), share its storage, so changes made through either one are
+	seen by both.
+	"""
+	def __init__(self, sequence=None):
+		self._initDataSet()
+		recs = list(sequence or ())
+		stores = set([rec._store for rec in recs if isinstance(rec, dColumnarRecord)])
+		if len(stores) == 1 and len(recs) == len([rec for rec in recs
+				if isinstance(rec, dColumnarRecord)]):
+			self._store = stores.pop()
+			self._rowIds = [rec._rowId for rec in recs]
+		else:
+			store = self._store = _ColumnStore()
+			self._rowIds = [store.addRow(rec) for rec in recs]
+			store.compact()
+
+
+	@classmethod
+	def fromRows(cls, fieldNames, rows):
+		"""
+		Create a data set from a sequence of value tuples, as returned by
+		DB-API fetchall(), ordered like the passed field names.
+		"""
+		ret = cls()
+		ret._rowIds = ret._store.addRows(fieldNames, rows)
+		ret._store.compact()
+		return ret
+
+
+	def __len__(self):
+		return len(self._rowIds)
+
+
+	def __nonzero__(self):
+		return bool(self._rowIds)
+
+
+	def __iter__(self):
+		store = self._store
+		for rowId in self._rowIds:
+			yield dColumnarRecord(store, rowId)
+
+
+	def __getitem__(self, idx):
+		if isinstance(idx, slice):
+			ret = self.__class__()
+			ret._store = self._store
+			ret._sharedChanges = self._sharedChanges
+			ret._rowIds = self._rowIds[idx]
+			return ret
+		return dColumnarRecord(self._store, self._rowIds[idx])
+
+
+	def __add__(self, other):
+		return self.__class__(list(self) + list(other))
+
+
+	def __repr__(self):
+		return repr([rec.copy() for rec in self])
+
+
+	def append(self, rec):
+		"""Add the record to the end of this data set and of its sources."""
+		if isinstance(rec, dColumnarRecord) and rec._store is self._store:
+			rowId = rec._rowId
+		else:
+			rowId = self._store.addRow(rec)
+			rec = dColumnarRecord(self._store, rowId)
+		positions = self._keptPositions()
+		self._rowIds.append(rowId)
+		self.markChanged([len(self) - 1])
+		self._addPositions(positions, [rowId])
+		src = self._sourceDataSet
+		if isinstance(src, dColumnarDataSet):
+			src.append(rec)
+
+
+	def extend(self, recs):
+		"""
+		Add the records to the end of this data set and of its sources. When
+		they all have the same fields, they are stored a column at a time.
+		"""
+		recs = list(recs)
+		if not recs:
+			return
+		store = self._store
+		if all([isinstance(rec, dColumnarRecord) and rec._store is store for rec in recs]):
+			rowIds = [rec._rowId for rec in recs]
+		else:
+			fieldNames = list(recs[0])
+			fieldSet = set(fieldNames)
+			if all([len(rec) == len(fieldNames) and fieldSet.issuperset(rec) for rec in recs]):
+				rowIds = store.addRows(fieldNames,
+						[[rec[fld] for fld in fieldNames] for rec in recs])
+			else:
+				rowIds = [store.addRow(rec) for rec in recs]
+		positions = self._keptPositions()
+		self._rowIds.extend(rowIds)
+		self.markChanged(xrange(len(self) - len(rowIds), len(self)))
+		self._addPositions(positions, rowIds)
+		src = self._sourceDataSet
+		if isinstance(src, dColumnarDataSet):
+			src.extend([dColumnarRecord(store, rowId) for rowId in rowIds])
+
+
+	def appendRows(self, fieldNames, rows):
+		"""
+		Add a sequence of value tuples, ordered like the passed field names,
+		to the end of this data set.
+		"""
+		positions = self._keptPositions()
+		rowIds = self._store.addRows(fieldNames, rows)
+		self._rowIds.extend(rowIds)
+		self.markChanged(xrange(len(self) - len(rowIds), len(self)))
+		self._addPositions(positions, rowIds)
+
+
+	def pop(self, index=-1):
+		"""Remove and return the record at the passed index."""
+		positions = self._keptPositions()
+		row = index % len(self) if self else index
+		rec = dColumnarRecord(self._store, self._rowIds.pop(index))
+		self.markChanged()
+		self._removePosition(positions, rec._rowId, row)
+		src = self._sourceDataSet
+		if isinstance(src, dColumnarDataSet):
+			src._discard(rec)
+		return rec
+
+
+	def _discard(self, rec):
+		"""Remove the passed record, if present."""
+		if rec._store is not self._store:
+			return
+		positions = self._getPositions()
+		if positions is not None:
+			idx = positions.get(rec._rowId)
+		else:
+			try:
+				idx = self._rowIds.index(rec._rowId)
+			except ValueError:
+				idx = None
+		if idx is not None:
+			self.pop(idx)
+
+
+	def _rowKeys(self):
+		return self._rowIds
+
+
+	def removeRows(self, rows):
+		"""
+		Remove the records at the passed indexes from this data set and from
+		its sources in a single pass. Returns the removed records.
+		"""
+		rows = set(rows)
+		store = self._store
+		removed = [dColumnarRecord(store, rowId)
+				for idx, rowId in enumerate(self._rowIds) if idx in rows]
+		self._rowIds = [rowId for idx, rowId in enumerate(self._rowIds)
+				if idx not in rows]
+		if removed:
+			self.markChanged()
+		src = self._sourceDataSet
+		if removed and isinstance(src, dColumnarDataSet):
+			src._discardRecords(removed)
+		return removed
+
+
+	def _discardRecords(self, recs):
+		"""Remove the passed records, if present."""
+		rowIds = set([rec._rowId for rec in recs if rec._store is self._store])
+		self.removeRows([idx for idx, rowId in enumerate(self._rowIds)
+				if rowId in rowIds])
+
+
+	def _index(self, rec):
+		"""Returns the index of the record, or None."""
+		if isinstance(rec, dColumnarRecord) and rec._store is self._store:
+			try:
+				return self._rowIds.index(rec._rowId)
+			except ValueError:
+				return None
+		return super(dColumnarDataSet, self)._index(rec)
+
+
+	def mapColumn(self, fld, func):
+		"""
+		Replace each value of the passed field in this data set with the result
+		of calling func with it. Records without the field are left alone.
+		"""
+		if fld in self._store.columns:
+			self._store.mapColumn(self._rowIds, fld, func)
+			self.markChanged()
+
+
+	def fillColumn(self, fld, val):
+		"""Set the passed field to the passed value in all the records."""
+		store = self._store
+		for rowId in self._rowIds:
+			store.setValue(rowId, fld, val)
+		self.markChanged()
+
+
+	def compact(self):
+		"""Store the columns holding only plain ints or floats as arrays."""
+		self._store.compact()
+
+
+	def getMemoryUsage(self):
+		ret = self._store.getSizeOf(self._rowIds) + sys.getsizeof(self._rowIds)
+		numRows = len(self)
+		return {"rows": numRows, "bytes": ret,
+				"bytesPerRow": float(ret) / numRows if numRows else 0.0}
@@ -51,6 +51,9 @@ class dConnectInfo(dObject):
 		self._backendObject = None
 		self._host = self._user = self._password = self._dbType = self._database = self._port = self._name = self._remoteHost = ""
 		self._keepAliveInterval = None
+		self._poolMinSize = 0
+		self._poolMaxSize = self._poolIdleTimeout = None
+		self._poolHealthCheck = False
 		super(dConnectInfo, self).__init__(**kwargs)
 		if connInfo:
 			self.setConnInfo(connInfo)
@@ -61,7 +64,8 @@ class dConnectInfo(dObject):
 		# a valid property name, raise TypeError.
 		self._customParameters = {}
 		props = ["Name", "DbType", "Host", "User", "Password", "Database",
-				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval"]
+				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval",
+				"PoolMinSize", "PoolMaxSize", "PoolIdleTimeout", "PoolHealthCheck"]
 		lprops = [p.lower() for p in props]
 		for k, v in connInfo.items():
 			try:
@@ -74,6 +78,18 @@ class dConnectInfo(dObject):
 				self._customParameters[k] = v
 
 
+	def copy(self):
+		"""Return a new dConnectInfo with the same settings, and its own backend object."""
+		connInfo = self.CustomParameters
+		for prop in ("Name", "DbType", "Host", "User", "Password", "Database", "Port",
+				"RemoteHost", "KeepAliveInterval", "PoolMinSize", "PoolMaxSize",
+				"PoolIdleTimeout", "PoolHealthCheck"):
+			val = getattr(self, prop)
+			if val:
+				connInfo[prop] = val
+		return dConnectInfo(connInfo=connInfo)
+
+
 	def getConnection(self, **kwargs):
 		kwargs.update(self.CustomParameters)
 		return self._backendObject.getConnection(self, **kwargs)
@@ -244,6 +260,45 @@ class dConnectInfo(dObject):
 			self._port = None
 
 
+	def _getPoolHealthCheck(self):
+		return self._poolHealthCheck
+
+	def _setPoolHealthCheck(self, val):
+		if isinstance(val, basestring):
+			# From a .cnxml file
+			val = val.strip().lower() in ("1", "true", "yes")
+		self._poolHealthCheck = bool(val)
+
+
+	def _getPoolIdleTimeout(self):
+		return self._poolIdleTimeout
+
+	def _setPoolIdleTimeout(self, val):
+		if not val:
+			val = None
+		else:
+			val = int(val)
+		self._poolIdleTimeout = val
+
+
+	def _getPoolMaxSize(self):
+		return self._poolMaxSize
+
+	def _setPoolMaxSize(self, val):
+		if not val:
+			val = None
+		else:
+			val = int(val)
+		self._poolMaxSize = val
+
+
+	def _getPoolMinSize(self):
+		return self._poolMinSize
+
+	def _setPoolMinSize(self, val):
+		self._poolMinSize = int(val or 0)
+
+
 	def _getRemoteHost(self):
 		return self._remoteHost
 
@@ -292,6 +347,22 @@ class dConnectInfo(dObject):
 			_("""Write-only property that encrypts the value and stores that
 				in the Password property. (str)"""))
 
+	PoolHealthCheck = property(_getPoolHealthCheck, _setPoolHealthCheck, None,
+			_("""Specifies whether idle connections of the pool are tested before
+			they are checked out. Default=False  (bool)"""))
+
+	PoolIdleTimeout = property(_getPoolIdleTimeout, _setPoolIdleTimeout, None,
+			_("""The number of seconds after which idle connections of the pool are
+			closed. Default=None, which keeps them open  (int)"""))
+
+	PoolMaxSize = property(_getPoolMaxSize, _setPoolMaxSize, None,
+			_("""The maximum number of connections of the pool that can be open at
+			once. Default=None, meaning no limit  (int)"""))
+
+	PoolMinSize = property(_getPoolMinSize, _setPoolMinSize, None,
+			_("""The number of connections of the pool that are opened in advance, and
+			kept open when idle. Default=0  (int)"""))
+
 	Port = property(_getPort, _setPort, None,
 			_("The port to connect on (may not be applicable for all databases). (int)"))
 
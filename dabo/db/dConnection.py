@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
+import threading
 from dabo.dLocalize import _
 from dabo.dObject import dObject
 from dConnectInfo import dConnectInfo
 from dCursorMixin import dCursorMixin
+from dConnectionPool import dConnectionPool
 
 
 class dConnection(dObject):
@@ -10,6 +12,8 @@ class dConnection(dObject):
 	def __init__(self, connectInfo=None, parent=None, forceCreate=False, **kwargs):
 		self._baseClass = dConnection
 		self._forceCreate = forceCreate
+		self._pool = None
+		self._poolLock = threading.Lock()
 		super(dConnection, self).__init__()
 		# Store a reference to the parent object (bizobj maybe; app
 		# object connection collection most likely)
@@ -37,9 +41,47 @@ class dConnection(dObject):
 
 
 	def close(self):
+		if self._pool is not None:
+			self._pool.close()
+		# Stop the keep-alive queries.
+		self.getBackendObject().KeepAliveInterval = None
 		self._connection.close()
 
 
+	def clone(self, **kwargs):
+		"""
+		Return a new dConnection to the same database, with its own backend
+		object and DB-API connection, for work that mustn't share this one,
+		such as queries run in another thread. Note that an in-memory SQLite
+		database can't be reached by another connection. Any keyword arguments
+		are passed to the backend's getConnection().
+
+		The new connection shares the metadata and result caches of this one.
+		"""
+		ret = dConnection(self._connectInfo.copy(), parent=self.Parent,
+				forceCreate=self._forceCreate, **kwargs)
+		ret.getBackendObject().shareCaches(self.getBackendObject())
+		return ret
+
+
+	def checkout(self, timeout=None):
+		"""
+		Return a connection to the same database from the Pool, for the use of
+		the current thread, which must give it back by passing it to checkin().
+		Further checkouts in the same thread return the same connection.
+
+		This is the only way to use the Pool: getCursor() and getDaboCursor()
+		always return cursors on this dConnection's own connection, so create
+		the cursors of the work done in other threads with the returned one.
+		"""
+		return self.Pool.checkout(timeout=timeout)
+
+
+	def checkin(self, conn):
+		"""Give back a connection returned by checkout()."""
+		self.Pool.checkin(conn)
+
+
 	def getDictCursorClass(self):
 		return self._connectInfo.getDictCursorClass()
 
@@ -81,8 +123,12 @@ class dConnection(dObject):
 
 	def _openConnection(self, **kwargs):
 		"""Open a connection to the database and store it for future use."""
-		self.getBackendObject().KeepAliveInterval = self._connectInfo.KeepAliveInterval
-		return self._connectInfo.getConnection(forceCreate=self._forceCreate, **kwargs)
+		ci = self._connectInfo
+		bo = self.getBackendObject()
+		bo.KeepAliveInterval = ci.KeepAliveInterval
+		bo.MetadataCache.Namespace = "%s://%s:%s/%s" % (ci.DbType, ci.Host, ci.Port,
+				ci.Database)
+		return ci.getConnection(forceCreate=self._forceCreate, **kwargs)
 
 
 	def getBackendObject(self):
@@ -105,6 +151,25 @@ class dConnection(dObject):
 		return self._connectInfo
 
 
+	def _getPool(self):
+		if self._pool is None:
+			# Worker threads may ask for it at the same time.
+			with self._poolLock:
+				if self._pool is None:
+					ci = self._connectInfo
+					self._pool = dConnectionPool(self, minSize=ci.PoolMinSize,
+							maxSize=ci.PoolMaxSize, idleTimeout=ci.PoolIdleTimeout,
+							healthCheck=ci.PoolHealthCheck)
+		return self._pool
+
+
+	def _getMetadataCacheFile(self):
+		return self.getBackendObject().MetadataCache.Filename
+
+	def _setMetadataCacheFile(self, val):
+		self.getBackendObject().MetadataCache.Filename = val
+
+
 	def _getName(self):
 		try:
 			return self.ConnectInfo.Name
@@ -115,9 +180,20 @@ class dConnection(dObject):
 	ConnectInfo = property(_getConnInfo, None, None,
 			_("The connectInfo for the connection.  (dConnectInfo)"))
 
+	MetadataCacheFile = property(_getMetadataCacheFile, _setMetadataCacheFile, None,
+			_("""Path of a file used to keep the table metadata looked up by the cursors
+			of this connection between runs, so that it doesn't have to be queried
+			again at startup. Default=None, meaning it is only cached in memory.  (str)"""))
+
 	Name = property(_getName, None, None,
 			_("The name of the connection.  (str)"))
 
+	Pool = property(_getPool, None, None,
+			_("""The pool of other connections to the same database, handed out by
+			checkout() for work done in other threads, such as background queries.
+			The cursors of this connection don't use it. It is set up from the Pool*
+			settings of the ConnectInfo.  (dConnectionPool)"""))
+
 
 
 if __name__ == "__main__":
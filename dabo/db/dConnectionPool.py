@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+import thread
+import threading
+import time
+import dabo
+import dabo.dException as dException
+from dabo.dLocalize import _
+from dKeepAliveScheduler import getKeepAliveScheduler
+
+
+
+class dConnectionPool(object):
+	"""
+	Thread-safe pool of connections to the database of a dConnection, for the
+	work done outside of the thread that uses that connection, such as
+	background and parallel queries. Each connection of the pool is a
+	dConnection of its own.
+
+	Only code that calls checkout() uses the pool: the cursors created by the
+	dConnection itself, including those of the bizobjs, keep sharing its own
+	connection. Code running in another thread checks out a connection,
+	creates its cursors with it, and checks it back in when they are done.
+
+	Connections are thread-affine: checkout() returns the connection that the
+	current thread already holds, if any, and it only goes back to the pool
+	once it has been checked in as many times as it was checked out. At most
+	MaxSize connections are open at once; when all of them are in use,
+	checkout() waits for one to be checked in. MinSize connections are opened
+	when the pool is created, and kept open when they are idle; the other
+	idle connections are closed after IdleTimeout seconds. If HealthCheck is True,
+	idle connections are tested before being handed out, and replaced if
+	they were lost. When the ConnectInfo has a KeepAliveInterval, the idle
+	connections are pinged by the keep-alive scheduler.
+	"""
+	def __init__(self, connection, minSize=0, maxSize=None, idleTimeout=None,
+			healthCheck=False):
+		self._connection = connection
+		self._lock = threading.Condition(threading.RLock())
+		# Connections not in use, as (time checked in, dConnection) tuples,
+		# the most recently used last.
+		self._idle = []
+		# Thread id -> [dConnection, number of checkouts]
+		self._inUse = {}
+		# The number of open connections, including the ones being opened.
+		self._size = 0
+		self._closed = False
+		self._minSize = minSize or 0
+		self._maxSize = maxSize or None
+		self._idleTimeout = idleTimeout or None
+		self._healthCheck = bool(healthCheck)
+		self._fill()
+		kal = connection.ConnectInfo.KeepAliveInterval
+		if kal:
+			getKeepAliveScheduler().register(self, kal)
+
+
+	def checkout(self, timeout=None):
+		"""
+		Return a connection for the use of the current thread. If all MaxSize
+		connections are in use, wait up to timeout seconds (forever if None)
+		for one to be checked in, and then raise ConnectionPoolTimeoutException.
+		"""
+		ident = thread.get_ident()
+		with self._lock:
+			held = self._inUse.get(ident)
+			if held is not None:
+				held[1] += 1
+				return held[0]
+		deadline = None
+		if timeout is not None:
+			deadline = time.time() + timeout
+		while True:
+			conn = self._reserve(deadline)
+			if conn is None:
+				# A slot was reserved for a new connection.
+				conn = self._open()
+			elif self._healthCheck and not self._isAlive(conn):
+				dabo.log.info(_("Replacing a lost connection of the pool."))
+				self._discard(conn)
+				continue
+			break
+		with self._lock:
+			self._inUse[ident] = [conn, 1]
+		return conn
+
+
+	def checkin(self, conn):
+		"""Give back a connection returned by checkout() in the current thread."""
+		ident = thread.get_ident()
+		with self._lock:
+			held = self._inUse.get(ident)
+			if held is None or held[0] is not conn:
+				raise dException.dException(
+						_("The connection was not checked out by this thread."))
+			held[1] -= 1
+			if held[1]:
+				return
+			del self._inUse[ident]
+			if self._closed:
+				self._discard(conn)
+				return
+			self._idle.append((time.time(), conn))
+			self.closeIdle()
+			self._lock.notify()
+
+
+	def _reserve(self, deadline):
+		"""
+		Take an idle connection, or reserve a slot for a new one and return
+		None, waiting until one of them is possible.
+		"""
+		with self._lock:
+			while True:
+				if self._closed:
+					raise dException.dException(_("The connection pool is closed."))
+				self.closeIdle()
+				if self._idle:
+					return self._idle.pop()[1]
+				if self._maxSize is None or self._size < self._maxSize:
+					self._size += 1
+					return None
+				if deadline is None:
+					self._lock.wait()
+				else:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						raise dException.ConnectionPoolTimeoutException(
+								_("No connection of the pool became available."))
+					self._lock.wait(remaining)
+
+
+	def _open(self):
+		"""Open a new connection for the slot that was just reserved."""
+		try:
+			conn = self._connection.clone(
+					**self._connection.getBackendObject().poolConnectionArgs)
+			# The pool keeps its idle connections alive, and the others are in use.
+			conn.getBackendObject().KeepAliveInterval = None
+		except Exception:
+			self._discard(None)
+			raise
+		return conn
+
+
+	def _fill(self):
+		"""Open idle connections until MinSize connections are open."""
+		while True:
+			with self._lock:
+				if (self._closed or self._size >= self._minSize
+						or (self._maxSize is not None and self._size >= self._maxSize)):
+					return
+				self._size += 1
+			conn = self._open()
+			with self._lock:
+				if self._closed:
+					self._discard(conn)
+					return
+				self._idle.append((time.time(), conn))
+				self._lock.notify()
+
+
+	def _discard(self, conn):
+		"""Close the connection, if any, and free its slot."""
+		with self._lock:
+			self._size -= 1
+			self._lock.notify()
+		if conn is not None:
+			try:
+				conn.close()
+			except Exception:
+				pass
+
+
+	def _isAlive(self, conn):
+		try:
+			conn.getBackendObject().ping(conn.getConnection().cursor())
+		except Exception:
+			return False
+		return True
+
+
+	def keepAlive(self):
+		"""
+		Called by the keep-alive scheduler. Pings the idle connections that
+		haven't run a query for KeepAliveInterval seconds, replacing the lost
+		ones, and returns the number of seconds until the next check.
+		"""
+		kal = self._connection.ConnectInfo.KeepAliveInterval
+		if not kal or self._closed:
+			return None
+		now = time.time()
+		due = []
+		ret = kal
+		with self._lock:
+			# Take them out of the pool while they are pinged.
+			for entry in self._idle[:]:
+				idle = now - entry[1].getBackendObject().lastExecuteTime
+				if idle >= kal:
+					self._idle.remove(entry)
+					due.append(entry)
+				else:
+					ret = min(ret, kal - idle)
+		for entry in due:
+			conn = entry[1]
+			if not self._isAlive(conn):
+				dabo.log.info(_("Dropping a lost connection of the pool."))
+				self._discard(conn)
+				continue
+			conn.getBackendObject().lastExecuteTime = time.time()
+			with self._lock:
+				if self._closed:
+					self._discard(conn)
+				else:
+					self._idle.append(entry)
+					self._idle.sort(key=lambda ent: ent[0])
+					self._lock.notify()
+		try:
+			# Replace the connections that were lost.
+			self._fill()
+		except Exception, e:
+			dabo.log.error(_("Could not reopen a connection of the pool: %s") % e)
+		return ret
+
+
+	def closeIdle(self):
+		"""Close the connections that have been idle longer than IdleTimeout."""
+		if self._idleTimeout is None:
+			return
+		expired = time.time() - self._idleTimeout
+		with self._lock:
+			idle = self._idle
+			while idle and idle[0][0] < expired and self._size > self._minSize:
+				self._discard(idle.pop(0)[1])
+
+
+	def close(self):
+		"""
+		Close the idle connections. The connections in use are closed when
+		they are checked in, and no more can be checked out.
+		"""
+		getKeepAliveScheduler().unregister(self)
+		with self._lock:
+			self._closed = True
+			idle, self._idle = self._idle, []
+			for checkedIn, conn in idle:
+				self._discard(conn)
+			self._lock.notifyAll()
+
+
+	def _getHealthCheck(self):
+		return self._healthCheck
+
+	def _setHealthCheck(self, val):
+		self._healthCheck = bool(val)
+
+
+	def _getIdleTimeout(self):
+		return self._idleTimeout
+
+	def _setIdleTimeout(self, val):
+		self._idleTimeout = val or None
+		self.closeIdle()
+
+
+	def _getMaxSize(self):
+		return self._maxSize
+
+	def _setMaxSize(self, val):
+		with self._lock:
+			self._maxSize = val or None
+			self._lock.notifyAll()
+
+
+	def _getMinSize(self):
+		return self._minSize
+
+	def _setMinSize(self, val):
+		self._minSize = val or 0
+		self._fill()
+
+
+	def _getSize(self):
+		return self._size
+
+
+	HealthCheck = property(_getHealthCheck, _setHealthCheck, None,
+			_("""When True, idle connections are tested with a trivial query before
+			being checked out, and replaced if they were lost. Default=False  (bool)"""))
+
+	IdleTimeout = property(_getIdleTimeout, _setIdleTimeout, None,
+			_("""The number of seconds after which connections that aren't in use are
+			closed. Default=None, which keeps them open  (int)"""))
+
+	MaxSize = property(_getMaxSize, _setMaxSize, None,
+			_("""The maximum number of connections open at once. Default=None, which
+			doesn't limit them  (int)"""))
+
+	MinSize = property(_getMinSize, _setMinSize, None,
+			_("""The number of connections that are opened in advance, and kept open
+			when they aren't in use regardless of IdleTimeout. Default=0  (int)"""))
+
+	Size = property(_getSize, None, None,
+			_("The number of open connections of the pool. Read-only.  (int)"))
@@ -4,6 +4,7 @@
 import datetime
 import time
 import re
+import bisect
 from decimal import Decimal
 import functools
 import dabo
@@ -12,20 +13,127 @@ from dabo.dLocalize import _
 import dabo.dException as dException
 from dabo.dObject import dObject
 from dNoEscQuoteStr import dNoEscQuoteStr
-from dabo.db.dDataSet import dDataSet
+from dabo.db.dDataSet import dDataSet, dMutableDataSet, _RowIndex
+from dabo.db.dColumnarDataSet import dColumnarDataSet, dColumnarRecord
+from dabo.db.dDataSetView import dDataSetView
+from dabo.db.dResultCache import dResultCache
 from dabo.lib import dates
 from dabo.lib.utils import noneSortKey, caseInsensitiveSortKey
 from dabo.lib.utils import ustr
 
 cursor_flags = (kons.CURSOR_MEMENTO, kons.CURSOR_NEWFLAG,
 		kons.CURSOR_TMPKEY_FIELD, kons.CURSOR_FIELD_TYPES_CORRECTED)
+# Marks a virtual field value that hasn't been computed yet.
+_NOT_COMPUTED = object()
+# Marks a field missing from a record passed to loadRecords().
+_NO_VALUE = object()
+
+
+
+class _ChangeDict(dict):
+	"""
+	Dict holding the mementos or the new records of a cursor. It tells the
+	cursor when it goes from empty to not empty or back, so that the bizobj
+	can keep track of which of its cursors have changes without checking them.
+	"""
+	def __init__(self, owner, *args, **kwargs):
+		super(_ChangeDict, self).__init__(*args, **kwargs)
+		self._owner = owner
+
+
+	def __setitem__(self, key, val):
+		wasEmpty = not self
+		super(_ChangeDict, self).__setitem__(key, val)
+		if wasEmpty:
+			self._owner._onChangeStateChanged()
+
+
+	def __delitem__(self, key):
+		super(_ChangeDict, self).__delitem__(key)
+		if not self:
+			self._owner._onChangeStateChanged()
+
+
+	def pop(self, *args):
+		wasEmpty = not self
+		ret = super(_ChangeDict, self).pop(*args)
+		if not wasEmpty and not self:
+			self._owner._onChangeStateChanged()
+		return ret
+
+
+	def popitem(self):
+		ret = super(_ChangeDict, self).popitem()
+		if not self:
+			self._owner._onChangeStateChanged()
+		return ret
+
+
+	def clear(self):
+		wasEmpty = not self
+		super(_ChangeDict, self).clear()
+		if not wasEmpty:
+			self._owner._onChangeStateChanged()
+
+
+	def setdefault(self, key, default=None):
+		if key not in self:
+			self[key] = default
+		return self[key]
+
+
+	def update(self, *args, **kwargs):
+		wasEmpty = not self
+		super(_ChangeDict, self).update(*args, **kwargs)
+		if wasEmpty and self:
+			self._owner._onChangeStateChanged()
+
+
+
+class _SQLClause(object):
+	"""
+	A clause of the SQL builder of dCursorMixin. Setting it to a different
+	value bumps its version counter in the cursor, so that getSQL() can
+	reuse the SQL it composed for as long as the clauses don't change.
+	"""
+	def __init__(self, name, default=""):
+		self._name = name
+		self._default = default
+
+
+	def __get__(self, obj, objtype=None):
+		if obj is None:
+			return self
+		return obj.__dict__.get(self._name, self._default)
+
+
+	def __set__(self, obj, val):
+		dct = obj.__dict__
+		name = self._name
+		old = dct.get(name, self._default)
+		dct[name] = val
+		if old is not val and (type(old) is not type(val) or old != val):
+			versions = obj._clauseVersions
+			versions[name] = versions.get(name, 0) + 1
+			obj._sqlVersion += 1
+
 
 
 class dCursorMixin(dObject):
 	"""Dabo's cursor class, representing the lowest tier."""
 	_call_initProperties = False
-	# Make these class attributes, so that they are shared among all instances
-	_fieldStructure = {}
+	# The maximum number of keys in each statement of a bulk delete.
+	_deleteChunkSize = 500
+	# The clauses of the SQL builder
+	_fieldClause = _SQLClause("_fieldClause")
+	_fromClause = _SQLClause("_fromClause")
+	_joinClause = _SQLClause("_joinClause")
+	_whereClause = _SQLClause("_whereClause")
+	_childFilterClause = _SQLClause("_childFilterClause")
+	_groupByClause = _SQLClause("_groupByClause")
+	_orderByClause = _SQLClause("_orderByClause")
+	_limitClause = _SQLClause("_limitClause")
+	_defaultLimit = _SQLClause("_defaultLimit", 1000)
 
 	def __init__(self, sql="", *args, **kwargs):
 		self._convertStrToUnicode = True
@@ -80,6 +188,8 @@ class dCursorMixin(dObject):
 		# are identical.
 		self.__lastExecute = ""
 		self.__lastFieldList = ""
+		# The last statement parsed by _newStructure(), and its field list.
+		self.__parsedSQL = self.__parsedFieldList = None
 		self._whitespacePat = re.compile(r"(\s+)")
 		self._selectStatementPat = re.compile(r"\bselect\b(.+)\bfrom\b", re.I | re.M | re.S)
 		# Holds the keys in the original, unsorted order for unsorting the dataset
@@ -95,8 +205,28 @@ class dCursorMixin(dObject):
 		# in some cases, such as a single bizobj managing several cursors,
 		# it will be a separate object.
 		self.sqlManager = self
+		# Number of rows to fetch at a time; 0 fetches the whole result at once.
+		self._fetchWindowSize = 0
+		# Are there rows of a windowed query that haven't been fetched yet?
+		self._pendingFetch = False
+		# The number of rows of a windowed query, from a count query.
+		self._windowRowCount = None
+		self._windowSQL = None
+		# Seconds that the results of a select may be reused from the cache of
+		# the connection; None disables the result cache.
+		self._resultCacheInterval = None
 		# Attribute that holds the data of the cursor
-		self._records = dDataSet()
+		self._records = dMutableDataSet()
+		# Store the records by column instead of as one dict per record?
+		self._columnarStorage = False
+		# Maps each PK value to its row number in _records. It is rebuilt lazily
+		# whenever _records is replaced by a different data set object.
+		self._pkIndex = None
+		self._pkIndexRecords = None
+		self._pkIndexHasDups = False
+		# Sorted indexes used by seek(), keyed on (fields, caseSensitive).
+		self._seekIndexes = {}
+		self._seekIndexRecords = None
 		# Attribute that holds the current row number
 		self.__rownumber = -1
 		# Data structure info
@@ -105,6 +235,9 @@ class dCursorMixin(dObject):
 		self._keyField = ""
 		self._userSQL = None
 		self._virtualFields = {}
+		# Memoized values of the VirtualFields that declare 'depends_on',
+		# as {virtual_field_name: {pk: value}}.
+		self._virtualFieldCache = {}
 
 		self._autoPopulatePK = True
 		self._autoQuoteNames = True
@@ -112,6 +245,10 @@ class dCursorMixin(dObject):
 		self.__tmpPK = -1		# temp PK value for new records.
 		# Holds the data types for each field
 		self._types = {}
+		# The functions that correct the types of the values of each field,
+		# built from _types and DataStructure once per result structure.
+		self._conversionPlan = {}
+		self._conversionScales = None
 
 		# Holds reference to auxiliary cursor that handles queries that
 		# are not supposed to affect the record set.
@@ -125,6 +262,13 @@ class dCursorMixin(dObject):
 		# Reference to the bizobj that 'owns' this cursor, if any,
 		self._bizobj = None
 
+		# Version counters of the SQL Builder clauses, bumped when they change,
+		# and the SQL composed from them, keyed by the kind of statement.
+		self._clauseVersions = {}
+		self._sqlVersion = 0
+		self._composedSQL = {}
+		# The last statement passed to processFields(), and its result.
+		self._processedFields = None
 		# set properties for the SQL Builder functions
 		self.clearSQL()
 		self.hasSqlBuilder = True
@@ -166,6 +310,13 @@ class dCursorMixin(dObject):
 		self._orderByClause = ""
 		self._limitClause = ""
 		self._defaultLimit = 1000
+		# Number of rows per page; 0 disables paging.
+		self._pageSize = 0
+		# The (where clause, params, reverse) of the page to be queried by the
+		# next requery(), as set by nextPage() and previousPage().
+		self._pendingKeyset = None
+		# Did the last page requery find any rows?
+		self._pageFound = True
 
 
 	def getSortColumn(self):
@@ -183,13 +334,18 @@ class dCursorMixin(dObject):
 	def pkExpression(self, rec=None):
 		"""Returns the PK expression for the passed record."""
 		if rec is None:
+			row = self.RowNumber
+			if self._pendingFetch:
+				self._fetchRows(row)
 			try:
-				rec = self._records[self.RowNumber]
+				rec = self.__records[row]
 			except IndexError:
 				rec = {}
+		else:
+			row = None
 		# Prevent correction of empty rows.
 		if rec:
-			self._correctFieldTypesIfNeeded(rec)
+			self._correctFieldTypesIfNeeded(rec, row)
 		if isinstance(self.KeyField, tuple):
 			if rec:
 				pk = tuple([rec[kk] for kk in self.KeyField])
@@ -212,11 +368,64 @@ class dCursorMixin(dObject):
 		return pkField
 
 
-	def _correctFieldTypesIfNeeded(self, rec):
+	def _correctFieldTypesIfNeeded(self, rec, row=None):
+		"""
+		Convert the values of the passed record to their field types, if it
+		hasn't been done yet. Pass the row of the record, if known, so that
+		only that row of the SQLite table used to query the records is updated.
+		"""
 		if not rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False):
-			_correctFieldType = self._correctFieldType
-			for fld_name in (i for i in rec if i not in cursor_flags):
-				rec[fld_name] = _correctFieldType(rec[fld_name], fld_name)
+			plan = self._conversionPlan
+			_getFieldConverter = self._getFieldConverter
+			for fld_name in [i for i in rec if i not in cursor_flags]:
+				try:
+					convert = plan[fld_name]
+				except KeyError:
+					convert = _getFieldConverter(fld_name)
+				rec[fld_name] = convert(rec[fld_name])
+			rec[kons.CURSOR_FIELD_TYPES_CORRECTED] = True
+			if row is None:
+				# It is usually the current record.
+				try:
+					current = self._records[self.RowNumber]
+				except IndexError:
+					current = None
+				if current is rec or (isinstance(current, dColumnarRecord)
+						and current == rec):
+					row = self.RowNumber
+			self._recordsChanged(row)
+
+
+	def _recordsChanged(self, row=None):
+		"""
+		Tell the record set that the values of the record at the passed row,
+		or of any of its records if row is None, were changed, so that the
+		SQLite table used to query it is brought up to date.
+		"""
+		self._records.markChanged(None if row is None else [row])
+
+
+	def _correctFieldTypes(self, records):
+		"""
+		Correct the types of all the passed records, one column at a time.
+		This is called by self.execute() right after the records are fetched,
+		so that reading the values later on doesn't need any conversion.
+		"""
+		if not records:
+			return
+		flds = [fld for fld in records[0] if fld not in cursor_flags]
+		_getFieldConverter = self._getFieldConverter
+		if isinstance(records, dColumnarDataSet):
+			for fld in flds:
+				records.mapColumn(fld, _getFieldConverter(fld))
+			records.fillColumn(kons.CURSOR_FIELD_TYPES_CORRECTED, True)
+			return
+		for fld in flds:
+			convert = _getFieldConverter(fld)
+			for rec in records:
+				if fld in rec:
+					rec[fld] = convert(rec[fld])
+		for rec in records:
 			rec[kons.CURSOR_FIELD_TYPES_CORRECTED] = True
 
 
@@ -224,24 +433,69 @@ class dCursorMixin(dObject):
 		"""
 		Correct the type of the passed field_val, based on self.DataStructure.
 
-		This is called by self.execute(), and contains code to convert all strings
-		to unicode, as well as to correct any datatypes that don't match what
-		self.DataStructure reports. The latter can happen with SQLite, for example,
-		which only knows about a quite limited number of types.
+		Contains code to convert all strings to unicode, as well as to correct
+		any datatypes that don't match what self.DataStructure reports. The
+		latter can happen with SQLite, for example, which only knows about a
+		quite limited number of types.
 		"""
-		if field_val is None:
-			return field_val
+		return self._getFieldConverter(field_name)(field_val)
 
-		pythonType = self._types.get(field_name, dabo.db.getDataType(type(field_val)))
-		if not pythonType:
-			pythonType = dabo.db.getDataType(type(field_val))
 
+	def _clearConversionPlan(self):
+		"""
+		Discard the field converters, so that they are rebuilt from the current
+		field types the next time that they are needed.
+		"""
+		self._conversionPlan = {}
+		self._conversionScales = None
 
-		if isinstance(field_val, pythonType):
-			# No conversion needed.
-			return field_val
 
-		def tryToCorrect(func, field_val, field_name):
+	def _getFieldConverter(self, field_name):
+		"""
+		Returns the function that corrects the type of the values of the passed
+		field. The converters are built once per result structure, and kept in
+		self._conversionPlan.
+		"""
+		try:
+			return self._conversionPlan[field_name]
+		except KeyError:
+			pass
+		pythonType = self._types.get(field_name)
+		if pythonType:
+			convert = self._makeFieldConverter(field_name, pythonType)
+		else:
+			# The type is determined by each value, which only matters for floats.
+			if dabo.db.getDataType(float) is float:
+				convert = self._makeFieldConverter(field_name, None)
+			else:
+				convertFloat = self._makeFieldConverter(field_name,
+						dabo.db.getDataType(float))
+				def convert(field_val):
+					if type(field_val) is float:
+						return convertFloat(field_val)
+					return field_val
+		self._conversionPlan[field_name] = convert
+		return convert
+
+
+	def _getFieldScale(self, field_name):
+		"""Returns the scale for the field from self.DataStructure, or None."""
+		scales = self._conversionScales
+		if scales is None:
+			scales = self._conversionScales = {}
+			for fld in self.DataStructure:
+				if len(fld) > 5:
+					scales.setdefault(fld[0], fld[5])
+		return scales.get(field_name)
+
+
+	def _makeFieldConverter(self, field_name, pythonType):
+		"""
+		Returns a function that converts a value of the passed field to the
+		passed python type. If pythonType is None, the values are left as they
+		are.
+		"""
+		def tryToCorrect(func, field_val):
 			try:
 				return func(field_val)
 			except Exception, e:
@@ -249,38 +503,64 @@ class dCursorMixin(dObject):
 				dabo.log.error(_("_correctFieldType() failed for field: "
 						"'%(field_name)s' (%(func)s); value: %(field_val)s (%(tfv)s)") % locals())
 
-		if pythonType in (unicode,):
-			# Unicode conversion happens below.
-			pass
-		elif pythonType in (datetime.datetime,) and isinstance(field_val, basestring):
-			return tryToCorrect(dates.getDateTimeFromString, field_val, field_name)
-		elif pythonType in (datetime.date,) and isinstance(field_val, basestring):
-			return tryToCorrect(dates.getDateFromString, field_val, field_name)
+		if pythonType is None:
+			def convert(field_val):
+				return field_val
+
+		elif pythonType in (unicode,):
+			def convert(field_val):
+				if field_val is None or isinstance(field_val, unicode):
+					return field_val
+				return self._convertToUnicode(field_val, field_name, pythonType)
+
+		elif pythonType in (datetime.datetime, datetime.date):
+			if pythonType is datetime.datetime:
+				fromString = dates.getDateTimeFromString
+			else:
+				fromString = dates.getDateFromString
+			def convert(field_val):
+				if field_val is None or isinstance(field_val, pythonType):
+					return field_val
+				if isinstance(field_val, basestring):
+					return tryToCorrect(fromString, field_val)
+				return tryToCorrect(pythonType, field_val)
+
 		elif pythonType in (Decimal,):
-			ds = self.DataStructure
-			_field_val = field_val
-			if type(field_val) in (float,):
-				# Can't convert to decimal directly from float
-				_field_val = ustr(_field_val)
-			# Need to convert to the correct scale:
-			try:
-				scale = [s[5] for s in ds
-						if s[0] == field_name][0]
-			except IndexError:
-				scale = None
-			if scale is None:
+			# The scale is looked up when the first value is converted, since
+			# getting the DataStructure may require running a query.
+			quantum = []
+			def convert(field_val):
+				if field_val is None or isinstance(field_val, Decimal):
+					return field_val
+				if type(field_val) in (float,):
+					# Can't convert to decimal directly from float
+					field_val = ustr(field_val)
+				dec = tryToCorrect(Decimal, field_val)
+				if dec is None:
+					return dec
+				if not quantum:
+					scale = self._getFieldScale(field_name)
+					quantum.append(None if scale is None
+							else Decimal("0.%s" % (scale * "0",)))
+				if quantum[0] is not None:
+					return dec.quantize(quantum[0])
+				# Need to convert to the correct scale:
 				try:
-					scale = len(_field_val.split(".")[1])
+					scale = len(field_val.split(".")[1])
 				except (IndexError, AttributeError):
 					scale = 2
-			dec = tryToCorrect(Decimal, _field_val, field_name)
-			if dec is not None:
 				return dec.quantize(Decimal("0.%s" % (scale * "0",)))
-			return dec
+
 		else:
-			return tryToCorrect(pythonType, field_val, field_name)
+			def convert(field_val):
+				if field_val is None or isinstance(field_val, pythonType):
+					return field_val
+				return tryToCorrect(pythonType, field_val)
+		return convert
 
-		# Do the unicode conversion last:
+
+	def _convertToUnicode(self, field_val, field_name, pythonType=unicode):
+		"""Do the unicode conversion of the passed field value."""
 		if isinstance(field_val, str) and self._convertStrToUnicode:
 			try:
 				return field_val.decode(self.Encoding)
@@ -324,7 +604,7 @@ class dCursorMixin(dObject):
 				sql = sql.decode(self.Encoding).replace("\n", " ")
 			except UnicodeDecodeError, e:
 				sql = "(couldn't decode sql)"
-		params = ", ".join("%s" % p for p in params)
+		params = ", ".join("%s" % (p,) for p in params)
 		logmsg = "%s SQL: %s, PARAMS: %s" % (msg, sql, params)
 
 		try:
@@ -339,6 +619,116 @@ class dCursorMixin(dObject):
 		# retrieving the data. However, many cursor classes can only return
 		# row information as a list, not as a dictionary. This method will
 		# detect that, and convert the results to a dictionary.
+		cacheKey = self._getResultCacheKey(sql, params)
+		if cacheKey is not None:
+			cached = self.BackendObject.ResultCache.get(cacheKey)
+			if cached is not None:
+				self._loadCachedResult(*cached)
+				return None
+		res, sql = self._executeStatement(sql, params, errorClass=errorClass,
+				convertQMarks=convertQMarks)
+
+		if self._newStructure(sql):
+			self._storeFieldTypes()
+
+		self._records = self._makeRecordSet(())
+		if sql.split(None, 1)[0].lower() not in ("select", "pragma"):
+			# No need to massage the data for DML commands
+			return res
+
+		self._clearConversionPlan()
+		windowSize = self._fetchWindowSize
+		if windowSize > 0:
+			self._windowSQL = (sql, params)
+			self._windowRowCount = None
+			self._pendingFetch = True
+			self._fetchRows(windowSize - 1)
+		else:
+			rows = self._fetch()
+			if cacheKey is not None:
+				self._cacheResult(cacheKey, sql, rows)
+			self._addFetchedRows(rows)
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+		return res
+
+
+	def _getResultCacheKey(self, sql, params):
+		"""
+		Return the key of the query in the result cache of the connection, or
+		None if its results aren't to be cached.
+		"""
+		if not self._resultCacheInterval or self._fetchWindowSize:
+			return None
+		if sql.split(None, 1)[0].lower() != "select":
+			return None
+		return dResultCache.makeKey(sql, params)
+
+
+	def _cacheResult(self, cacheKey, sql, rows):
+		"""Store the rows fetched for the query in the result cache."""
+		fldNames = [fld[0] for fld in self.FieldDescription]
+		if rows and isinstance(rows[0], dict):
+			rows = tuple([tuple([row[fld] for fld in fldNames]) for row in rows])
+		else:
+			rows = tuple([tuple(row) for row in rows])
+		tables = dResultCache.getTables(sql)
+		if self.Table:
+			tables.add(dResultCache._normalizeName(self.Table))
+		self.BackendObject.ResultCache.set(cacheKey, (sql, self.descriptionClean, rows),
+				self._resultCacheInterval, tables, size=dResultCache.getSizeOf(rows))
+
+
+	def _loadCachedResult(self, sql, description, rows):
+		"""Populate the data set from a result found in the result cache."""
+		self.descriptionClean = description
+		if self._newStructure(sql):
+			self._storeFieldTypes()
+		self._records = self._makeRecordSet(())
+		self._clearConversionPlan()
+		self._addFetchedRows(rows)
+		self.RowNumber = self.RowNumber
+
+
+	def executemany(self, sql, paramSeq, errorClass=None, convertQMarks=False):
+		"""
+		Execute the sql once for each of the parameter tuples in paramSeq, in
+		a single call to the backend. This is meant for DML statements, so the
+		data set is emptied, as with execute().
+		"""
+		res, sql = self._executeStatement(sql, list(paramSeq), errorClass=errorClass,
+				convertQMarks=convertQMarks, many=True)
+		self._records = self._makeRecordSet(())
+		return res
+
+
+	def bulkLoad(self, rows, columns, table=None):
+		"""
+		Insert the rows, which are sequences of values ordered like the passed
+		column names, straight into the table (by default, the Table of this
+		cursor), and return the number of rows inserted. The data set is left
+		alone, and no transaction is started.
+
+		The rows are read from the iterable as they are sent, so it can be a
+		csv.reader() or a generator over a file of any size. The backend uses
+		its fastest way to load data, such as COPY with PostgreSQL.
+		"""
+		if table is None:
+			table = self.Table
+		bo = self.BackendObject
+		ret = bo.bulkLoad(table, rows, columns, self.AuxCursor)
+		bo.ResultCache.invalidate(table)
+		return ret
+
+
+	def _executeStatement(self, sql, params=None, errorClass=None, convertQMarks=False,
+			many=False):
+		"""
+		Have the backend cursor execute the sql, without fetching any rows.
+		Returns the result of the backend execute() and the sql as it was run.
+		If many is True, params is a sequence of parameter tuples, and the sql
+		is run with executemany().
+		"""
 		if isinstance(sql, unicode):
 			sql = sql.encode(self.Encoding)
 		if convertQMarks:
@@ -346,7 +736,11 @@ class dCursorMixin(dObject):
 		# Some backends, notably Firebird, require that fields be specially marked.
 		sql = self.processFields(sql)
 		try:
-			if params:
+			if many:
+				res = self.superCursor.executemany(self, sql, params)
+				if not self.IsPrefCursor:
+					self._dblogExecute("executemany() (%s rows)" % len(params), sql)
+			elif params:
 				res = self.superCursor.execute(self, sql, params)
 				if not self.IsPrefCursor:
 					self._dblogExecute("execute()", sql, params)
@@ -381,45 +775,183 @@ class dCursorMixin(dObject):
 
 		# Set the last execute time in case there is a Keep Alive Interval
 		self.BackendObject.lastExecuteTime = time.time()
+		# Drop the cached results that this statement may have changed, and
+		# those that a commit or rollback made stale.
+		self.BackendObject.ResultCache.invalidateForStatement(sql)
 
 		# Some backend programs do odd things to the description
 		# This allows each backend to handle these quirks individually.
 		self.BackendObject.massageDescription(self)
+		return res, sql
 
-		if self._newStructure(sql):
-			self._storeFieldTypes()
 
-		if sql.split(None, 1)[0].lower() not in ("select", "pragma"):
-			# No need to massage the data for DML commands
-			self._records = dDataSet(tuple())
-			return res
+	def iterRecords(self, fields=None, chunkSize=1000, asDict=True, sql=None,
+			params=None):
+		"""
+		Generator that runs the query on a separate backend cursor, and yields
+		its records as they are fetched, chunkSize rows at a time. This is meant
+		for a single forward pass over a large result, such as an export: the
+		records aren't stored, so the memory used doesn't depend on the size of
+		the result, and the data set, current row and changes of this cursor are
+		left alone.
+
+		The query is the CurrentSQL of the cursor, run with the parameters of
+		the last requery(), unless sql and params are passed. Each record is a
+		dict, or a tuple of the values ordered like 'fields' if asDict is False.
+		If 'fields' isn't passed, all the fields of the query are included.
+		The values are converted to the field types of the cursor for its own
+		query, and to those reported by the backend for a passed sql.
+		"""
+		ownQuery = sql is None
+		if ownQuery:
+			sql = self.CurrentSQL
+			if params is None:
+				params = self.lastParams
+		crs = self.BackendObject.getCursor(self.__class__)
+		crs.BackendObject = self.BackendObject
+		try:
+			crs._executeStatement(sql, params)
+			fldNames = [fld[0] for fld in crs.FieldDescription]
+			if fields is None:
+				fields = fldNames
+			else:
+				for fld in fields:
+					if fld not in fldNames:
+						raise dException.FieldNotFoundException(
+								_("Field '%s' does not exist in the data set.") % (fld,))
+			positions = [fldNames.index(fld) for fld in fields]
+			# The converters are built by the streaming cursor, so that those of
+			# this cursor are left alone.
+			if ownQuery:
+				crs._types = self._types
+				crs._conversionScales = dict([(fld, self._getFieldScale(fld))
+						for fld in fields])
+			else:
+				# Its fields may share names with those of this cursor, but not
+				# their types.
+				crs._types = dict([(info[0], dabo.db.getPythonType(info[1]))
+						for info in crs.getFieldInfoFromDescription()])
+				crs._conversionScales = {}
+			getFieldConverter = crs._getFieldConverter
+			converters = [getFieldConverter(fld) for fld in fields]
+			while True:
+				rows = crs.fetchmany(chunkSize)
+				if not rows:
+					break
+				for row in rows:
+					if isinstance(row, dict):
+						vals = tuple([convert(row[fld])
+								for fld, convert in zip(fields, converters)])
+					else:
+						vals = tuple([convert(row[pos])
+								for pos, convert in zip(positions, converters)])
+					if asDict:
+						yield dict(zip(fields, vals))
+					else:
+						yield vals
+		finally:
+			crs.close()
+
 
+	def _fetch(self, size=None):
+		"""
+		Fetch the passed number of rows of the current result from the backend,
+		or all of the remaining rows if size is None.
+		"""
 		try:
-			_records = self.fetchall()
+			if size is None:
+				return self.fetchall()
+			return self.fetchmany(size)
 		except Exception, e:
-			_records = dabo.db.dDataSet()
 			# Database errors need to be decoded from database encoding.
 			try:
 				errMsg = ustr(e).decode(self.Encoding)
 			except UnicodeError:
 				errMsg = ustr(e)
 			dabo.log.error("Error fetching records: (%s, %s)" % (type(e), errMsg))
+			return ()
 
-		if _records and isinstance(_records[0], (tuple, list)):
-			# Need to convert each row to a Dict, since the backend didn't do it.
-			tmpRows = []
+
+	def _addFetchedRows(self, rows):
+		"""Add the rows fetched from the backend to the records of the cursor."""
+		if not rows:
+			return
+		records = self.__records
+		start = len(records)
+		if isinstance(rows[0], (tuple, list)):
 			fldNames = [f[0] for f in self.FieldDescription]
-			for row in _records:
-				dic = {}
-				for idx, fldName in enumerate(fldNames):
-					dic[fldName] = row[idx]
-				tmpRows.append(dic)
-			_records = tmpRows
-
-		self._records = dDataSet(_records)
-		# This will handle bounds issues
-		self.RowNumber = self.RowNumber
-		return res
+			if isinstance(records, dColumnarDataSet):
+				# The values can go straight into the columns.
+				records.appendRows(fldNames, rows)
+			else:
+				# Need to convert each row to a Dict, since the backend didn't do it.
+				records.extend([dict(zip(fldNames, row)) for row in rows])
+		else:
+			for rec in rows:
+				records.append(rec)
+		self._correctFieldTypes(records[start:])
+		if isinstance(records, dColumnarDataSet):
+			records.compact()
+
+
+	def _countWindowRows(self):
+		"""
+		Returns the number of rows in the result of the current windowed query,
+		using a count query, or None if that fails.
+		"""
+		sql, params = self._windowSQL
+		sql = "select count(*) from (%s) dabo_window" % sql.strip().rstrip(";")
+		aux = self.AuxCursor
+		try:
+			aux.execute(sql, params, errorClass=Exception)
+			rec = aux._records[0]
+		except Exception, e:
+			dabo.log.info(_("Couldn't count the rows of the query: %s") % ustr(e))
+			return None
+		return [val for fld, val in rec.items() if fld not in cursor_flags][0]
+
+
+	def _fetchRows(self, row=None):
+		"""
+		When FetchWindowSize is set, only the first rows of a query are fetched
+		by execute(). This fetches the pending rows up to the passed row number,
+		in chunks of FetchWindowSize rows, or all of them if row is None.
+		"""
+		records = self.__records
+		windowSize = self._fetchWindowSize
+		while self._pendingFetch and (row is None or row >= len(records)):
+			if row is None:
+				rows = self._fetch()
+				self._pendingFetch = False
+			else:
+				size = max(windowSize, row + 1 - len(records))
+				rows = self._fetch(size)
+				self._pendingFetch = (len(rows) == size)
+			self._addFetchedRows(rows)
+
+
+	def _makeRecordSet(self, records):
+		"""
+		Return the passed records in the record store used by this cursor:
+		a dColumnarDataSet if ColumnarStorage is True, or a dMutableDataSet.
+		"""
+		if self._columnarStorage:
+			if isinstance(records, dColumnarDataSet):
+				return records
+			return dColumnarDataSet(records)
+		if isinstance(records, dMutableDataSet):
+			return records
+		return dMutableDataSet([rec if isinstance(rec, dict) else rec.copy()
+				for rec in records])
+
+
+	def getMemoryUsage(self):
+		"""
+		Returns a dict with the number of rows ('rows'), and the approximate
+		number of bytes used to hold them, in total ('bytes') and per row
+		('bytesPerRow').
+		"""
+		return self._records.getMemoryUsage()
 
 
 	def executeSafe(self, sql, params=None):
@@ -444,12 +976,20 @@ class dCursorMixin(dObject):
 			return False
 		if sql == self.__lastExecute:
 			return False
-		# See if it's a select statement
-		mtch = self._selectStatementPat.search(sql)
-		if not mtch:
+		if sql == self.__parsedSQL:
+			# Requerying the same statement; no need to parse it again.
+			fldlist = self.__parsedFieldList
+		else:
+			# See if it's a select statement
+			mtch = self._selectStatementPat.search(sql)
+			if mtch:
+				# Normalize white space
+				fldlist = self._whitespacePat.sub(" ", mtch.groups()[0]).strip()
+			else:
+				fldlist = None
+			self.__parsedSQL, self.__parsedFieldList = sql, fldlist
+		if fldlist is None:
 			return False
-		# Normalize white space
-		fldlist = self._whitespacePat.sub(" ", mtch.groups()[0]).strip()
 		if self.__lastFieldList == fldlist:
 			return False
 		else:
@@ -480,14 +1020,60 @@ class dCursorMixin(dObject):
 
 
 	def requery(self, params=None, convertQMarks=False):
-		currSQL = self.CurrentSQL
-		newQuery = (self._lastSQL != currSQL)
+		keyset = self._pendingKeyset
+		try:
+			currSQL = self.CurrentSQL
+		finally:
+			self._pendingKeyset = None
+		newQuery = (self._lastSQL != currSQL) and not keyset
+		oldSQL, oldParams = self._lastSQL, self.lastParams
 		self._lastSQL = currSQL
 		self.lastParams = params
 		self._savedStructureDescription = []
 
-		self.execute(currSQL, params, convertQMarks=convertQMarks)
+		if keyset:
+			# Keep the current page if there is none beyond it.
+			oldRecords, oldRow = self._records, self.RowNumber
+			self.execute(currSQL, tuple(params or ()) + keyset[1],
+					convertQMarks=convertQMarks)
+			self._pageFound = bool(self.RowCount)
+			if not self._pageFound:
+				self._records = oldRecords
+				self.RowNumber = oldRow
+				self._lastSQL, self.lastParams = oldSQL, oldParams
+				return False
+			if keyset[2]:
+				# The page before was queried in reverse order.
+				self._records = self._makeRecordSet(list(reversed(list(self._records))))
+				self.RowNumber = 0
+		else:
+			self.execute(currSQL, params, convertQMarks=convertQMarks)
+		self.__resetAfterRequery(newQuery)
+		return True
+
+
+	def requeryFrom(self, source, sql, params=None):
+		"""
+		Replace the data set with the records that source, another cursor,
+		fetched by running sql, which is the CurrentSQL of this cursor, as if
+		this cursor had been requeried. This lets a requery be run on another
+		connection, such as in a background thread, and its result be swapped
+		in at once.
+		"""
+		newQuery = (self._lastSQL != sql)
+		self._lastSQL = sql
+		self.lastParams = params
+		self._savedStructureDescription = []
+		self.descriptionClean = source.descriptionClean
+		if self._newStructure(sql):
+			self._storeFieldTypes()
+		self._records = self._makeRecordSet(source._records)
+		self._clearConversionPlan()
+		self.RowNumber = self.RowNumber
+		self.__resetAfterRequery(newQuery)
+
 
+	def __resetAfterRequery(self, newQuery):
 		# clear mementos and new record flags:
 		self._mementos = {}
 		self._newRecords = {}
@@ -507,7 +1093,6 @@ class dCursorMixin(dObject):
 			except dException.NoRecordsException:
 				# No big deal
 				pass
-		return True
 
 
 	def _storeFieldTypes(self, target=None):
@@ -520,6 +1105,7 @@ class dCursorMixin(dObject):
 		if target is None:
 			target = self
 		target._types = {}
+		target._clearConversionPlan()
 		for field in self.DataStructure:
 			field_alias, field_type = field[0], field[1]
 			target._types[field_alias] = dabo.db.getPythonType(field_type)
@@ -651,7 +1237,7 @@ class dCursorMixin(dObject):
 
 		# Extract the rows into a new list, then convert them back to the _records tuple
 		newRows = [elem[1] for elem in sortList]
-		self._records = dDataSet(newRows)
+		self._records = self._records.__class__(newRows)
 
 		# restore the RowNumber
 		self.moveToPK(currRowKey)
@@ -798,6 +1384,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self._newRecords[pk] = None
 		# Add the 'new record' flag
 		self._records[self.RowNumber][kons.CURSOR_TMPKEY_FIELD] = pk
+		self._recordsChanged(self.RowNumber)
 
 
 	def genTempAutoPK(self):
@@ -821,12 +1408,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		# are assigned to the same child, we need to use sqlManager
 		# for temporary key creation.
 		tmpPK = self.sqlManager._genTempPKVal(pkVal)
+		oldKey = self.pkExpression(rec)
 		if isinstance(kf, tuple):
 			for key in kf:
 				rec[key] = tmpPK
+				self._clearSeekIndexes(key)
 		else:
 			rec[kf] = tmpPK
+			self._clearSeekIndexes(kf)
 		rec[kons.CURSOR_TMPKEY_FIELD] = tmpPK
+		self._recordsChanged(self.RowNumber)
+		self._updatePKIndex(self.RowNumber, oldKey, self.pkExpression(rec))
 		return tmpPK
 
 
@@ -874,19 +1466,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def getFieldVal(self, fld, row=None, _rowChangeCallback=None):
 		"""Return the value of the specified field in the current or specified row."""
-		_records = self._records
+		_records = self.__records
 		if not _records:
 			raise dException.NoRecordsException(
 					_("No records in dataset '%s'.") % self.Table)
 		if row is None:
 			row = self._getRowNumber()
+		if self._pendingFetch:
+			self._fetchRows(row)
 		try:
 			rec = _records[row]
 		except IndexError:
 			cnt = len(_records)
 			raise dException.RowNotFoundException(
 					_("Row #%(row)s requested, but the data set has only %(cnt)s row(s),") % locals())
-		self._correctFieldTypesIfNeeded(rec)
+		self._correctFieldTypesIfNeeded(rec, row)
 		if isinstance(fld, (tuple, list)):
 			return map(functools.partial(self.getFieldVal, row=row), fld)
 		if fld in rec:
@@ -898,6 +1492,15 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			vf.setdefault("args", ())
 			vf.setdefault("kwargs", {})
 
+			memo = self._getVirtualFieldMemo(fld, vf)
+			if memo is not None:
+				recKey = self.pkExpression(rec)
+				if recKey is None:
+					# Can't tell this record apart from the others.
+					memo = None
+				elif recKey in memo:
+					return memo[recKey]
+
 			requery_children = (vf.get("requery_children", False) and bool(_rowChangeCallback))
 
 			# Move to specified row if necessary, and then call the VirtualFields
@@ -909,18 +1512,102 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				self.RowNumber = row
 				ret = vf["func"](*vf["args"], **vf["kwargs"])
 				self.RowNumber = _oldrow
-				return ret
 			else:
 				# The VirtualFields definition's 'requery_children' key is True, so
 				# we need to request a row change and requery of any child bizobjs
 				# as necessary, before executing the virtual field function.
 				_rowChangeCallback(row)
-				return vf["func"](*vf["args"], **vf["kwargs"])
+				ret = vf["func"](*vf["args"], **vf["kwargs"])
+			if memo is not None:
+				memo[recKey] = ret
+			return ret
 		else:
 			raise dException.FieldNotFoundException("%s '%s' %s" % (
 					_("Field"), fld, _("does not exist in the data set")))
 
 
+	def getVirtualFieldValues(self, fld, rowStart=0, rows=None, _rowChangeCallback=None):
+		"""
+		Return a list of the values of the passed virtual field for the rows
+		starting at rowStart, or for all of them if rows is None. If the field
+		is defined with a 'batch_func', it is called once with the list of the
+		records that need a value, instead of calling 'func' on each row.
+		"""
+		try:
+			vf = self.VirtualFields[fld]
+		except KeyError:
+			raise dException.FieldNotFoundException("%s '%s' %s" % (
+					_("Field"), fld, _("is not a virtual field")))
+		rowCount = self.RowCount
+		if rows is None:
+			end = rowCount
+		else:
+			end = min(rowStart + rows, rowCount)
+		rowRange = xrange(rowStart, end)
+		batchFunc = vf.get("batch_func") if isinstance(vf, dict) else None
+		if not batchFunc:
+			getFieldVal = self.getFieldVal
+			return [getFieldVal(fld, row, _rowChangeCallback=_rowChangeCallback)
+					for row in rowRange]
+		if self._pendingFetch:
+			self._fetchRows(end - 1)
+		records = self.__records
+		recs = [records[row] for row in rowRange]
+		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
+		for row, rec in zip(rowRange, recs):
+			_correctFieldTypesIfNeeded(rec, row)
+		args = vf.get("args", ())
+		kwargs = vf.get("kwargs", {})
+		memo = self._getVirtualFieldMemo(fld, vf)
+		if memo is None:
+			return list(batchFunc(recs, *args, **kwargs))
+		recKeys = [self.pkExpression(rec) for rec in recs]
+		ret = [memo.get(recKey, _NOT_COMPUTED) for recKey in recKeys]
+		missing = [idx for idx, val in enumerate(ret) if val is _NOT_COMPUTED]
+		if missing:
+			vals = batchFunc([recs[idx] for idx in missing], *args, **kwargs)
+			for idx, val in zip(missing, vals):
+				ret[idx] = val
+				if recKeys[idx] is not None:
+					memo[recKeys[idx]] = val
+		return ret
+
+
+	def _getVirtualFieldMemo(self, fld, vf):
+		"""
+		Return the dict holding the memoized values of the virtual field, or
+		None if its values can't be memoized because it doesn't declare the
+		fields it depends on, or there is no KeyField to identify the records.
+		"""
+		if vf.get("depends_on") is None or not self.KeyField:
+			return None
+		return self._virtualFieldCache.setdefault(fld, {})
+
+
+	def _clearVirtualFieldCache(self, fld=None, rec=None):
+		"""
+		Discard the memoized values of the virtual fields that depend on the
+		passed field, for the passed record or for all of them. With no field,
+		all the memoized values are discarded.
+		"""
+		cache = self._virtualFieldCache
+		if not cache:
+			return
+		if fld is None:
+			self._virtualFieldCache = {}
+			return
+		recKey = self.pkExpression(rec) if rec is not None else None
+		virtualFields = self.VirtualFields
+		for vfld, memo in cache.items():
+			vf = virtualFields.get(vfld)
+			if not isinstance(vf, dict) or fld not in (vf.get("depends_on") or ()):
+				continue
+			if rec is None:
+				del cache[vfld]
+			else:
+				memo.pop(recKey, None)
+
+
 	def _fldTypeFromDB(self, fld):
 		"""
 		Try to determine the field type from the database information
@@ -1102,6 +1789,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 			# Finally, save the new value to the field and signify that the field was changed:
 			rec[fld] = val
+			self._recordsChanged(row)
+			if valid_pk and ((fld == keyField) or (self._compoundKey and fld in keyField)):
+				self._updatePKIndex(row, old_key, keyFieldValue)
+			self._clearSeekIndexes(fld)
+			self._clearVirtualFieldCache(fld, rec)
 			return True
 
 
@@ -1284,11 +1976,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		"""
 		ret = {}
 		if pk is not None:
-			recs = [r for r in self._records
-					if r[self._keyField] == pk]
-			try:
-				rec = recs[0]
-			except IndexError:
+			row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+			if rec is None:
 				return ret
 		else:
 			if row is None:
@@ -1316,11 +2005,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		"""
 		ret = {}
 		if pk is not None:
-			recs = [r for r in self._records
-					if r[self._keyField] == pk]
-			try:
-				rec = recs[0]
-			except IndexError:
+			row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+			if rec is None:
 				return ret
 		else:
 			if row is None:
@@ -1354,9 +2040,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		Obviously, use with care. You can't get the original records back
 		and this is really intended for one-off read-only cursors.
 		"""
-		if not ds:
-			ds = dDataSet()
-		self._records = ds
+		self._records = self._makeRecordSet(ds or ())
 
 
 	def getDataSet(self, flds=(), rowStart=0, rows=None, returnInternals=False,
@@ -1377,8 +2061,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if rows < 1 or rowStart > self.RowCount:
 			return dDataSet()
 
-		getFieldVal = self.getFieldVal
-		_records = self._records
+		if self._pendingFetch:
+			# Only fetch the rows that are needed.
+			self._fetchRows(rows - 1)
+		_records = self.__records
+		rows = min(rows, len(_records))
 		vFieldKeys = self.VirtualFields.keys()
 		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
 
@@ -1388,19 +2075,67 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		else:
 			vflds = [f for f in flds if f in vFieldKeys]
 			flds = [f for f in flds if f not in vFieldKeys]
+		vcols = [(v, self.getVirtualFieldValues(v, rowStart, rows - rowStart,
+				_rowChangeCallback=_rowChangeCallback)) for v in vflds]
 		ds = []
-		for row in xrange(rowStart, rows):
+		for idx, row in enumerate(xrange(rowStart, rows)):
 			rec = _records[row]
-			_correctFieldTypesIfNeeded(rec)
+			_correctFieldTypesIfNeeded(rec, row)
 			tmprec = dict([(k, rec[k]) for k in flds if k in rec])
-			for v in vflds:
-				tmprec.update({v: getFieldVal(v, row,
-						_rowChangeCallback=_rowChangeCallback)})
+			for v, vals in vcols:
+				tmprec[v] = vals[idx]
 			ds.append(tmprec)
 		self.RowNumber = _currentRow
 		return dDataSet(ds)
 
 
+	def getColumnArrays(self, flds=(), rowStart=0, rows=None, _rowChangeCallback=None):
+		"""
+		Returns a dict of NumPy arrays, one for each of the passed fields (or
+		for all the fields), holding the values of the rows. The array types
+		are based on the DataStructure; see dDataSet.toArrays(). Requires NumPy.
+		"""
+		view = self.getDataSetView(flds, rowStart, rows,
+				_rowChangeCallback=_rowChangeCallback)
+		view.TypeStructure = dict([(fld[0], fld[1]) for fld in self.DataStructure])
+		return view.toArrays(list(flds) or None)
+
+
+	def getDataSetView(self, flds=(), rowStart=0, rows=None, returnInternals=False,
+			_rowChangeCallback=None):
+		"""
+		Like getDataSet(), but returns a read-only dDataSetView that reads the
+		values from the records of the cursor, instead of copying each record.
+		This is much cheaper when the caller only reads the data once, such as
+		for a report or an export. The view reflects later changes to the
+		records; use getDataSet() to get a snapshot.
+		"""
+		rowCount = self.RowCount
+		if rows is None:
+			rows = rowCount
+		else:
+			rows = min(rowStart + rows, rowCount)
+		if rows < 1 or rowStart > rowCount:
+			return dDataSetView()
+		if self._pendingFetch:
+			self._fetchRows(rows - 1)
+		_records = self.__records
+		rows = min(rows, len(_records))
+		vFieldKeys = self.VirtualFields.keys()
+		if not flds:
+			vflds = vFieldKeys
+			flds = [f for f in _records[rowStart] if returnInternals or f not in cursor_flags]
+		else:
+			vflds = [f for f in flds if f in vFieldKeys]
+			flds = [f for f in flds if f not in vFieldKeys]
+		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
+		for row in xrange(rowStart, rows):
+			_correctFieldTypesIfNeeded(_records[row], row)
+		vcols = dict([(v, self.getVirtualFieldValues(v, rowStart, rows - rowStart,
+				_rowChangeCallback=_rowChangeCallback)) for v in vflds])
+		return dDataSetView(_records, list(flds) + list(vflds), rowStart, rows, vcols)
+
+
 	def appendDataSet(self, ds, updateInternals=False):
 		"""
 		Appends the rows in the passed dataset to this cursor's dataset. No checking
@@ -1408,19 +2143,134 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		it is the responsibility of the caller to make sure that they match. If invalid data is
 		passed, a dException.FieldNotFoundException will be raised.
 		"""
+		self.loadRecords(ds, markNew=updateInternals)
+
+
+	def loadRecords(self, records, fields=None, markNew=True, defaults=None):
+		"""
+		Append all the passed records to the data set in one operation, and
+		return the list of their PK values.
+
+		The records can be dicts, or sequences of values ordered like the passed
+		list of field names, such as the rows read from a CSV file. Dicts may
+		have different keys; the fields a record doesn't have keep the value of
+		the blank record or of 'defaults'. The fields are checked once against
+		the data set, raising dException.FieldNotFoundException for an unknown
+		field, and the values are converted to the field types one column at a
+		time. Values for the KeyField are ignored when AutoPopulatePK is True.
+
+		The values that differ from the blank record, or from the 'defaults'
+		dict of field values when passed, are recorded as changes. When markNew
+		is True, the records also get temporary PKs if AutoPopulatePK is True,
+		and are flagged as new, so that the next save inserts them.
+		"""
+		records = list(records)
+		if not records:
+			return []
+		if fields is None:
+			fields = []
+			seen = set()
+			for rec in records:
+				if not seen.issuperset(rec):
+					newFields = [fld for fld in rec if fld not in seen]
+					fields.extend(newFields)
+					seen.update(newFields)
+			records = [[rec.get(fld, _NO_VALUE) for fld in fields] for rec in records]
+		else:
+			numFields = len(fields)
+			for num, vals in enumerate(records):
+				if len(vals) != numFields:
+					raise dException.dException(
+							_("Record %(num)s has %(numVals)s values for the %(numFields)s fields passed.")
+							% {"num": num, "numVals": len(vals), "numFields": numFields})
 		kf = self.KeyField
 		if not isinstance(kf, tuple):
 			kf = (kf,)
 		autoPopulatePK = self.AutoPopulatePK
-		for rec in ds:
-			self.new()
-			if updateInternals:
-				self.genTempAutoPK()
-				self.setNewFlag()
-			for col, val in rec.items():
-				if autoPopulatePK and (col in kf):
+		base = self._getBlankRecord()
+		vfs = self.VirtualFields
+		cols = []
+		for pos, fld in enumerate(fields):
+			if fld in cursor_flags:
+				continue
+			if fld not in base:
+				if fld in vfs:
+					# ignore
 					continue
-				self.setFieldVal(col, val)
+				raise dException.FieldNotFoundException(
+						_("Field '%s' does not exist in the data set.") % (fld,))
+			if autoPopulatePK and (fld in kf):
+				continue
+			cols.append((pos, fld, self._getFieldConverter(fld)))
+
+		def getDefault(val):
+			# If it is a function, execute it to get the value, else use literal.
+			if callable(val):
+				return val()
+			elif isinstance(val, tuple) and val and callable(val[0]):
+				return val[0](*val[1:])
+			return val
+
+		defaults = defaults or {}
+		for fld in defaults:
+			if fld not in base:
+				raise dException.FieldNotFoundException(
+						_("Can't set default value for nonexistent field '%s'.") % fld)
+		dynamicDefaults = [fld for fld, val in defaults.items()
+				if callable(val) or (isinstance(val, tuple) and val and callable(val[0]))]
+		base.update(defaults)
+		for fld in dynamicDefaults:
+			del base[fld]
+
+		nonUpdateFields = self.getNonUpdateFields()
+		memCols = [(pos, fld, convert) for pos, fld, convert in cols
+				if fld not in nonUpdateFields]
+		genTempPK = autoPopulatePK and markNew
+		if genTempPK:
+			_genTempPKVal = self.sqlManager._genTempPKVal
+			blankPK = base.get(kf[0], "")
+		pkExpression = self.pkExpression
+		newRecs = []
+		mementos = []
+		for vals in records:
+			rec = base.copy()
+			for fld in dynamicDefaults:
+				rec[fld] = getDefault(defaults[fld])
+			start = rec.copy()
+			for pos, fld, convert in cols:
+				val = vals[pos]
+				if val is not _NO_VALUE:
+					rec[fld] = convert(val)
+			if genTempPK:
+				tmpPK = _genTempPKVal(blankPK)
+				for fld in kf:
+					rec[fld] = tmpPK
+				rec[kons.CURSOR_TMPKEY_FIELD] = tmpPK
+			rec[kons.CURSOR_FIELD_TYPES_CORRECTED] = True
+			mem = dict([(fld, start[fld]) for pos, fld, convert in memCols
+					if rec[fld] != start[fld]])
+			newRecs.append(rec)
+			mementos.append(mem)
+
+		_records = self._records
+		firstRow = len(_records)
+		_records.extend(newRecs)
+		self.RowNumber = len(_records) - 1
+		self._clearSeekIndexes()
+		if not self._hasValidKeyField():
+			dabo.log.info("Records loaded, but their changes can't be tracked,"
+					" because there is no valid KeyField.")
+			return [None] * len(newRecs)
+		pks = [pkExpression(rec) for rec in newRecs]
+		_addToPKIndex = self._addToPKIndex
+		for row, rec in enumerate(newRecs):
+			_addToPKIndex(firstRow + row, rec)
+		if markNew:
+			for pk, rec in zip(pks, newRecs):
+				rec[kons.CURSOR_TMPKEY_FIELD] = pk
+			self._newRecords.update(dict.fromkeys(pks))
+		self._mementos.update([(pk, mem) for pk, mem in zip(pks, mementos) if mem])
+		return pks
 
 
 	def cloneRecord(self):
@@ -1462,8 +2312,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if data is None:
 			return
 		# Store the values
-		self._records = data
+		self._records = self._makeRecordSet(data)
 		self._types = typs
+		self._clearConversionPlan()
 		# Clear the unsorted list, and then apply the current sort
 		self.__unsortedRows = []
 		if self.sortColumn:
@@ -1516,6 +2367,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._records.Cursor = self
 		self._records.Bizobj = self._bizobj
 		self._records.replace(field, valOrExpr, scope=scope)
+		self._clearPKIndex()
+		self._clearSeekIndexes()
+		self._clearVirtualFieldCache(field)
 
 
 	def first(self):
@@ -1563,16 +2417,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 
 	def save(self, allRows=False, includeNewUnchanged=False):
-		"""Save any changes to the current record back to the data store."""
+		"""
+		Save any changes to the current record back to the data store. If allRows
+		is True, the changes to all the records are saved; the statements that
+		have the same form, such as updates of the same fields, are then sent to
+		the backend together with executemany().
+		"""
 		# Make sure that there is data to save
 		if self.RowCount <= 0:
 			raise dException.NoRecordsException(_("No data to save"))
 		# Make sure that there is a PK
 		self.checkPK()
 
-		def saverow(row):
+		def saving(func, *args):
 			try:
-				self.__saverow(row)
+				func(*args)
 			except dException.DBQueryException, e:
 				# Error was encountered. Raise an exception so that the
 				# calling bizobj can rollback the transaction if necessary
@@ -1607,14 +2466,121 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			rows = []
 			if self.isChanged(allRows=False, includeNewUnchanged=includeNewUnchanged):
 				rows = [self.RowNumber]
-		for row in rows:
-			saverow(row)
+		if len(rows) > 1:
+			saving(self.__saverows, rows)
+		else:
+			for row in rows:
+				saving(self.__saverow, row)
 
 
-	def __saverow(self, row):
-		rec = self._records[row]
-		recKey = self.pkExpression(rec)
-		newrec = kons.CURSOR_TMPKEY_FIELD in rec
+	def __saverow(self, row, stmt=None):
+		if stmt is None:
+			stmt = self.__getSaveStatement(row)
+		if stmt is None:
+			return
+		sql, params, newrec, newPKVal, recKey = stmt
+		#run the update
+		aux = self.AuxCursor
+		res = aux.execute(sql, params)
+
+		if newrec and self.AutoPopulatePK and (newPKVal is None):
+			# Call the database backend-specific code to retrieve the
+			# most recently generated PK value.
+			newPKVal = aux.getLastInsertID()
+			if newPKVal and not self._compoundKey:
+				self.setFieldVal(self.KeyField, newPKVal, row)
+
+		if newrec and self._nullDefaults:
+			# We need to retrieve any new default values
+			aux = self.AuxCursor
+			if not isinstance(self.KeyField, tuple):
+				keyFields = [self.KeyField]
+			else:
+				keyFields = self.KeyField
+			wheres = []
+			for kf in keyFields:
+				fld = self.BackendObject.encloseNames(kf, self.AutoQuoteNames)
+				val = self.getFieldVal(kf)
+				if isinstance(val, basestring):
+					val = "'" + val.encode(self.Encoding) + "' "
+				elif isinstance(val, (datetime.date, datetime.datetime)):
+					val = self.formatDateTime(val)
+				else:
+					val = ustr(val)
+				wheres.append("%s = %s" % (fld, val))
+			where = " and ".join(wheres)
+			aux.execute("select * from %s where %s" % (self.Table, where))
+			try:
+				data = aux.getDataSet()[0]
+				for fld, val in data.items():
+					try:
+						self.setFieldVal(fld, val)
+					except dException.FieldNotFoundException:
+						# Field is not in the dataset
+						pass
+			except IndexError:
+				# For some reason we could not retrieve the matching PK record
+				pass
+
+		self.__afterSaveRow(row, newrec, recKey, res)
+
+
+	def __saverows(self, rows):
+		"""
+		Save the passed rows in order, sending the statements of consecutive
+		rows that have the same form to the backend together. The inserts for
+		which the backend has to provide the new PK or default values are run
+		one at a time.
+		"""
+		aux = self.AuxCursor
+		batch = []
+
+		def flush():
+			if not batch:
+				return
+			sql = batch[0][0]
+			if len(batch) == 1:
+				res = aux.execute(sql, batch[0][2])
+			else:
+				res = aux.executemany(sql, [params for sql, row, params, newrec, recKey
+						in batch])
+				if isinstance(res, (int, long)) and 0 <= res < len(batch):
+					# Backends that return the number of rows affected only give
+					# the total; one of the updates didn't match any record.
+					res = 0
+			for sql, row, params, newrec, recKey in batch:
+				self.__afterSaveRow(row, newrec, recKey, res)
+			del batch[:]
+
+		for row in rows:
+			stmt = self.__getSaveStatement(row, parameterizeWhere=True)
+			if stmt is None:
+				continue
+			sql, params, newrec, newPKVal, recKey = stmt
+			if newrec and (self._nullDefaults
+					or (self.AutoPopulatePK and (newPKVal is None))):
+				# The new PK or default values have to be read back after the
+				# insert, which must still run after the rows before it.
+				flush()
+				self.__saverow(row, stmt)
+				continue
+			if batch and batch[0][0] != sql:
+				flush()
+			batch.append((sql, row, params, newrec, recKey))
+		flush()
+
+
+	def __getSaveStatement(self, row, parameterizeWhere=False):
+		"""
+		Returns the statement that saves the changes to the passed row, as a
+		tuple of (sql, params, newrec, newPKVal, recKey), or None if there is
+		nothing to save. If parameterizeWhere is True, the PK values in the
+		WHERE clause of updates are passed as parameters, so that the updates
+		of different rows have the same sql.
+		"""
+		rec = self._records[row]
+		recKey = self.pkExpression(rec)
+		newrec = kons.CURSOR_TMPKEY_FIELD in rec
 
 		newPKVal = None
 		if newrec and self.AutoPopulatePK:
@@ -1631,107 +2597,74 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			diff = self._getNewRecordDiff(row)
 		else:
 			diff = self.getRecordStatus(row)
+		if not diff:
+			return None
 		aq = self.AutoQuoteNames
-		if diff:
-			if newrec:
-				flds = ""
-				vals = []
-				kf = self.KeyField
-				for kk, vv in diff.items():
-					if self.AutoPopulatePK:
-						if self._compoundKey:
-							skipIt = (kk in kf)
-						else:
-							# Skip the key field, unless we pre-generated its value above.
-							skipIt = (kk == self.KeyField) and not newPKVal
-						if skipIt:
-							# we don't want to include the PK in the insert
-							continue
-					if kk in self.getNonUpdateFields():
-						# Skip it.
-						continue
-					if self._nullDefaults and vv == (None, None):
-						# Skip these, too
+		if newrec:
+			flds = ""
+			vals = []
+			kf = self.KeyField
+			for kk, vv in diff.items():
+				if self.AutoPopulatePK:
+					if self._compoundKey:
+						skipIt = (kk in kf)
+					else:
+						# Skip the key field, unless we pre-generated its value above.
+						skipIt = (kk == self.KeyField) and not newPKVal
+					if skipIt:
+						# we don't want to include the PK in the insert
 						continue
-					# Append the field and its value.
-					flds += ", " + self.BackendObject.encloseNames(kk, aq)
-					# add value to expression
-					fieldType = [ds[1] for ds in self.DataStructure if ds[0] == kk][0]
-					val = vv[1]
-					if fieldType == "L" or (isinstance(val, basestring) and "\0" in val):
-						val = self.formatBLOB(val)
-					#elif fieldType in ("D", "T"):
-					#	val = self.formatDateTime(val)
-					vals.append(val)
-
-				# Trim leading comma-space from the 'flds' string
-				flds = flds[2:]
-				if not flds:
-					# Some backends (sqlite) require non-empty field clauses. We already
-					# know that we are expecting the backend to generate the PK, so send
-					# NULL as the PK Value:
-					flds = self.KeyField
-					vals = "NULL"
-				nms = self.BackendObject.encloseNames(self.Table, aq)
-				placeHolders = len(vals) * [self.ParamPlaceholder]
-				sql = "insert into %s (%s) values (%s) " % (nms, flds, ",".join(placeHolders))
-				params = tuple(vals)
+				if kk in self.getNonUpdateFields():
+					# Skip it.
+					continue
+				if self._nullDefaults and vv == (None, None):
+					# Skip these, too
+					continue
+				# Append the field and its value.
+				flds += ", " + self.BackendObject.encloseNames(kk, aq)
+				# add value to expression
+				fieldType = [ds[1] for ds in self.DataStructure if ds[0] == kk][0]
+				val = vv[1]
+				if fieldType == "L" or (isinstance(val, basestring) and "\0" in val):
+					val = self.formatBLOB(val)
+				#elif fieldType in ("D", "T"):
+				#	val = self.formatDateTime(val)
+				vals.append(val)
+
+			# Trim leading comma-space from the 'flds' string
+			flds = flds[2:]
+			if not flds:
+				# Some backends (sqlite) require non-empty field clauses. We already
+				# know that we are expecting the backend to generate the PK, so send
+				# NULL as the PK Value:
+				flds = self.KeyField
+				vals = "NULL"
+			nms = self.BackendObject.encloseNames(self.Table, aq)
+			placeHolders = len(vals) * [self.ParamPlaceholder]
+			sql = "insert into %s (%s) values (%s) " % (nms, flds, ",".join(placeHolders))
+			params = tuple(vals)
+		else:
+			updClause, params = self.makeUpdClause(diff)
+			if parameterizeWhere:
+				pkWhere, pkParams = self._makePkWhereParams(row)
+				params += pkParams
 			else:
 				pkWhere = self.makePkWhere(row)
-				updClause, params = self.makeUpdClause(diff)
-				sql = "update %s set %s where %s" % (self.BackendObject.encloseNames(self.Table, aq),
-						updClause, pkWhere)
-			#run the update
-			aux = self.AuxCursor
-			res = aux.execute(sql, params)
-
-			if newrec and self.AutoPopulatePK and (newPKVal is None):
-				# Call the database backend-specific code to retrieve the
-				# most recently generated PK value.
-				newPKVal = aux.getLastInsertID()
-				if newPKVal and not self._compoundKey:
-					self.setFieldVal(self.KeyField, newPKVal, row)
-
-			if newrec and self._nullDefaults:
-				# We need to retrieve any new default values
-				aux = self.AuxCursor
-				if not isinstance(self.KeyField, tuple):
-					keyFields = [self.KeyField]
-				else:
-					keyFields = self.KeyField
-				wheres = []
-				for kf in keyFields:
-					fld = self.BackendObject.encloseNames(kf, self.AutoQuoteNames)
-					val = self.getFieldVal(kf)
-					if isinstance(val, basestring):
-						val = "'" + val.encode(self.Encoding) + "' "
-					elif isinstance(val, (datetime.date, datetime.datetime)):
-						val = self.formatDateTime(val)
-					else:
-						val = ustr(val)
-					wheres.append("%s = %s" % (fld, val))
-				where = " and ".join(wheres)
-				aux.execute("select * from %s where %s" % (self.Table, where))
-				try:
-					data = aux.getDataSet()[0]
-					for fld, val in data.items():
-						try:
-							self.setFieldVal(fld, val)
-						except dException.FieldNotFoundException:
-							# Field is not in the dataset
-							pass
-				except IndexError:
-					# For some reason we could not retrieve the matching PK record
-					pass
+			sql = "update %s set %s where %s" % (self.BackendObject.encloseNames(self.Table, aq),
+					updClause, pkWhere)
+		return (sql, params, newrec, newPKVal, recKey)
 
-			self._clearMemento(row)
-			if newrec:
-				self._clearNewRecord(row=row, pkVal=recKey)
-			else:
-				if not res:
-					# Different backends may cause res to be None
-					# even if the save is successful.
-					self.BackendObject.noResultsOnSave()
+
+	def __afterSaveRow(self, row, newrec, recKey, res):
+		"""Clear the change tracking of the passed row once it has been saved."""
+		self._clearMemento(row)
+		if newrec:
+			self._clearNewRecord(row=row, pkVal=recKey)
+		else:
+			if not res:
+				# Different backends may cause res to be None
+				# even if the save is successful.
+				self.BackendObject.noResultsOnSave()
 
 
 	def _clearMemento(self, row=None):
@@ -1770,7 +2703,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			# didn't exist
 			pass
 		# Remove the temp key field column, if still present.
-		rec.pop(kons.CURSOR_TMPKEY_FIELD, None)
+		if rec.pop(kons.CURSOR_TMPKEY_FIELD, None) is not None:
+			self._recordsChanged(row)
 
 
 
@@ -1824,9 +2758,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def new(self):
 		"""Add a new record to the data set."""
 		blank = self._getBlankRecord()
-		self._records = dDataSet(self._records + (blank,))
+		records = self._records
+		records.append(blank)
+		row = len(records) - 1
+		self._addToPKIndex(row, records[row])
+		self._clearSeekIndexes()
 		# Adjust the RowCount and position
-		self.RowNumber = self.RowCount - 1
+		self.RowNumber = row
 
 
 	def cancel(self, allRows=False, ignoreNoRecords=None):
@@ -1861,7 +2799,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				for idx in delrecs_idx:
 					del recs[idx]
 				self._newRecords = {}
-				self._records = dDataSet(recs)
+				self._records = self._records.__class__(recs)
 				if self.RowNumber >= self.RowCount:
 					self.RowNumber = self.RowCount - 1
 
@@ -1870,6 +2808,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				for fld, val in mem.items():
 					self._records[row][fld] = val
 			self._mementos = {}
+			self._recordsChanged()
+			# Restored values may include key fields.
+			self._clearPKIndex()
+			self._clearSeekIndexes()
+			self._clearVirtualFieldCache()
 
 		else:
 			row = self.RowNumber
@@ -1879,17 +2822,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				# We simply need to remove the row, and clear the memento and newrec flag.
 				self._clearMemento(row)
 				self._clearNewRecord(row)
-				recs = list(self._records)
-				del recs[recs.index(rec)]
-				self._records = dDataSet(recs)
-				if self.RowNumber >= self.RowCount:
-					self.RowNumber = self.RowCount - 1
+				self._removeRow(row)
 				return
 
 			# Not a new record: need to manually replace the old values:
 			for fld, val in self._mementos.get(recKey, {}).items():
 				self._records[row][fld] = val
+				self._clearVirtualFieldCache(fld, rec)
+			self._recordsChanged(row)
 			self._clearMemento(row)
+			self._clearPKIndex()
+			self._clearSeekIndexes()
 
 
 	def delete(self, delRowNum=None):
@@ -1907,16 +2850,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			res = True
 			del self._newRecords[pk]
 		else:
-			pkWhere = self.makePkWhere()
-			# some backends(PostgreSQL) don't return information about number of deleted rows
-			# try to fetch it before
-			sql = "select count(*) as cnt from %s where %s" % (self.Table, pkWhere)
+			pkWhere = self.makePkWhere(delRowNum)
 			aux = self.AuxCursor
-			aux.execute(sql)
-			res = aux.getFieldVal('cnt')
-			if res:
-				sql = "delete from %s where %s" % (self.Table, pkWhere)
-				aux.execute(sql)
+			aux.execute("delete from %s where %s" % (self.Table, pkWhere))
+			res = self._getDeletedCount(aux)
+			if res is None:
+				# The backend can't tell; assume that the row was deleted.
+				res = True
 
 		if not res:
 			# Nothing was deleted
@@ -1928,12 +2868,97 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._removeRow(delRowNum)
 
 
+	def deleteRows(self, rows=None):
+		"""
+		Delete the passed rows, or all the rows, using as few statements as
+		possible: one 'delete ... where pk in (...)' for every _deleteChunkSize
+		records. Records that were never saved are just removed from the data
+		set, and the deleted rows are dropped from the data set in one pass.
+		"""
+		records = self._records
+		if rows is None:
+			rows = range(len(records))
+		if not rows:
+			return
+		pks = []
+		keys = []
+		for row in rows:
+			pk = self.pkExpression(records[row])
+			pks.append(pk)
+			if pk not in self._newRecords:
+				keys.append(tuple([val for fld, val in self._getStoredPkVals(row)]))
+
+		res = True
+		if keys:
+			aux = self.AuxCursor
+			chunkSize = self._deleteChunkSize
+			res = 0
+			for start in xrange(0, len(keys), chunkSize):
+				pkWhere, params = self._makePkInWhere(keys[start:start + chunkSize])
+				aux.execute("delete from %s where %s" % (self.Table, pkWhere), params)
+				cnt = self._getDeletedCount(aux)
+				if cnt is None:
+					# The backend can't tell; assume that the rows were deleted.
+					res = True
+				elif res is not True:
+					res += cnt
+		if not res:
+			# Nothing was deleted
+			self.BackendObject.noResultsOnDelete()
+		# As in delete(), the records are removed from the data set even if they
+		# were already deleted from the database.
+		for pk in pks:
+			self._mementos.pop(pk, None)
+			self._newRecords.pop(pk, None)
+		removed = records.removeRows(rows)
+		# From the last row, so that the rows still to be done don't shift.
+		for row, rec in reversed(zip(sorted(set(rows)), removed)):
+			self._removeFromPKIndex(row, rec)
+		self._clearSeekIndexes()
+		self.RowNumber = min(self.RowNumber, self.RowCount - 1)
+
+
+	def _getDeletedCount(self, aux):
+		"""
+		Returns the number of rows deleted by the last statement of the passed
+		cursor, or None if the backend doesn't report it.
+		"""
+		cnt = getattr(aux, "rowcount", None)
+		if cnt is None or cnt < 0:
+			return None
+		return cnt
+
+
+	def _makePkInWhere(self, keys):
+		"""
+		Create the WHERE clause matching the records with the passed keys,
+		which are tuples of the values of the key fields. Returns a 2-tuple
+		containing the clause and the parameters for the values.
+		"""
+		bo = self.BackendObject
+		aq = self.AutoQuoteNames
+		tblPrefix = bo.getWhereTablePrefix(self.Table, autoQuote=aq)
+		if self._compoundKey:
+			keyFields = [fld for fld in self.KeyField]
+		else:
+			keyFields = [self.KeyField]
+		fldNames = ["%s%s" % (tblPrefix, bo.encloseNames(fld, aq)) for fld in keyFields]
+		placeHolders = ",".join([self.ParamPlaceholder] * len(keys))
+		params = []
+		for key in keys:
+			params.extend(key)
+		if len(fldNames) == 1:
+			return ("%s in (%s)" % (fldNames[0], placeHolders), tuple(params))
+		match = " AND ".join(["%s = %s" % (fld, self.ParamPlaceholder)
+				for fld in fldNames])
+		return (" OR ".join(["(%s)" % match] * len(keys)), tuple(params))
+
+
 	def _removeRow(self, row):
-		## Since record sets are tuples and thus immutable, we need to do this
-		## little dance to remove a row.
-		lRec = list(self._records)
-		del lRec[row]
-		self._records = dDataSet(lRec)
+		records = self._records
+		rec = records.pop(row)
+		self._removeFromPKIndex(row, rec)
+		self._clearSeekIndexes()
 		self.RowNumber = min(self.RowNumber, self.RowCount - 1)
 
 
@@ -2045,14 +3070,115 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return map(self._getRowByPk, chKeys)
 
 
+	def _getPKIndex(self):
+		"""
+		Return the _RowIndex that maps the PK values of the current data set
+		to their row numbers, building it first if the data set has been
+		replaced since it was last built. When a PK value appears more than
+		once, as with unsaved new records in a bare cursor, the first row wins.
+		"""
+		records = self._records
+		if self._pkIndex is None or self._pkIndexRecords is not records:
+			pkIndex = {}
+			hasDups = False
+			if self.KeyField:
+				pkExpression = self.pkExpression
+				for row, rec in enumerate(records):
+					pk = pkExpression(rec)
+					if pk in pkIndex:
+						hasDups = True
+					else:
+						pkIndex[pk] = row
+			self._pkIndex = _RowIndex(pkIndex)
+			self._pkIndexRecords = records
+			self._pkIndexHasDups = hasDups
+		return self._pkIndex
+
+
+	def _clearPKIndex(self):
+		"""Discard the PK index; it will be rebuilt on the next PK lookup."""
+		self._pkIndex = self._pkIndexRecords = None
+
+
+	def _addToPKIndex(self, row, rec):
+		"""Add the index entry for a record appended at the passed row."""
+		pkIndex = self._pkIndex
+		if pkIndex is None or self._pkIndexRecords is not self._records:
+			return
+		pk = self.pkExpression(rec)
+		if pk in pkIndex:
+			self._pkIndexHasDups = True
+		else:
+			pkIndex[pk] = row
+
+
+	def _removeFromPKIndex(self, row, rec):
+		"""
+		Drop the index entry for the record that was removed from the passed
+		row, and shift the entries of the rows after it.
+		"""
+		pkIndex = self._pkIndex
+		if pkIndex is None or self._pkIndexRecords is not self._records:
+			return
+		if self._pkIndexHasDups:
+			self._clearPKIndex()
+			return
+		pk = self.pkExpression(rec)
+		if pkIndex.get(pk) == row:
+			del pkIndex[pk]
+		pkIndex.removeRow(row)
+
+
+	def _updatePKIndex(self, row, oldKey, newKey):
+		"""Re-key the index entry for the passed row after its PK value changed."""
+		pkIndex = self._pkIndex
+		if pkIndex is None or self._pkIndexRecords is not self._records:
+			# Nothing built yet, or it is stale anyway.
+			return
+		if self._pkIndexHasDups:
+			# Another row may share the old key, so we can't just drop it.
+			self._clearPKIndex()
+			return
+		if pkIndex.get(oldKey) == row:
+			del pkIndex[oldKey]
+		currRow = pkIndex.get(newKey)
+		if currRow is None:
+			pkIndex[newKey] = row
+		else:
+			self._pkIndexHasDups = True
+			pkIndex[newKey] = min(row, currRow)
+
+
 	def _getRecordByPk(self, pk, raiseRowNotFound=True):
 		"""Find the record with the passed primary key; return (row, record)."""
-		kf = self.KeyField
-		if kf:
-			for idx, rec in enumerate(self._records):
-				key = self.getFieldVal(kf, row=idx)
-				if key == pk:
-					return (idx, rec)
+		if self.KeyField:
+			if isinstance(pk, list):
+				pk = tuple(pk)
+			if self._pendingFetch:
+				# Look through the rows as they are fetched, instead of fetching
+				# all of them to build the index.
+				records = self.__records
+				pkExpression = self.pkExpression
+				row = 0
+				while row < len(records) or self._pendingFetch:
+					self._fetchRows(row)
+					if row >= len(records):
+						break
+					rec = records[row]
+					if pkExpression(rec) == pk:
+						return (row, rec)
+					row += 1
+			row = self._getPKIndex().get(pk)
+			if row is not None:
+				rec = self._records[row]
+				if self.pkExpression(rec) != pk:
+					# The record was changed behind our back; start over.
+					self._clearPKIndex()
+					row = self._getPKIndex().get(pk)
+					if row is not None:
+						rec = self._records[row]
+			if row is not None:
+				return (row, rec)
 		if raiseRowNotFound:
 			tbl, rc = self.Table, self.RowCount
 			raise dException.RowNotFoundException(_("PK '%(pk)s' not found in table '%(tbl)s' (RowCount: %(rc)s)") % locals())
@@ -2067,8 +3193,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def hasPK(self, pk):
 		"""Return True if the passed pk is present in the dataset."""
-		kf = self.KeyField
-		return bool([v[kf] for v in self._records if v[kf] == pk])
+		row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+		return row is not None
 
 
 	def moveToPK(self, pk):
@@ -2165,22 +3291,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if badflds:
 			raise dException.FieldNotFoundException(_("Non-existent field(s) '%s'") % ", ".join(badflds))
 
-		# Copy the specified field vals and their row numbers to a list, and
-		# add those lists to the sort list
-		sortList = []
-		for row in xrange(0, self.RowCount):
-			if simpleKey:
-				rowval = self.getFieldVal(fld, row=row)
-			else:
-				rowval = tuple([self.getFieldVal(f, row=row) for f in flds])
-			sortList.append([rowval, row])
-
 		if simpleKey:
 			# Determine if we are seeking string values
-			field_type = self._types.get(fld, type(sortList[0][0]))
+			try:
+				field_type = self._types[fld]
+			except KeyError:
+				field_type = type(self.getFieldVal(fld, row=0))
 			compString = issubclass(field_type, basestring)
 		else:
 			compString = False
+			if isinstance(val, list):
+				val = tuple(val)
 
 		if simpleKey and not compString:
 			# coerce val to be the same type as the field type
@@ -2202,20 +3323,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				except ValueError:
 					val = float(0)
 
-		if sort:
-			if compString and not caseSensitive:
-				sortList.sort(key=caseInsensitiveSortKey)
-			else:
-				sortList.sort()
-
-		if compString and not caseSensitive:
-			# Change all of the first elements to lower case
-			def safeLower(val):
-				try:
-					return val.lower()
-				except AttributeError:
-					return val
-			searchList = [safeLower(first) for first, second in sortList]
+		foldCase = compString and not caseSensitive
+		if foldCase:
 			try:
 				matchVal = val.lower()
 			except AttributeError:
@@ -2223,40 +3332,145 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				matchVal = val
 		else:
 			matchVal = val
-			searchList = [first for first, second in sortList]
+
+		if sort:
+			ret = self._seekSorted(tuple(flds), caseSensitive, foldCase, matchVal,
+					near, incremental)
+		else:
+			ret = self._seekUnsorted(flds, simpleKey, foldCase, matchVal,
+					near, incremental)
+
+		if movePointer and ret > -1:
+			# Move the record pointer
+			self.RowNumber = ret
+		return ret
+
+
+	def _getSeekIndex(self, flds, caseSensitive, foldCase):
+		"""
+		Return a (keys, rows) tuple used by seek() to search the passed fields:
+		'keys' holds the field values in ascending order (lowercased when
+		'foldCase' is True), and 'rows' holds the corresponding row numbers.
+
+		Indexes on real fields are cached per (fields, caseSensitive), and are
+		discarded when one of their fields is changed or the data set is replaced.
+		Indexes involving VirtualFields are rebuilt on every call, since there is
+		no way to know when their values change.
+		"""
+		records = self._records
+		if self._seekIndexRecords is not records:
+			self._seekIndexes = {}
+			self._seekIndexRecords = records
+		idxKey = (flds, caseSensitive)
+		try:
+			return self._seekIndexes[idxKey]
+		except KeyError:
+			pass
+		getFieldVal = self.getFieldVal
+		rowRange = xrange(len(records))
+		if len(flds) == 1:
+			fld = flds[0]
+			vals = [(getFieldVal(fld, row=row), row) for row in rowRange]
+		else:
+			vals = [(tuple([getFieldVal(fld, row=row) for fld in flds]), row)
+					for row in rowRange]
+		if foldCase:
+			vals = [((val or "").lower(), row) for val, row in vals]
+		vals.sort()
+		ret = ([val for val, row in vals], [row for val, row in vals])
+		if not [fld for fld in flds if fld in self.VirtualFields]:
+			self._seekIndexes[idxKey] = ret
+		return ret
+
+
+	def _clearSeekIndexes(self, fld=None):
+		"""
+		Discard the cached seek indexes that involve the passed field, or all
+		of them if no field is passed.
+		"""
+		if fld is None:
+			self._seekIndexes = {}
+			return
+		for idxKey in self._seekIndexes.keys():
+			if fld in idxKey[0]:
+				del self._seekIndexes[idxKey]
+
+
+	def _seekSorted(self, flds, caseSensitive, foldCase, matchVal, near, incremental):
+		"""Binary search of the seek index on flds; used by seek()."""
+		keys, rows = self._getSeekIndex(flds, caseSensitive, foldCase)
+		if foldCase:
+			matchKey = matchVal or ""
+		else:
+			matchKey = matchVal
+		numKeys = len(keys)
+		pos = bisect.bisect_left(keys, matchKey)
+		if pos < numKeys and keys[pos] == matchKey:
+			# Exact match; ties are ordered by row, so this is the first one.
+			return rows[pos]
+		if not near:
+			return -1
+		if not incremental:
+			# The first row greater than the match value
+			try:
+				return rows[pos]
+			except IndexError:
+				return numKeys - 1
+		# Match the next string only taking into account the first characters
+		# up to the length of matchStr (so that seeking for 'AB' will bring up
+		# 'AB-PC' instead of 'FW-PC'. All values sharing that prefix sort
+		# immediately after the prefix itself.
+		if isinstance(matchKey, basestring):
+			if pos < numKeys and isinstance(keys[pos], basestring) \
+					and keys[pos].startswith(matchKey):
+				return rows[pos]
+		else:
+			pos = bisect.bisect_right(keys, matchKey)
+			if pos < numKeys:
+				return rows[pos]
+		return numKeys - 1
+
+
+	def _seekUnsorted(self, flds, simpleKey, foldCase, matchVal, near, incremental):
+		"""Linear search in row order; used by seek() when sort is False."""
+		if simpleKey:
+			fld = flds[0]
+			searchList = [self.getFieldVal(fld, row=row)
+					for row in xrange(0, self.RowCount)]
+		else:
+			searchList = [tuple([self.getFieldVal(f, row=row) for f in flds])
+					for row in xrange(0, self.RowCount)]
+		if foldCase:
+			# Change all of the values to lower case
+			def safeLower(val):
+				try:
+					return val.lower()
+				except AttributeError:
+					return val
+			searchList = [safeLower(first) for first in searchList]
 
 		# See if we have an exact match before we look for 'near' values
 		try:
-			idx = searchList.index(matchVal)
-			ret = sortList[idx][1]
+			return searchList.index(matchVal)
 		except ValueError:
-			if near:
-				if incremental:
-					# Match the next string only taking into account the first characters
-					# up to the length of matchStr (so that seeking for 'AB' will bring up
-					# 'AB-PC' instead of 'FW-PC'.
-
-					ret = len(sortList) - 1
-					for idx, testVal in enumerate(searchList):
-						if isinstance(testVal, basestring) and isinstance(matchVal, basestring):
-							if len(testVal) >= len(matchVal) and testVal[:len(matchVal)] == matchVal:
-								ret = sortList[idx][1]
-								break
-						elif not isinstance(matchVal, basestring) and testVal > matchVal:
+			pass
+		ret = -1
+		if near:
+			if incremental:
+				ret = len(searchList) - 1
+				for idx, testVal in enumerate(searchList):
+					if isinstance(testVal, basestring) and isinstance(matchVal, basestring):
+						if len(testVal) >= len(matchVal) and testVal[:len(matchVal)] == matchVal:
 							ret = idx
 							break
-				else:
-					# Find the first row greater than the match value
-					numSmaller = len([testVal for testVal in searchList
-							if testVal < matchVal])
-					try:
-						ret = sortList[numSmaller][1]
-					except IndexError:
-						ret = len(sortList) - 1
-
-		if movePointer and ret > -1:
-			# Move the record pointer
-			self.RowNumber = ret
+					elif not isinstance(matchVal, basestring) and testVal > matchVal:
+						ret = idx
+						break
+			else:
+				# Find the first row greater than the match value
+				numSmaller = len([testVal for testVal in searchList
+						if testVal < matchVal])
+				ret = min(numSmaller, len(searchList) - 1)
 		return ret
 
 
@@ -2291,29 +3505,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		bo = self.BackendObject
 		tblPrefix = bo.getWhereTablePrefix(self.Table,
 					autoQuote=self.AutoQuoteNames)
-		if not row:
-			row = self.RowNumber
-		rec = self._records[row]
-
-		if self._compoundKey:
-			keyFields = [fld for fld in self.KeyField]
-		else:
-			keyFields = [self.KeyField]
-		recKey = self.pkExpression(rec)
-		mem = self._mementos.get(recKey, {})
-
-		def getPkVal(fld):
-			try:
-				return mem[fld]
-			except KeyError:
-				return rec[fld]
-
 		ret = []
-		for fld in keyFields:
+		for fld, pkVal in self._getStoredPkVals(row):
 			fldSafe = bo.encloseNames(fld, self.AutoQuoteNames)
 			if ret:
 				ret.append(" AND ")
-			pkVal = getPkVal(fld)
 			if isinstance(pkVal, basestring):
 				ret.extend([tblPrefix, fldSafe, "='", pkVal.encode(self.Encoding), "' "])
 			elif isinstance(pkVal, (datetime.date, datetime.datetime)):
@@ -2323,6 +3519,49 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return "".join(ret)
 
 
+	def _makePkWhereParams(self, row=None):
+		"""
+		Like makePkWhere(), but with parameter placeholders instead of the
+		values. Returns a 2-tuple of the clause and the parameter values.
+		"""
+		if not self.KeyField:
+			# Cannot update without a KeyField
+			return ("1 = 0", ())
+		bo = self.BackendObject
+		aq = self.AutoQuoteNames
+		tblPrefix = bo.getWhereTablePrefix(self.Table, autoQuote=aq)
+		retSql = []
+		retParams = []
+		for fld, pkVal in self._getStoredPkVals(row):
+			retSql.append("%s%s = %s" % (tblPrefix, bo.encloseNames(fld, aq),
+					self.ParamPlaceholder))
+			retParams.append(pkVal)
+		return (" AND ".join(retSql), tuple(retParams))
+
+
+	def _getStoredPkVals(self, row=None):
+		"""
+		Returns a list of (field, value) for the key fields of the passed row, or
+		of the current row. These are the values stored in the database, which
+		differ from the current ones if the key of the record was changed.
+		"""
+		if row is None:
+			row = self.RowNumber
+		rec = self._records[row]
+		if self._compoundKey:
+			keyFields = [fld for fld in self.KeyField]
+		else:
+			keyFields = [self.KeyField]
+		mem = self._mementos.get(self.pkExpression(rec), {})
+		ret = []
+		for fld in keyFields:
+			try:
+				ret.append((fld, mem[fld]))
+			except KeyError:
+				ret.append((fld, rec[fld]))
+		return ret
+
+
 	def makeUpdClause(self, diff):
 		"""
 		Create the 'set field=val' section of the Update statement. Return a 2-tuple
@@ -2353,7 +3592,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 
 	def processFields(self, txt):
-		return self.BackendObject.processFields(txt)
+		# Requeries run the same statement again and again.
+		cached = self._processedFields
+		if cached is not None and cached[0] == txt:
+			return cached[1]
+		ret = self.BackendObject.processFields(txt)
+		self._processedFields = (txt, ret)
+		return ret
 
 
 	def escQuote(self, val):
@@ -2388,13 +3633,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if tableName is None:
 			# Use the default
 			tableName = self.Table
-		key = "%s:::%s" % (tableName, self.CurrentSQL)
-		try:
-			return self._fieldStructure[key]
-		except KeyError:
-			flds = self.BackendObject.getFields(tableName, self.AuxCursor)
-			self._fieldStructure[key] = flds
-			return flds
+		bo = self.BackendObject
+		return bo.MetadataCache.getOrCreate("fields", tableName,
+				lambda: bo.getFields(tableName, self.AuxCursor))
 
 
 	def getFieldInfoFromDescription(self):
@@ -2452,6 +3693,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def commitTransaction(self):
 		"""Commit a SQL transaction."""
 		ret = None
+		# Some backends discard the pending rows of a query on commit.
+		self._fetchRows()
 		if self.BackendObject:
 			ret = self.BackendObject.commitTransaction(self.AuxCursor)
 		return ret
@@ -2460,6 +3703,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def rollbackTransaction(self):
 		"""Roll back (revert) a SQL transaction."""
 		ret = None
+		# Some backends discard the pending rows of a query on rollback.
+		self._fetchRows()
 		if self.BackendObject:
 			ret = self.BackendObject.rollbackTransaction(self.AuxCursor)
 		return ret
@@ -2468,16 +3713,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def createTable(self, tabledef):
 		"""Create a table based on the table definition."""
 		self.BackendObject.createJustTable(tabledef, self)
+		self.BackendObject.clearMetadataCache(tabledef.Name)
 
 
 	def createIndexes(self, tabledef):
 		"""Create indexes based on the table definition."""
 		self.BackendObject.createJustIndexes(tabledef, self)
+		self.BackendObject.clearMetadataCache(tabledef.Name)
 
 
 	def createTableAndIndexes(self, tabledef):
 		"""Create a table and its indexes based on the table definition."""
 		self.BackendObject.createTableAndIndexes(tabledef, self)
+		self.BackendObject.clearMetadataCache(tabledef.Name)
 
 
 	###     SQL Builder methods     ########
@@ -2710,6 +3958,104 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return ret
 
 
+	def nextPage(self):
+		"""
+		Replace the data set with the next PageSize rows of the query, in the
+		order of the order-by clause followed by the KeyField. They are found by
+		comparing those columns with the values of the last row, instead of by
+		skipping rows, so getting a page costs the same at any depth. Returns
+		False, keeping the current rows, if there are no more rows, or if
+		UserSQL is set, which isn't paged.
+		"""
+		return self._requeryPage(True)
+
+
+	def previousPage(self):
+		"""
+		Replace the data set with the PageSize rows of the query before the
+		first current row. Returns False, keeping the current rows, if there
+		are no rows before them. See nextPage().
+		"""
+		return self._requeryPage(False)
+
+
+	def _requeryPage(self, forward):
+		keyset = self._getKeyset(forward)
+		if keyset is None:
+			return False
+		self._pendingKeyset = keyset
+		self.requery(self.lastParams)
+		return self._pageFound
+
+
+	def _getKeysetColumns(self):
+		"""
+		Return the list of (expression, field name, descending) tuples for the
+		columns that order the pages: those of the order-by clause, followed by
+		the key fields that aren't part of it.
+		"""
+		bo = self.BackendObject
+		quoteChars = bo.nameEnclosureChar + "`[]"
+		ret = []
+		for part in self.sqlManager._orderByClause.split(","):
+			words = part.split()
+			if not words:
+				continue
+			desc = False
+			if words[-1].lower() in ("asc", "desc"):
+				desc = (words.pop().lower() == "desc")
+			exp = " ".join(words)
+			ret.append((exp, exp.split(".")[-1].strip(quoteChars), desc))
+		kf = self.KeyField
+		if not isinstance(kf, tuple):
+			kf = (kf,)
+		orderFields = [fld for exp, fld, desc in ret]
+		for fld in kf:
+			if fld in orderFields:
+				continue
+			exp = fld
+			if self.sqlManager._joinClause:
+				exp = "%s.%s" % (self.Table, fld)
+			ret.append((bo.encloseNames(exp, self.AutoQuoteNames), fld, False))
+		return ret
+
+
+	def _getKeysetOrderBy(self, reverse=False):
+		"""Return the order-by clause used when paging."""
+		return ", ".join(["%s %s" % (exp, "desc" if desc != reverse else "asc")
+				for exp, fld, desc in self._getKeysetColumns()])
+
+
+	def _getKeyset(self, forward):
+		"""
+		Return the (where clause, params, reverse) tuple that selects the rows
+		after the last row, or before the first row, in the paging order; or
+		None if there are no rows, or if UserSQL is set, as paging builds on
+		the SQL clauses and has no effect on UserSQL.
+		"""
+		if not self._pageSize:
+			raise dException.dException(_("PageSize must be set to query pages."))
+		if self.UserSQL or self.RowCount < 1:
+			return None
+		rec = self._records[-1 if forward else 0]
+		cols = self._getKeysetColumns()
+		ph = self.ParamPlaceholder
+		terms = []
+		params = []
+		for idx, (exp, fld, desc) in enumerate(cols):
+			conds = ["%s = %s" % (prevExp, ph) for prevExp, prevFld, prevDesc in cols[:idx]]
+			conds.append("%s %s %s" % (exp, ">" if forward != desc else "<", ph))
+			terms.append("(%s)" % " and ".join(conds))
+			for prevExp, prevFld, prevDesc in cols[:idx + 1]:
+				try:
+					params.append(rec[prevFld])
+				except KeyError:
+					raise dException.FieldNotFoundException(
+							_("The order-by column '%s' must be in the field list to query pages.")
+							% prevFld)
+		return (" or ".join(terms), tuple(params), not forward)
+
+
 	def getLimitPosition(self):
 		"""
 		Return the position to place the limit clause.
@@ -2725,14 +4071,60 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def getSQL(self, ignoreChildFilter=False):
 		"""Get the complete SQL statement from all the parts."""
-		fieldClause = self.sqlManager._fieldClause
-		fromClause = self.sqlManager._fromClause
-		joinClause = self.sqlManager._joinClause
-		whereClause = self.sqlManager._whereClause
-		childFilterClause = self.sqlManager._childFilterClause
-		groupByClause = self.sqlManager._groupByClause
-		orderByClause = self.sqlManager._orderByClause
-		limitClause = self.sqlManager._limitClause
+		return self._getComposedSQL(ignoreChildFilter=ignoreChildFilter)
+
+
+	def _getComposedSQL(self, ignoreChildFilter=False, structureOnly=False):
+		"""
+		Return the SQL composed from the clauses of the sqlManager, composing
+		it again only if anything it depends on has changed since the last
+		time. If structureOnly is True, the where clause is left out and the
+		limit is 1, so that no records are returned.
+		"""
+		sm = self.sqlManager
+		keyset = self._pendingKeyset
+		paging = bool(self._pageSize and not structureOnly and self.KeyField)
+		if structureOnly:
+			# The where clause doesn't matter.
+			versions = sm._clauseVersions
+			clausesKey = tuple([versions.get(nm, 0) for nm in ("_fieldClause",
+					"_fromClause", "_joinClause", "_groupByClause", "_orderByClause")])
+		else:
+			clausesKey = sm._sqlVersion
+		if paging:
+			pagingKey = (self._pageSize, self.KeyField, self.AutoQuoteNames,
+					self.BackendObject, keyset)
+		else:
+			pagingKey = None
+		key = (sm, clausesKey, sm.BackendObject, sm.Table, self.Table, self._isMM,
+				pagingKey)
+		kind = (ignoreChildFilter, structureOnly)
+		cached = self._composedSQL.get(kind)
+		if cached is not None and cached[0] == key:
+			return cached[1]
+
+		fieldClause = sm._fieldClause
+		fromClause = sm._fromClause
+		joinClause = sm._joinClause
+		whereClause = sm._whereClause
+		childFilterClause = sm._childFilterClause
+		groupByClause = sm._groupByClause
+		orderByClause = sm._orderByClause
+		limitClause = sm._limitClause
+		if structureOnly:
+			whereClause = ""
+			limitClause = 1
+		if paging:
+			# Get a page of rows in a well defined order.
+			keyset = self._pendingKeyset
+			reverse = keyset is not None and keyset[2]
+			orderByClause = self._getKeysetOrderBy(reverse)
+			limitClause = self._pageSize
+			if keyset:
+				if whereClause:
+					whereClause = "(%s) and (%s)" % (whereClause, keyset[0])
+				else:
+					whereClause = keyset[0]
 
 		if not fieldClause:
 			fieldClause = "*"
@@ -2768,20 +4160,15 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		else:
 			limitClause = " %s %s" % (self.sqlManager.getLimitWord(), self.sqlManager._defaultLimit)
 
-		return self.sqlManager.BackendObject.formSQL(fieldClause, fromClause, joinClause,
+		ret = sm.BackendObject.formSQL(fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause)
+		self._composedSQL[kind] = (key, ret)
+		return ret
 
 
 	def getStructureOnlySql(self):
 		"""Creates a SQL statement that will not return any records."""
-		holdWhere = self.sqlManager._whereClause
-		self.sqlManager.setWhereClause("")
-		holdLimit = self.sqlManager._limitClause
-		self.sqlManager.setLimitClause(1)
-		ret = self.sqlManager.getSQL(ignoreChildFilter=True)
-		self.sqlManager.setWhereClause(holdWhere)
-		self.sqlManager.setLimitClause(holdLimit)
-		return ret
+		return self.sqlManager._getComposedSQL(ignoreChildFilter=True, structureOnly=True)
 
 
 	def executeSQL(self, *args, **kwargs):
@@ -2884,6 +4271,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self.__auxCursor.__backend = obj
 
 
+	def _getColumnarStorage(self):
+		return self._columnarStorage
+
+	def _setColumnarStorage(self, val):
+		val = bool(val)
+		if val != self._columnarStorage:
+			self._columnarStorage = val
+			if self._records:
+				self._records = self._makeRecordSet(self._records)
+
+
 	def _getCurrentSQL(self):
 		if self.UserSQL:
 			return self.UserSQL
@@ -2947,6 +4345,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			val[idx] = (field_alias, field_type, field_pk, table_name, field_name, field_scale)
 			self._types[field_name] = dabo.db.getPythonType(field_type)
 		self._dataStructure = self.AuxCursor._dataStructure = tuple(val)
+		self._clearConversionPlan()
 
 
 	def _getEncoding(self):
@@ -2956,6 +4355,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self.BackendObject.Encoding = val
 
 
+	def _getFetchWindowSize(self):
+		return self._fetchWindowSize
+
+	def _setFetchWindowSize(self, val):
+		self._fetchWindowSize = max(0, int(val or 0))
+
+
 	def _getIsAdding(self):
 		"""Return True if the current record is a new record."""
 		if self.RowCount <= 0:
@@ -2986,6 +4392,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self._compoundKey = False
 		self.AuxCursor._keyField = self._keyField
 		self.AuxCursor._compoundKey = self._compoundKey
+		self._clearPKIndex()
 		self._keyFieldSet = self.AuxCursor._keyFieldSet = (self._hasValidKeyField)
 
 
@@ -2997,6 +4404,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return v
 
 
+	def _getPageSize(self):
+		return self._pageSize
+
+	def _setPageSize(self, val):
+		self._pageSize = val or 0
+
+
 	def _getParamPlaceholder(self):
 		if self._paramPlaceholder:
 			ret = self._paramPlaceholder
@@ -3013,7 +4427,57 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return ret
 
 
+	def _getMementos(self):
+		return self.__mementos
+
+	def _setMementos(self, val):
+		self.__mementos = _ChangeDict(self, val)
+		self._onChangeStateChanged()
+
+
+	def _getNewRecords(self):
+		return self.__newRecords
+
+	def _setNewRecords(self, val):
+		self.__newRecords = _ChangeDict(self, val)
+		self._onChangeStateChanged()
+
+
+	def _onChangeStateChanged(self):
+		"""
+		Called when the cursor gets its first change or new record, or loses
+		its last one. Lets the bizobj update its count of changed cursors.
+		"""
+		biz = self._bizobj
+		if biz is not None:
+			biz._onCursorChangeStateChanged(self)
+
+
+	def _getRecords(self):
+		if self._pendingFetch:
+			# Code that works with the whole data set needs all the rows.
+			self._fetchRows()
+		return self.__records
+
+	def _setRecords(self, val):
+		self._pendingFetch = False
+		self.__records = val
+		self._virtualFieldCache = {}
+
+
+	def _getResultCacheInterval(self):
+		return self._resultCacheInterval
+
+	def _setResultCacheInterval(self, val):
+		self._resultCacheInterval = val
+
+
 	def _getRowCount(self):
+		if self._pendingFetch:
+			if self._windowRowCount is None:
+				self._windowRowCount = self._countWindowRows()
+			if self._pendingFetch and self._windowRowCount is not None:
+				return self._windowRowCount
 		try:
 			ret = len(self._records)
 		except AttributeError:
@@ -3065,6 +4529,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def _setVirtualFields(self, val):
 		assert isinstance(val, dict)
 		self._virtualFields = val
+		self._virtualFieldCache = {}
 
 
 	AutoPopulatePK = property(_getAutoPopulatePK, _setAutoPopulatePK, None,
@@ -3084,6 +4549,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	BackendObject = property(_getBackendObject, _setBackendObject, None,
 			_("Returns a reference to the object defining backend-specific behavior (dBackend)"))
 
+	ColumnarStorage = property(_getColumnarStorage, _setColumnarStorage, None,
+			_("""When True, the records are stored by column instead of as one dict
+			per record, which uses much less memory for large data sets. Records
+			are then accessed through lightweight views. Default=False  (bool)"""))
+
 	CurrentSQL = property(_getCurrentSQL, None, None,
 			_("Returns the current SQL that will be run, which is one of UserSQL or AutoSQL."))
 
@@ -3111,6 +4581,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	FieldDescription = property(_getDescrip, None, None,
 			_("Tuple of field names and types, as returned by the backend  (tuple)"))
 
+	FetchWindowSize = property(_getFetchWindowSize, _setFetchWindowSize, None,
+			_("""The number of rows to fetch at a time from the results of a query.
+			When set, requery() only fetches the first rows, and the rest are fetched
+			as they are needed, so that the first rows are available right away.
+			Anything that works with all the rows, such as sorting, filtering or
+			saving, fetches the rest of them. RowCount is determined with a count
+			query. Note that some backends discard the pending rows when a
+			transaction on the same connection is committed. Default=0, which
+			fetches all the rows at once  (int)"""))
+
 	IsAdding = property(_getIsAdding, None, None,
 			_("Returns True if the current record is new and unsaved"))
 
@@ -3125,6 +4605,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""Name of field that is the PK. If multiple fields make up the key,
 			separate the fields with commas. (str)"""))
 
+	PageSize = property(_getPageSize, _setPageSize, None,
+			_("""When set, requery() only gets the first PageSize rows of the query built
+			from the SQL clauses, ordered by the order-by clause and the KeyField,
+			and nextPage() and previousPage() get the rows next to them. Default=0,
+			which doesn't page the rows  (int)"""))
+
 	ParamPlaceholder = property(_getParamPlaceholder, None, None,
 			_("""The character(s) used to indicate a parameter in an SQL statement.
 			This can be different for different backend systems. Read-only.  (str)"""))
@@ -3133,6 +4619,14 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""Represents a record in the data set. You can address individual
 			columns by referring to 'self.Record.fieldName' (read-only) (no type)"""))
 
+	ResultCacheInterval = property(_getResultCacheInterval, _setResultCacheInterval, None,
+			_("""The number of seconds that the results of a select run by this cursor
+			may be reused from the result cache of the connection when the same SQL
+			is run with the same parameters. Cached results are dropped as soon as a
+			cursor on the connection changes one of the tables they were read from.
+			Results aren't cached when FetchWindowSize is set. Default=None, which
+			disables the cache  (int)"""))
+
 	RowNumber = property(_getRowNumber, _setRowNumber, None,
 			_("Current row in the recordset."))
 
@@ -3153,4 +4647,25 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 			The common use is to assign a bare function to a virtual field, but you can
 			also specify args and kwargs by assigning a dict with 'func', 'args' and
-			'kwargs' keys."""))
+			'kwargs' keys.
+
+			The dict can also have a 'depends_on' key, holding the names of the real
+			fields that the value is computed from. The values of such a virtual field
+			are memoized per record, and recomputed only after one of these fields is
+			changed, or the data set is requeried. A 'batch_func' key can hold a
+			function that receives a list of records and returns the list of their
+			values, which getDataSet() and getVirtualFieldValues() use to compute a
+			whole column with one call."""))
+
+
+	_mementos = property(_getMementos, _setMementos, None,
+			_("""The original values of the changed fields, as {pk: {field: value}}.
+			The bizobj is notified when it goes from empty to not empty, or back.  (dict)"""))
+
+	_newRecords = property(_getNewRecords, _setNewRecords, None,
+			_("""The keys of the unsaved new records, as {pk: None}. The bizobj is
+			notified when it goes from empty to not empty, or back.  (dict)"""))
+
+	_records = property(_getRecords, _setRecords, None,
+			_("""The data set holding the records of the cursor. Any rows of a windowed
+			query that haven't been fetched yet are fetched first.  (data set)"""))
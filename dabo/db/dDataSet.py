@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import sys
 import re
+import bisect
 import operator
 import datetime
 import hashlib
@@ -22,37 +23,170 @@ pysqlite2: http://initd.org/tracker/pysqlite
 
 """
 		sys.exit(msg)
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 import dabo
 from dabo.dLocalize import _
 from dabo.lib.utils import ustr
 
 
+# The NumPy type and the value that stands in for NULLs, for each Dabo type.
+_arrayTypes = {
+		"I": ("int64", 0),
+		"G": ("int64", 0),
+		"F": ("float64", 0.0),
+		"N": ("float64", 0.0),
+		"B": ("bool", False),
+		"D": ("datetime64[D]", None),
+		"T": ("datetime64[us]", None),
+		}
 
-class dDataSet(tuple):
-	""" This class assumes that its contents are not ordinary tuples, but
-	rather tuples consisting of dicts, where the dict keys are field names.
-	This is the data structure returned by the dCursorMixin class.
 
-	It is used to give these data sets the ability to be queried, joined, etc.
-	This is accomplished by using SQLite in-memory databases. If SQLite
-	and pysqlite2 are not installed on the machine this is run on, a
-	warning message will be printed out and the SQL functions will return
-	None. The data will still be usable, though.
+def _makeArray(values, typ):
 	"""
-	def __init__(self, sequence=None):
-		# Note that as immutable objects, tuples are created with __new__,
-		# so we must not pass the argument to the __init__ method of tuple.
-		super(dDataSet, self).__init__()
+	Return a NumPy array of the passed list of values of the passed Dabo type,
+	or a masked array with the None values masked if there are any.
+	"""
+	mask = [val is None for val in values]
+	hasNulls = True in mask
+	if typ is None:
+		# Use the type of the first value that isn't NULL.
+		for val in values:
+			if val is not None:
+				typ = dabo.db.getDaboType(type(val))
+				break
+	dtype, fill = _arrayTypes.get(typ, (object, None))
+	if hasNulls and fill is not None:
+		values = [fill if val is None else val for val in values]
+	try:
+		ret = numpy.array(values, dtype=dtype)
+	except (TypeError, ValueError):
+		# Values that don't match the type, such as strings in a date column.
+		ret = numpy.array(values, dtype=object)
+	if hasNulls:
+		ret = numpy.ma.masked_array(ret, mask=mask)
+	return ret
+
+
+
+class _RowIndex(object):
+	"""
+	Maps keys to the row numbers of a sequence, and stays valid when rows are
+	removed from it: instead of renumbering all the rows after the removed
+	one, the removed rows are remembered, and the row stored for a key is
+	shifted by the number of removed rows before it when it is looked up.
+	The row numbers passed in and returned are always the current ones.
+	"""
+	def __init__(self, rows=None):
+		# Key -> row, numbered as the rows were before any was removed.
+		self._rows = rows if rows is not None else {}
+		# The removed rows, sorted, numbered the same way.
+		self._removed = []
+
+
+	def __contains__(self, key):
+		return key in self._rows
+
+
+	def __len__(self):
+		return len(self._rows)
+
+
+	def __getitem__(self, key):
+		row = self.get(key)
+		if row is None:
+			raise KeyError(key)
+		return row
+
+
+	def __setitem__(self, key, row):
+		self._rows[key] = self._baseRow(row)
+
+
+	def __delitem__(self, key):
+		del self._rows[key]
+
+
+	def get(self, key, default=None):
+		"""Return the current row of the passed key, or the default."""
+		base = self._rows.get(key)
+		if base is None:
+			return default
+		return base - bisect.bisect_left(self._removed, base)
+
+
+	def removeRow(self, row):
+		"""
+		Record that the passed row was removed, so that the rows after it are
+		one lower. The key of the removed row, if any, must be deleted first.
+		"""
+		bisect.insort(self._removed, self._baseRow(row))
+
+
+	def _baseRow(self, row):
+		"""Convert a current row number to the numbering of the stored ones."""
+		removed = self._removed
+		if not removed:
+			return row
+		# The lowest base row that isn't removed and has row rows before it.
+		lo, hi = row, row + len(removed)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if mid - bisect.bisect_right(removed, mid) < row:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+
+
+class dDataSetMixin(object):
+	"""
+	Provides the querying, filtering and sorting behavior shared by dDataSet
+	and dMutableDataSet. Classes using it must also inherit from a sequence
+	type holding the record dicts, and must call _initDataSet() on creation.
+
+	The SQLite tables that execute() runs its queries against are kept in
+	sync with the records incrementally. Changes made through the methods of
+	the data set are tracked; code that changes the values of the records
+	directly must call markChanged() so that the next query sees them.
+	"""
+	# False for data sets whose records can change without them knowing.
+	# Their contents are compared with those of their SQLite table instead,
+	# and the table is reloaded when they differ.
+	_trackChanges = True
+	# The number of changed rows that can be logged regardless of the size
+	# of the data set.
+	_changeLogSize = 1000
+
+	def _initDataSet(self):
 		self._connection = None
 		self._cursor = None
 		self._bizobj = None
-		self._populated = False
 		self._typeStructure = {}
 		# We may need to encode fields that are not legal names.
 		self.fieldAliases = {}
-		# Keep a hash value to tell if we need to re-populate
-		self._dataHash = ""
+		# The number of changes made through this data set, and through all
+		# the data sets sharing its records, such as the ones it was filtered
+		# from; the latter list is shared by all of them.
+		self._version = 0
+		self._sharedChanges = [0]
+		# The rows changed or appended since version _changeLogStart.
+		self._changedRows = []
+		self._changeLogStart = 0
+		# The _RowIndex mapping the record keys to their rows, as of _version,
+		# used to find the records that a filtered data set removes from it.
+		self._positions = None
+		self._positionsVersion = None
+		# Alias -> [data set, field names, version, shared changes, position in
+		# its _changedRows, hash of the contents] of each SQLite table filled
+		# by _populate(), as of the last time it was brought up to date. The
+		# version is None when a statement changed the table. The hash is only
+		# kept for the data sets that don't track their changes.
+		self._mirrors = {}
 
 		sqlite.register_adapter(Decimal, self._adapt_decimal)
 		# When filtering datasets, we need a reference to the dataset
@@ -75,14 +209,6 @@ class dDataSet(tuple):
 			self._connection.close()
 
 
-	def __add__(self, *args, **kwargs):
-		return dDataSet(super(dDataSet, self).__add__(*args, **kwargs))
-
-
-	def __mul__(self, *args, **kwargs):
-		return dDataSet(super(dDataSet, self).__mul__(*args, **kwargs))
-
-
 	@staticmethod
 	def _adapt_decimal(decVal):
 		"""Converts the decimal value to a string for storage"""
@@ -105,6 +231,124 @@ class dDataSet(tuple):
 		return None
 
 
+	def markChanged(self, rows=None):
+		"""
+		Record that the records at the passed rows, or all of them if rows is
+		None, were changed or appended. Only needed after changing the values
+		of the records directly, instead of through the data set or its cursor.
+		"""
+		self._version += 1
+		self._sharedChanges[0] += 1
+		if rows is not None:
+			self._changedRows.extend(rows)
+			if len(self._changedRows) <= max(2 * len(self), self._changeLogSize):
+				return
+		# Past that point, reloading the whole table is about as fast.
+		self._changedRows = []
+		self._changeLogStart = self._version
+
+
+	def _getPositions(self):
+		"""
+		Return the _RowIndex of the keys of the records, building it first if
+		the data set was changed since. Returns None if a key appears twice.
+		"""
+		if self._positionsVersion != self._version:
+			rows = {}
+			for row, key in enumerate(self._rowKeys()):
+				rows.setdefault(key, row)
+			self._positions = _RowIndex(rows) if len(rows) == len(self) else None
+			self._positionsVersion = self._version
+		return self._positions
+
+
+	def _keptPositions(self):
+		"""
+		Return the _RowIndex of the record keys if it is up to date, so that a
+		change about to be made can update it instead of having it rebuilt.
+		"""
+		if self._positionsVersion == self._version:
+			return self._positions
+		return None
+
+
+	def _addPositions(self, positions, keys):
+		"""
+		Update the _RowIndex returned by _keptPositions() before the records
+		with the passed keys were appended.
+		"""
+		if positions is None:
+			return
+		for row, key in enumerate(keys, len(self) - len(keys)):
+			if key in positions:
+				# The record is in the data set twice now.
+				return
+			positions[key] = row
+		self._positions = positions
+		self._positionsVersion = self._version
+
+
+	def _removePosition(self, positions, key, row):
+		"""
+		Update the _RowIndex returned by _keptPositions() before the record
+		with the passed key was removed from the passed row.
+		"""
+		if positions is None:
+			return
+		del positions[key]
+		positions.removeRow(row)
+		self._positions = positions
+		self._positionsVersion = self._version
+
+
+	def getMemoryUsage(self):
+		"""
+		Returns a dict with the number of rows ('rows'), and the approximate
+		number of bytes used to hold them, in total ('bytes') and per row
+		('bytesPerRow'). Objects shared between records are counted once.
+		"""
+		ret = sys.getsizeof(self)
+		seen = set()
+		for rec in self:
+			ret += sys.getsizeof(rec)
+			for key, val in rec.iteritems():
+				for obj in (key, val):
+					if id(obj) not in seen:
+						seen.add(id(obj))
+						ret += sys.getsizeof(obj)
+		numRows = len(self)
+		return {"rows": numRows, "bytes": ret,
+				"bytesPerRow": float(ret) / numRows if numRows else 0.0}
+
+
+	def toArrays(self, fields=None):
+		"""
+		Returns a dict of NumPy arrays holding the values of the passed fields,
+		or of all the fields but the internal ones, with one entry per record.
+
+		The type of each array comes from TypeStructure, or from the values:
+		int and float arrays for numbers (including decimals), datetime64 for
+		dates and datetimes, bool for logical fields and object arrays for
+		text and anything else. If a field has NULL values, its array is a
+		masked array with those values masked. Requires NumPy.
+		"""
+		if numpy is None:
+			raise ImportError(_("NumPy is not installed, so toArrays() can't be used."))
+		if fields is None:
+			fields = [fld for fld in self[0] if not fld.startswith("dabo-")] if self else []
+		columns = [[] for fld in fields]
+		appenders = zip(fields, [col.append for col in columns])
+		for rec in self:
+			for fld, append in appenders:
+				append(rec[fld])
+		types = self._typeStructure
+		ret = {}
+		for fld, col in zip(fields, columns):
+			typ = types.get(fld)
+			ret[fld] = _makeArray(col, typ[0] if typ else None)
+		return ret
+
+
 	def replace(self, field, valOrExpr, scope=None):
 		"""Replaces the value of the specified field with the given expression.
 
@@ -122,18 +366,20 @@ class dDataSet(tuple):
 				literal = False
 				valOrExpr = valOrExpr.replace("=", "", 1)
 			valOrExpr = self._fldReplace(valOrExpr, "rec")
+		changed = []
 		if literal:
-			upDict = {field: valOrExpr}
-			if scope is None:
-				[rec.update(upDict) for rec in self]
-			else:
-				[rec.update(upDict) for rec in self
-						if eval(scope)]
+			for row, rec in enumerate(self):
+				if scope is None or eval(scope):
+					rec[field] = valOrExpr
+					changed.append(row)
 		else:
 			# Need to go record-by-record so that the expression evaluates correctly
-			for rec in self:
-				if eval(scope):
+			for row, rec in enumerate(self):
+				if scope is None or eval(scope):
 					rec[field] = eval(valOrExpr)
+					changed.append(row)
+		if changed:
+			self.markChanged(changed)
 
 
 	def sort(self, col, ascdesc=None, caseSensitive=None):
@@ -199,6 +445,7 @@ class dDataSet(tuple):
 			filtered = [rec for rec in self if expr in (rec[fld] or "")]
 		ret = self.__class__(filtered)
 		ret._sourceDataSet = self
+		ret._sharedChanges = self._sharedChanges
 		ret._filtered_fld = fld
 		ret._filtered_expr = expr
 		ret._filtered_op = op
@@ -214,6 +461,7 @@ class dDataSet(tuple):
 		recs = eval(stmnt)
 		ret = self.__class__(recs)
 		ret._sourceDataSet = self
+		ret._sharedChanges = self._sharedChanges
 		return ret
 
 
@@ -296,40 +544,91 @@ class dDataSet(tuple):
 	def _populate(self, ds, alias=None):
 		"""This is the method that converts a Python dataset
 		into a SQLite table with the name specified by 'alias'.
+
+		If the table already holds the data set, only the rows that changed
+		since then are written to it again. Data sets that don't track their
+		changes are compared with the table by the hash of their contents.
 		"""
 		if alias is None:
 			# Use the default
 			alias = "dataset"
+		mirror = self._mirrors.get(alias)
+		contentHash = None
+		if not ds._trackChanges:
+			contentHash = hashlib.md5(ustr(ds)).hexdigest()
+			if (mirror is not None and mirror[0] is ds and mirror[2] is not None
+					and mirror[5] == contentHash):
+				# Data's already there and hasn't changed; no need to re-load it
+				return
+		elif mirror is not None and mirror[0] is ds:
+			dsVersion, shared, logPos = mirror[2:5]
+			if dsVersion == ds._version and shared == ds._sharedChanges[0]:
+				# Data's already there and hasn't changed; no need to re-load it
+				return
+			numRows = len(ds)
+			if (numRows and dsVersion is not None and dsVersion >= ds._changeLogStart
+					and ds._version - dsVersion == ds._sharedChanges[0] - shared):
+				# All the changes since then were made through the data set, so
+				# we know which rows they affected.
+				rows = sorted(set([row for row in ds._changedRows[logPos:]
+						if row < numRows]))
+				if set(ds[0]) == set(mirror[1]):
+					# The table still has the columns for the fields.
+					self._writeRows(ds, alias, mirror[1], rows, replace=True)
+					self._mirrors[alias] = [ds, mirror[1], ds._version,
+							ds._sharedChanges[0], len(ds._changedRows), None]
+					return
 		if len(ds) == 0:
+			if mirror is not None:
+				self._cursor.execute("delete from %s" % alias)
+				self._mirrors[alias] = [ds, mirror[1], ds._version,
+						ds._sharedChanges[0], len(ds._changedRows), contentHash]
+				return
 			# Can't create and populate a table without a structure
 			dabo.log.info(_("Cannot populate without data for alias '%s'")
 					% alias)
 			return None
-		hs = hashlib.md5(ustr(ds)).hexdigest()
-		if hs == ds._dataHash:
-			# Data's already there and hasn't changed; no need to re-load it
-			return
-		ds._dataHash = hs
-		if ds._populated:
+		self._loadTable(ds, alias, contentHash)
+
+
+	def _loadTable(self, ds, alias, contentHash=None):
+		"""
+		Fill the table for the alias with all the records of the data set,
+		whose contents have the passed hash if it doesn't track its changes.
+		"""
+		flds = list(ds[0])
+		mirror = self._mirrors.get(alias)
+		if mirror is not None and mirror[1] == flds:
 			# Clear out the old records
 			self._cursor.execute("delete from %s" % alias)
 		else:
+			if mirror is not None:
+				self._cursor.execute("drop table %s" % alias)
 			# Create the table
 			self._cursor.execute(self._makeCreateTable(ds, alias))
+		self._writeRows(ds, alias, flds, xrange(len(ds)))
+		self._mirrors[alias] = [ds, flds, ds._version, ds._sharedChanges[0],
+				len(ds._changedRows), contentHash]
+
 
+	def _writeRows(self, ds, alias, flds, rows, replace=False):
+		"""
+		Write the records at the passed rows of the data set to the table for
+		the alias. Each record is stored with the rowid of its row plus one,
+		so that replacing it keeps the order of the records.
+		"""
 		# Fields may contain illegal names. This will correct them
-		flds = [fld.replace("dabo-", "dabo_") for fld in ds[0]]
-		fldParams = [":%s" % fld for fld in flds]
-		insStmnt = "insert into %s (%s) values (%s)" % (alias,
-				", ".join(flds), ", ".join(fldParams))
+		safeFlds = [fld.replace("dabo-", "dabo_") for fld in flds]
+		insStmnt = "insert %sinto %s (rowid, %s) values (?, %s)" % (
+				"or replace " if replace else "", alias, ", ".join(safeFlds),
+				", ".join(["?"] * len(flds)))
 
-		def recGenerator(ds):
-			for rec in ds:
-				yield rec
+		def valGenerator():
+			for row in rows:
+				rec = ds[row]
+				yield [row + 1] + [rec.get(fld) for fld in flds]
 
-		self._cursor.executemany(insStmnt, recGenerator(ds))
-		if ds is self:
-			self._populated = True
+		self._cursor.executemany(insStmnt, valGenerator())
 
 
 	def execute(self, sqlExpr, params=(), cursorDict=None):
@@ -347,6 +646,16 @@ class dDataSet(tuple):
 		additional DataSet objects in a dictionary, where the value is the
 		DataSet, and the key is the alias used to reference that DataSet
 		in your join statement.
+
+		The data sets are copied to SQLite tables, which are kept for later
+		queries and only updated with the changes made since. A dDataSet
+		compares its contents with the table, so the values of its record dicts
+		can be changed directly. The other data sets, such as the records of a
+		cursor, track the changes made through them; changes made by assigning
+		to their records directly aren't seen, so call markChanged() after
+		making them, otherwise execute() and sort() keep using the old values.
+		filter() and filterByExpression() read the records themselves, so they
+		always see the current values.
 		"""
 		def dict_factory(cursor, row):
 			dd = {}
@@ -376,7 +685,7 @@ class dDataSet(tuple):
 
 		# Create the table for this dDataSet
 		self._populate(self, "dataset")
-		if not self._populated:
+		if "dataset" not in self._mirrors:
 			# No data in the dataset
 			return None
 
@@ -399,6 +708,9 @@ class dDataSet(tuple):
 		# nothing. In those cases, we need to run a 'select *' to get the
 		# modified data set.
 		if not sqlExpr.lower().strip().startswith("select "):
+			# The tables no longer match the data sets.
+			for mirror in self._mirrors.values():
+				mirror[2] = None
 			self._cursor.execute("select * from dataset")
 		tmpres = self._cursor.fetchall()
 
@@ -478,6 +790,187 @@ class dDataSet(tuple):
 
 
 
+
+class dDataSet(dDataSetMixin, tuple):
+	""" This class assumes that its contents are not ordinary tuples, but
+	rather tuples consisting of dicts, where the dict keys are field names.
+	This is the data structure returned by the dCursorMixin class.
+
+	It is used to give these data sets the ability to be queried, joined, etc.
+	This is accomplished by using SQLite in-memory databases. If SQLite
+	and pysqlite2 are not installed on the machine this is run on, a
+	warning message will be printed out and the SQL functions will return
+	None. The data will still be usable, though.
+	"""
+	# The values of the record dicts can be changed directly.
+	_trackChanges = False
+
+	def __init__(self, sequence=None):
+		# Note that as immutable objects, tuples are created with __new__,
+		# so we must not pass the argument to the __init__ method of tuple.
+		super(dDataSet, self).__init__()
+		self._initDataSet()
+
+
+	def __add__(self, *args, **kwargs):
+		return dDataSet(super(dDataSet, self).__add__(*args, **kwargs))
+
+
+	def __mul__(self, *args, **kwargs):
+		return dDataSet(super(dDataSet, self).__mul__(*args, **kwargs))
+
+
+
+class dMutableDataSet(dDataSetMixin, list):
+	"""
+	A dDataSet whose records can be appended and removed in place. This is
+	the record store used by dCursorMixin, so that adding a record or deleting
+	one doesn't have to copy the whole data set.
+
+	When the data set is the result of a filter, records appended to or
+	removed from it are appended to or removed from the source data sets too,
+	so that removing the filter doesn't lose them.
+	"""
+	def __init__(self, sequence=None):
+		super(dMutableDataSet, self).__init__(sequence or ())
+		self._initDataSet()
+
+
+	def __add__(self, other):
+		return self.__class__(list(self) + list(other))
+
+
+	def __mul__(self, num):
+		return self.__class__(list(self) * num)
+
+
+	def append(self, rec):
+		"""Add the record to the end of this data set and of its sources."""
+		positions = self._keptPositions()
+		super(dMutableDataSet, self).append(rec)
+		self.markChanged([len(self) - 1])
+		self._addPositions(positions, [id(rec)])
+		src = self._sourceDataSet
+		if isinstance(src, dMutableDataSet):
+			src.append(rec)
+
+
+	def extend(self, recs):
+		"""Add the records to the end of this data set and of its sources."""
+		recs = list(recs)
+		positions = self._keptPositions()
+		super(dMutableDataSet, self).extend(recs)
+		self.markChanged(xrange(len(self) - len(recs), len(self)))
+		self._addPositions(positions, [id(rec) for rec in recs])
+		src = self._sourceDataSet
+		if isinstance(src, dMutableDataSet):
+			src.extend(recs)
+
+
+	def pop(self, index=-1):
+		"""Remove and return the record at the passed index."""
+		positions = self._keptPositions()
+		row = index % len(self) if self else index
+		rec = super(dMutableDataSet, self).pop(index)
+		self.markChanged()
+		self._removePosition(positions, id(rec), row)
+		src = self._sourceDataSet
+		if isinstance(src, dMutableDataSet):
+			src._discard(rec)
+		return rec
+
+
+	def _rowKeys(self):
+		return (id(rec) for rec in self)
+
+
+	def _discard(self, rec):
+		"""Remove the passed record object, if present."""
+		positions = self._getPositions()
+		if positions is not None:
+			idx = positions.get(id(rec))
+			if idx is not None and self[idx] is rec:
+				self.pop(idx)
+			return
+		for idx, item in enumerate(self):
+			if item is rec:
+				self.pop(idx)
+				return
+
+
+	def removeRows(self, rows):
+		"""
+		Remove the records at the passed indexes from this data set and from
+		its sources in a single pass. Returns the removed records.
+		"""
+		rows = set(rows)
+		removed = [rec for idx, rec in enumerate(self) if idx in rows]
+		self[:] = [rec for idx, rec in enumerate(self) if idx not in rows]
+		src = self._sourceDataSet
+		if removed and isinstance(src, dMutableDataSet):
+			src._discardRecords(removed)
+		return removed
+
+
+	def _discardRecords(self, recs):
+		"""Remove the passed record objects, if present."""
+		ids = set([id(rec) for rec in recs])
+		self.removeRows([idx for idx, rec in enumerate(self) if id(rec) in ids])
+
+
+	# The other ways of changing the list keep the SQLite tables in sync too.
+	def __setitem__(self, idx, rec):
+		super(dMutableDataSet, self).__setitem__(idx, rec)
+		if isinstance(idx, slice):
+			self.markChanged()
+		else:
+			self.markChanged([idx % len(self)])
+
+
+	def __delitem__(self, idx):
+		super(dMutableDataSet, self).__delitem__(idx)
+		self.markChanged()
+
+
+	def __setslice__(self, start, end, recs):
+		super(dMutableDataSet, self).__setslice__(start, end, recs)
+		self.markChanged()
+
+
+	def __delslice__(self, start, end):
+		super(dMutableDataSet, self).__delslice__(start, end)
+		self.markChanged()
+
+
+	def __iadd__(self, recs):
+		numRows = len(self)
+		ret = super(dMutableDataSet, self).__iadd__(recs)
+		self.markChanged(xrange(numRows, len(self)))
+		return ret
+
+
+	def __imul__(self, num):
+		ret = super(dMutableDataSet, self).__imul__(num)
+		self.markChanged()
+		return ret
+
+
+	def insert(self, idx, rec):
+		super(dMutableDataSet, self).insert(idx, rec)
+		self.markChanged()
+
+
+	def remove(self, rec):
+		super(dMutableDataSet, self).remove(rec)
+		self.markChanged()
+
+
+	def reverse(self):
+		super(dMutableDataSet, self).reverse()
+		self.markChanged()
+
+
+
 # class DataSetOld(tuple):
 # 	""" This class assumes that its contents are not ordinary tuples, but
 # 	rather tuples consisting of dicts, where the dict keys are field names.
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from collections import MutableMapping
+
+from dabo.db.dDataSet import dDataSetMixin, dDataSet
+
+
+
+class dRecordView(MutableMapping):
+	"""
+	One record of a dDataSetView. It shows the fields of the view, reading
+	their values from the underlying record. Changing it changes a copy of
+	the record, kept by the view, and never the underlying record.
+	"""
+	def __init__(self, view, row):
+		self._view = view
+		self._row = row
+
+
+	def __getitem__(self, fld):
+		return self._view._getValue(self._row, fld)
+
+
+	def __setitem__(self, fld, val):
+		self._view._getCopy(self._row)[fld] = val
+
+
+	def __delitem__(self, fld):
+		del self._view._getCopy(self._row)[fld]
+
+
+	def __iter__(self):
+		return iter(self._view._getFields(self._row))
+
+
+	def __len__(self):
+		return len(self._view._getFields(self._row))
+
+
+	def __repr__(self):
+		return repr(self.copy())
+
+
+	def has_key(self, fld):
+		return fld in self
+
+
+	def copy(self):
+		return dict(self.iteritems())
+
+
+
+class dDataSetView(dDataSetMixin):
+	"""
+	A read-only data set that presents some of the fields of a window of rows
+	of another sequence of records, such as the records of a cursor, without
+	copying them. It supports the querying, filtering and sorting methods of
+	dDataSet, and its records behave like the record dicts of a dDataSet.
+
+	The view reads the underlying records each time a value is accessed, so
+	it reflects later changes to them. A record of the view is only copied
+	when it is changed through the view; the underlying record isn't modified.
+	"""
+	# The underlying records can change without the view knowing.
+	_trackChanges = False
+
+	def __init__(self, sequence=None, fields=None, rowStart=0, rowEnd=None,
+			virtualColumns=None):
+		self._initDataSet()
+		if sequence is None:
+			sequence = ()
+		if rowEnd is None:
+			rowEnd = len(sequence)
+		self._records = sequence
+		# None shows all the fields of each record.
+		self._fields = fields
+		self._fieldSet = frozenset(fields) if fields is not None else None
+		self._rowStart = rowStart
+		self._rowEnd = rowEnd
+		# Lists of values that don't come from the records, such as those of
+		# virtual fields, indexed by the row of the view.
+		self._virtualColumns = virtualColumns or {}
+		# Records changed through the view, keyed by the row of the view.
+		self._copies = {}
+
+
+	def _getValue(self, row, fld):
+		copy = self._copies.get(row)
+		if copy is not None:
+			return copy[fld]
+		vcol = self._virtualColumns.get(fld)
+		if vcol is not None:
+			return vcol[row]
+		if self._fieldSet is not None and fld not in self._fieldSet:
+			raise KeyError(fld)
+		return self._records[self._rowStart + row][fld]
+
+
+	def _getFields(self, row):
+		copy = self._copies.get(row)
+		if copy is not None:
+			return copy.keys()
+		if self._fields is not None:
+			return self._fields
+		return list(self._records[self._rowStart + row]) + self._virtualColumns.keys()
+
+
+	def _getCopy(self, row):
+		"""Return the copy of the record at the row, creating it if needed."""
+		try:
+			return self._copies[row]
+		except KeyError:
+			ret = self._copies[row] = dict([(fld, self._getValue(row, fld))
+					for fld in self._getFields(row)])
+			return ret
+
+
+	def __len__(self):
+		return max(0, self._rowEnd - self._rowStart)
+
+
+	def __iter__(self):
+		for row in xrange(len(self)):
+			yield dRecordView(self, row)
+
+
+	def __getitem__(self, idx):
+		if isinstance(idx, slice):
+			return self.__class__([self[row] for row in xrange(*idx.indices(len(self)))])
+		numRows = len(self)
+		if idx < 0:
+			idx += numRows
+		if not 0 <= idx < numRows:
+			raise IndexError("dDataSetView index out of range")
+		return dRecordView(self, idx)
+
+
+	def __add__(self, other):
+		return dDataSet([rec.copy() for rec in self] + list(other))
+
+
+	def __repr__(self):
+		return repr([rec.copy() for rec in self])
+
+
+	def copy(self):
+		"""Return a dDataSet holding copies of the records of the view."""
+		return dDataSet([rec.copy() for rec in self])
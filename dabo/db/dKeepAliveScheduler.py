@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import math
+import threading
+import time
+import weakref
+import dabo
+from dabo.dLocalize import _
+
+
+
+class dKeepAliveScheduler(object):
+	"""
+	Sends the keep-alive queries of all the connections of the process from
+	a single thread. Backend objects with a KeepAliveInterval, and connection
+	pools, register with it, and their keepAlive() method is called when
+	they are due. It pings the connections that have been idle for longer
+	than the interval, and returns the number of seconds until the object
+	is due again, or None to stop calling it.
+
+	Due times are kept in a timing wheel of WheelSize slots of Tick seconds
+	each, so scheduling is O(1) however many connections there are. The
+	thread sleeps while no objects are registered, and holds weak references
+	to them, so it doesn't keep closed connections alive.
+	"""
+	def __init__(self, tick=1.0, wheelSize=60):
+		self._lock = threading.Condition(threading.RLock())
+		self._tick = tick
+		self._slots = [{} for idx in xrange(wheelSize)]
+		# The slot of the last tick.
+		self._current = 0
+		# id of the registered object -> (weak reference, interval, slot index)
+		self._entries = {}
+		self._thread = None
+
+
+	def register(self, obj, interval):
+		"""
+		Call obj.keepAlive() in interval seconds, and then again after the
+		number of seconds it returns. If it raises an error, it is called
+		again after interval seconds.
+		"""
+		key = id(obj)
+		with self._lock:
+			self._remove(key)
+			self._entries[key] = (weakref.ref(obj), interval, None)
+			self._schedule(key, interval)
+			if self._thread is None:
+				thd = self._thread = threading.Thread(target=self._run,
+						name="dKeepAliveScheduler")
+				thd.daemon = True
+				thd.start()
+			self._lock.notify()
+
+
+	def unregister(self, obj):
+		"""Stop calling the keepAlive() method of the object."""
+		with self._lock:
+			self._remove(id(obj))
+
+
+	def stop(self):
+		"""
+		Drop all the registered objects and end the thread. Objects that are
+		registered afterwards start it again.
+		"""
+		with self._lock:
+			self._entries.clear()
+			for slot in self._slots:
+				slot.clear()
+			thd, self._thread = self._thread, None
+			self._lock.notifyAll()
+		if thd is not None and thd is not threading.current_thread():
+			thd.join()
+
+
+	def _remove(self, key):
+		entry = self._entries.pop(key, None)
+		if entry is not None and entry[2] is not None:
+			self._slots[entry[2]].pop(key, None)
+
+
+	def _schedule(self, key, delay):
+		"""Put the entry in the slot of the tick that comes delay seconds from now."""
+		size = len(self._slots)
+		ticks = max(1, int(math.ceil(delay / self._tick)))
+		idx = (self._current + ticks) % size
+		# The number of times the wheel passes the slot before it is due.
+		self._slots[idx][key] = (ticks - 1) // size
+		ref, interval, oldIdx = self._entries[key]
+		self._entries[key] = (ref, interval, idx)
+
+
+	def _run(self):
+		thd = threading.current_thread()
+		nextTick = time.time() + self._tick
+		while True:
+			with self._lock:
+				if self._thread is not thd:
+					return
+				if not self._entries:
+					# Nothing to do until an object is registered.
+					self._lock.wait()
+					nextTick = time.time() + self._tick
+					continue
+				remaining = nextTick - time.time()
+				if remaining > 0:
+					self._lock.wait(remaining)
+					continue
+				nextTick += self._tick
+				due = self._advance()
+			for key, ref, interval in due:
+				self._callKeepAlive(key, ref, interval)
+
+
+	def _advance(self):
+		"""Move to the next slot, and return the entries that are due."""
+		self._current = (self._current + 1) % len(self._slots)
+		slot = self._slots[self._current]
+		due = []
+		for key, rounds in slot.items():
+			if rounds:
+				slot[key] = rounds - 1
+			else:
+				del slot[key]
+				ref, interval, idx = self._entries[key]
+				self._entries[key] = (ref, interval, None)
+				due.append((key, ref, interval))
+		return due
+
+
+	def _callKeepAlive(self, key, ref, interval):
+		obj = ref()
+		if obj is None:
+			with self._lock:
+				self._entries.pop(key, None)
+			return
+		try:
+			delay = obj.keepAlive()
+		except Exception, e:
+			dabo.log.error(_("Keep-alive query failed: %s") % e)
+			delay = interval
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None or entry[0] is not ref or entry[2] is not None:
+				# Unregistered or registered again in the meantime.
+				return
+			if delay is None:
+				del self._entries[key]
+			else:
+				self._schedule(key, delay)
+
+
+	def _getTick(self):
+		return self._tick
+
+
+	def _getWheelSize(self):
+		return len(self._slots)
+
+
+	Tick = property(_getTick, None, None,
+			_("The number of seconds between the checks for due objects. Read-only.  (float)"))
+
+	WheelSize = property(_getWheelSize, None, None,
+			_("The number of slots of the timing wheel. Read-only.  (int)"))
+
+
+
+_scheduler = None
+_schedulerLock = threading.Lock()
+
+def getKeepAliveScheduler():
+	"""Return the dKeepAliveScheduler shared by all the connections of the process."""
+	global _scheduler
+	with _schedulerLock:
+		if _scheduler is None:
+			_scheduler = dKeepAliveScheduler()
+		return _scheduler
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import cPickle as pickle
+import dabo
+from dabo.dLocalize import _
+
+
+
+class dMetadataCache(object):
+	"""
+	Thread-safe store for the table metadata that the cursors of a connection
+	look up, such as the field list returned by getFields() or the description
+	of a structure-only query. Every backend object has one, so the cursors of
+	all the bizobjs sharing a connection only query the metadata of a table once.
+
+	Entries are keyed by a kind, the table name and an optional extra key,
+	and can be dropped per table with clear(). When Filename is set, the
+	entries are also saved to that file, and read back from it by the next
+	process that uses the same database.
+	"""
+	def __init__(self, filename=None, namespace=""):
+		self._lock = threading.RLock()
+		self._entries = {}
+		self._namespace = namespace
+		self._filename = None
+		self.Filename = filename
+
+
+	def get(self, kind, table, extra=None, default=None):
+		"""Return the cached value, or the default if there is none."""
+		with self._lock:
+			return self._entries.get((kind, table, extra), default)
+
+
+	def set(self, kind, table, val, extra=None):
+		"""Store the value, and save the cache to disk if Filename is set."""
+		with self._lock:
+			self._entries[(kind, table, extra)] = val
+			self._save()
+
+
+	def getOrCreate(self, kind, table, func, extra=None):
+		"""
+		Return the cached value, calling func() to create it when there is
+		none. Empty results are returned but not cached, since they usually
+		mean that the table doesn't exist yet.
+		"""
+		key = (kind, table, extra)
+		with self._lock:
+			try:
+				return self._entries[key]
+			except KeyError:
+				pass
+		# Run the query outside the lock, so that a slow server doesn't block
+		# the other threads' lookups.
+		ret = func()
+		if ret:
+			self.set(kind, table, ret, extra=extra)
+		return ret
+
+
+	def clear(self, table=None):
+		"""Drop all the entries for the passed table, or all of them if None."""
+		with self._lock:
+			if table is None:
+				self._entries.clear()
+			else:
+				for key in [key for key in self._entries if key[1] == table]:
+					del self._entries[key]
+			self._save()
+
+
+	def _load(self):
+		fname = self._filename
+		if not fname or not os.path.exists(fname):
+			return
+		try:
+			with open(fname, "rb") as ff:
+				stored = pickle.load(ff)
+		except Exception, e:
+			dabo.log.error(_("Could not read the metadata cache file '%(fname)s': %(e)s")
+					% locals())
+			return
+		self._entries.update(stored.get(self._namespace, {}))
+
+
+	def _save(self):
+		fname = self._filename
+		if not fname:
+			return
+		stored = {}
+		if os.path.exists(fname):
+			try:
+				with open(fname, "rb") as ff:
+					stored = pickle.load(ff)
+			except Exception:
+				stored = {}
+		stored[self._namespace] = self._entries
+		# Write to a temporary file first, so that a process reading the file
+		# never sees a partially written one.
+		tmpName = "%s.%s.tmp" % (fname, os.getpid())
+		try:
+			with open(tmpName, "wb") as ff:
+				pickle.dump(stored, ff, pickle.HIGHEST_PROTOCOL)
+			if os.name == "nt" and os.path.exists(fname):
+				os.remove(fname)
+			os.rename(tmpName, fname)
+		except Exception, e:
+			dabo.log.error(_("Could not write the metadata cache file '%(fname)s': %(e)s")
+					% locals())
+
+
+	def _getFilename(self):
+		return self._filename
+
+	def _setFilename(self, val):
+		with self._lock:
+			self._filename = val
+			self._load()
+
+
+	def _getNamespace(self):
+		return self._namespace
+
+	def _setNamespace(self, val):
+		with self._lock:
+			if val != self._namespace:
+				self._namespace = val
+				self._entries = {}
+				self._load()
+
+
+	Filename = property(_getFilename, _setFilename, None,
+			_("""Path of the file that the cache is saved to, so that it survives
+			between runs. When None (default), the cache is kept in memory only.  (str)"""))
+
+	Namespace = property(_getNamespace, _setNamespace, None,
+			_("""Identifies the database the cached entries belong to, so that one
+			file can hold the caches of several databases.  (str)"""))
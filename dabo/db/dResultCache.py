@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from dabo.dLocalize import _
+
+
+
+class dResultCache(object):
+	"""
+	Thread-safe cache of query results, shared by the cursors of a connection.
+	Cursors with a ResultCacheInterval store the rows fetched by their selects
+	here, keyed by the SQL and its parameters, and reuse them when the same
+	query is run again before the interval has passed.
+
+	The least recently used results are dropped when the cache holds more
+	than MaxSize bytes. Results are also dropped when any cursor of the
+	connection inserts, updates or deletes rows in one of the tables that
+	their query reads from, and the whole cache is cleared by DDL statements.
+	The tables changed since the last commit are remembered, so that the
+	results read from them, which may hold the uncommitted changes, are
+	dropped when the transaction is rolled back.
+	"""
+	# Table names following 'from' or 'join' in a select.
+	_tablePat = re.compile(r"\b(?:from|join)\s+([^\s,;()]+)", re.I | re.S)
+	# The table changed by a DML statement.
+	_dmlPat = re.compile(r"^\s*(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update"
+			r"|delete\s+from)\s+([^\s,;()]+)", re.I | re.S)
+	_ddlPat = re.compile(r"^\s*(?:create|alter|drop|truncate)\b", re.I)
+	# Statements ending a transaction, or rolling back to a savepoint.
+	_txnPat = re.compile(r"^\s*(commit|end|rollback)\b(\s+(?:work\s+|transaction\s+)?to\b)?",
+			re.I | re.S)
+
+	def __init__(self, maxSize=16 * 1024 * 1024):
+		self._lock = threading.RLock()
+		# key -> (expiration time, size, tables, result)
+		self._entries = OrderedDict()
+		self._size = 0
+		self._maxSize = maxSize
+		# The tables changed since the last commit or rollback.
+		self._uncommitted = set()
+
+
+	@classmethod
+	def _normalizeName(cls, name):
+		"""Strip any schema prefix and quoting from the table name."""
+		name = name.split(".")[-1]
+		return name.strip("\"'`[]").lower()
+
+
+	@classmethod
+	def getTables(cls, sql):
+		"""Return the set of the names of the tables read by the select."""
+		return set([cls._normalizeName(tbl) for tbl in cls._tablePat.findall(sql)])
+
+
+	@staticmethod
+	def makeKey(sql, params):
+		"""
+		Return the cache key for the query, or None if its parameters can't
+		be part of a key.
+		"""
+		if params is None:
+			params = ()
+		elif isinstance(params, dict):
+			params = tuple(sorted(params.items()))
+		else:
+			params = tuple(params)
+		key = (sql, params)
+		try:
+			hash(key)
+		except TypeError:
+			return None
+		return key
+
+
+	def get(self, key):
+		"""Return the cached result for the key, or None."""
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is None:
+				return None
+			if entry[0] < time.time():
+				self._size -= entry[1]
+				return None
+			# Move it to the end, as the most recently used.
+			self._entries[key] = entry
+			return entry[3]
+
+
+	def set(self, key, result, interval, tables, size=None):
+		"""
+		Store the result for the key for the passed number of seconds. The
+		result is dropped when one of the passed tables is changed.
+		"""
+		if size is None:
+			size = self.getSizeOf(result)
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self._size -= old[1]
+			if size > self._maxSize:
+				return
+			self._entries[key] = (time.time() + interval, size, frozenset(tables), result)
+			self._size += size
+			self._evict()
+
+
+	def _evict(self):
+		entries = self._entries
+		while self._size > self._maxSize and entries:
+			key, entry = entries.popitem(last=False)
+			self._size -= entry[1]
+
+
+	def invalidate(self, table):
+		"""Drop the results that read from the passed table."""
+		table = self._normalizeName(table)
+		with self._lock:
+			for key, entry in self._entries.items():
+				if table in entry[2]:
+					del self._entries[key]
+					self._size -= entry[1]
+
+
+	def invalidateForStatement(self, sql):
+		"""Drop the results that may be changed by running the statement."""
+		if self._ddlPat.match(sql):
+			self.clear()
+			return
+		mtch = self._dmlPat.match(sql)
+		if mtch:
+			table = mtch.group(1)
+			with self._lock:
+				self._uncommitted.add(self._normalizeName(table))
+			self.invalidate(table)
+			return
+		mtch = self._txnPat.match(sql)
+		if mtch:
+			if mtch.group(1).lower() != "rollback":
+				self.commit()
+			else:
+				self.rollback(toSavepoint=bool(mtch.group(2)))
+
+
+	def commit(self):
+		"""Forget the tables changed by the transaction that was committed."""
+		with self._lock:
+			self._uncommitted.clear()
+
+
+	def rollback(self, toSavepoint=False):
+		"""
+		Drop the results that read from the tables changed by the transaction
+		that was rolled back. If toSavepoint is True, the transaction goes on,
+		and so the tables are still remembered as changed.
+		"""
+		with self._lock:
+			tables = list(self._uncommitted)
+			if not toSavepoint:
+				self._uncommitted.clear()
+			for table in tables:
+				self.invalidate(table)
+
+
+	def clear(self):
+		"""Drop all the cached results."""
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+
+
+	@staticmethod
+	def getSizeOf(result):
+		"""Approximate the number of bytes used by a sequence of row tuples."""
+		getsizeof = sys.getsizeof
+		ret = getsizeof(result)
+		for row in result:
+			ret += getsizeof(row) + sum([getsizeof(val) for val in row])
+		return ret
+
+
+	def __len__(self):
+		return len(self._entries)
+
+
+	def _getMaxSize(self):
+		return self._maxSize
+
+	def _setMaxSize(self, val):
+		with self._lock:
+			self._maxSize = val
+			self._evict()
+
+
+	def _getSize(self):
+		return self._size
+
+
+	MaxSize = property(_getMaxSize, _setMaxSize, None,
+			_("""The maximum number of bytes of results to keep. When exceeded, the
+			least recently used results are dropped. Default=16MB  (int)"""))
+
+	Size = property(_getSize, None, None,
+			_("The approximate number of bytes of the cached results. Read-only.  (int)"))
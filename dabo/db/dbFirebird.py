@@ -125,6 +125,10 @@ class Firebird(dBackend):
 		return cursor.getDataSet()[0][0]
 
 
+	def ping(self, cursor):
+		cursor.execute("select 1 from rdb$database")
+
+
 	def getFields(self, tableName, cursor):
 		# Get the PK
 ### The SQL for the PK changed by Uwe Grauer 2007.08.23
@@ -237,6 +241,10 @@ class Firebird(dBackend):
 		return "first"
 
 
+	def getLimitPosition(self):
+		return "top"
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""Firebird wants the limit clause before the field clause."""
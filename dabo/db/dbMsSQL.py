@@ -261,6 +261,10 @@ select kc.COLUMN_NAME from INFORMATION_SCHEMA.KEY_COLUMN_USAGE as kc
 		return "TOP"
 
 
+	def getLimitPosition(self):
+		return "top"
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""MS SQL wants the limit clause before the field clause."""
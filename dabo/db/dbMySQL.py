@@ -112,6 +112,15 @@ class MySQL(dBackend):
 		return True
 
 
+	def bulkLoad(self, table, rows, columns, cursor, chunkSize=5000):
+		"""
+		MySQLdb's executemany() turns an insert into a single multi-row insert
+		statement, so larger chunks mean fewer round trips to the server.
+		"""
+		return dBackend.bulkLoad(self, table, rows, columns, cursor,
+				chunkSize=chunkSize)
+
+
 	def escQuote(self, val):
 		# escape backslashes and single quotes, and
 		# wrap the result in single quotes
@@ -77,6 +77,10 @@ class Oracle(dBackend):
 		return cursor.getDataSet()[0][0]
 
 
+	def ping(self, cursor):
+		cursor.execute("select 1 from dual")
+
+
 	def getFields(self, tableName, cursor):
 		# get PK
 		print "dbOracle.getFields(): ", tableName
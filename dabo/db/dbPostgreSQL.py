@@ -2,13 +2,73 @@
 
 import codecs
 import datetime
+import time
 import dabo
 from dabo.dLocalize import _
 from dBackend import dBackend
+import dabo.dException as dException
 from dabo.lib.utils import ustr
 
 
 
+class _CopyStream(object):
+	"""
+	File-like object that reads rows from an iterable and formats them in
+	the text format of COPY as they are requested, so that the whole text
+	never has to be built in memory.
+	"""
+	def __init__(self, rows, encoding):
+		self._rows = iter(rows)
+		self._encoding = encoding
+		self._buffer = ""
+		self.count = 0
+
+
+	def _formatValue(self, val):
+		if val is None:
+			return "\\N"
+		if isinstance(val, unicode):
+			val = val.encode(self._encoding)
+		elif not isinstance(val, str):
+			val = str(val)
+		return val.replace("\\", "\\\\").replace("\t", "\\t").replace(
+				"\n", "\\n").replace("\r", "\\r")
+
+
+	def _nextLine(self):
+		try:
+			row = self._rows.next()
+		except StopIteration:
+			return ""
+		self.count += 1
+		return "\t".join([self._formatValue(val) for val in row]) + "\n"
+
+
+	def readline(self, size=-1):
+		if self._buffer:
+			line, sep, self._buffer = self._buffer.partition("\n")
+			return line + sep
+		return self._nextLine()
+
+
+	def read(self, size=-1):
+		buf = self._buffer
+		parts = [buf]
+		length = len(buf)
+		while size < 0 or length < size:
+			line = self._nextLine()
+			if not line:
+				break
+			parts.append(line)
+			length += len(line)
+		buf = "".join(parts)
+		if size < 0:
+			size = len(buf)
+		self._buffer = buf[size:]
+		return buf[:size]
+
+
+
 class Postgres(dBackend):
 	"""Class providing PostgreSQL connectivity. Uses psycopg."""
 
@@ -214,6 +274,26 @@ class Postgres(dBackend):
 		return
 
 
+	def bulkLoad(self, table, rows, columns, cursor, chunkSize=None):
+		"""
+		Load the rows with 'COPY ... FROM STDIN', streaming them to the server
+		as they are read from the iterable.
+		"""
+		aq = cursor.AutoQuoteNames
+		flds = ", ".join([self.encloseNames(col, aq) for col in columns])
+		sql = "COPY %s (%s) FROM STDIN" % (self.encloseNames(table, aq), flds)
+		stream = _CopyStream(rows, self.Encoding)
+		try:
+			cursor.copy_expert(sql, stream)
+		except Exception, e:
+			errMsg = _("DBQueryException encountered in bulkLoad(): %s") % ustr(e)
+			dabo.dbActivityLog.info(errMsg)
+			raise dException.DBQueryException(errMsg)
+		self.lastExecuteTime = time.time()
+		dabo.dbActivityLog.info("copy_expert() (%s rows) SQL: %s" % (stream.count, sql))
+		return stream.count
+
+
 	def flush(self, cursor):
 		"""
 		Postgres requires an explicit commit in order to have changes
@@ -13,6 +13,10 @@ from dabo.lib.utils import ustr
 
 class SQLite(dBackend):
 	"""Class providing SQLite connectivity. Uses sqlite3 or pysqlite2 package."""
+	# A pooled connection is only used by one thread at a time, but not
+	# always by the thread that opened it.
+	poolConnectionArgs = {"check_same_thread": False}
+
 	def __init__(self):
 		dBackend.__init__(self)
 		self.dbModuleName = "pysqlite2"
@@ -67,7 +71,8 @@ class SQLite(dBackend):
 			pth = pth.decode(dabo.fileSystemEncoding).encode("utf-8")
 
 		# Need to specify "isolation_level=None" to have transactions working correctly.
-		self._connection = self.dbapi.connect(pth, factory=DictConnection, isolation_level=None)
+		self._connection = self.dbapi.connect(pth, factory=DictConnection, isolation_level=None,
+				check_same_thread=kwargs.get("check_same_thread", True))
 
 		# Non-utf8-encoded bytestrings could be in the database, and Dabo will try various encodings
 		# to deal with it. So tell sqlite not to decode with utf-8, but to just return the bytes:
@@ -137,6 +142,7 @@ class SQLite(dBackend):
 	def flush(self, crs):
 		dabo.dbActivityLog.info("SQL: flush")
 		self._connection.commit()
+		self.ResultCache.commit()
 
 
 	def formatBLOB(self, val):
@@ -212,11 +218,7 @@ class SQLite(dBackend):
 		# This is the current description of the cursor.
 		descFlds = cursor.FieldDescription
 		# Get the field info for the table
-		auxCrs = cursor._getAuxCursor()
-		auxCrs.execute("pragma table_info('%s')" % cursor.Table)
-		rs = auxCrs._records
-
-		stdFlds = [ff["name"] for ff in rs]
+		stdFlds = [fld[0] for fld in cursor.getFields(cursor.Table)]
 		# Get all the fields that are not in the table.
 		return [d[0] for d in descFlds
 				if d[0] not in stdFlds ]
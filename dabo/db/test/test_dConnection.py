@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
 import unittest
 import dabo.db
+import dabo.dException as dException
 
 
 class Test_dConnectInfo(unittest.TestCase):
@@ -25,6 +30,112 @@ class Test_dConnectInfo(unittest.TestCase):
 			co = dabo.db.dConnection(DbType="SQLite", Db=":memory:")
 		self.assertRaises(Exception, anotherBogusParm)
 
+	def test_Pool(self):
+		fd, path = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		try:
+			con = dabo.db.dConnection(DbType="SQLite", Database=path, PoolMaxSize=1,
+					PoolIdleTimeout=60, PoolHealthCheck="true")
+			pool = con.Pool
+			self.assertEqual((pool.MinSize, pool.MaxSize, pool.IdleTimeout, pool.HealthCheck),
+					(0, 1, 60, True))
+			self.assertEqual(pool.Size, 0)
+			conn = con.checkout()
+			self.assertNotEqual(conn, con)
+			# Checkouts are thread-affine.
+			self.assertTrue(con.checkout() is conn)
+			con.checkin(conn)
+			self.assertEqual(pool.Size, 1)
+			# The only connection is still held by this thread.
+			errors = []
+			def other():
+				try:
+					con.checkout(timeout=0.1)
+				except dException.ConnectionPoolTimeoutException, e:
+					errors.append(e)
+			thd = threading.Thread(target=other)
+			thd.start()
+			thd.join()
+			self.assertEqual(len(errors), 1)
+			con.checkin(conn)
+			self.assertRaises(dException.dException, con.checkin, conn)
+			# Another thread can use it once it is checked in.
+			results = []
+			def other():
+				cn = con.checkout()
+				crs = cn.getDaboCursor()
+				crs.execute("select 42 as answer")
+				results.append((cn, crs.Record.answer))
+				con.checkin(cn)
+			thd = threading.Thread(target=other)
+			thd.start()
+			thd.join()
+			self.assertEqual(results, [(conn, 42)])
+			# A lost connection is replaced.
+			conn.close()
+			newConn = con.checkout()
+			self.assertTrue(newConn is not conn)
+			con.checkin(newConn)
+			self.assertEqual(pool.Size, 1)
+			pool.IdleTimeout = -1
+			self.assertEqual(pool.Size, 0)
+			# MinSize connections are opened in advance.
+			pool.MinSize = 1
+			self.assertEqual(pool.Size, 1)
+			conn = con.checkout()
+			self.assertEqual(pool.Size, 1)
+			con.checkin(conn)
+			con.close()
+			con = dabo.db.dConnection(DbType="SQLite", Database=path, PoolMinSize=2,
+					PoolIdleTimeout=-1)
+			# Threads asking for the pool at once all get the same one.
+			pools = []
+			thds = [threading.Thread(target=lambda: pools.append(con.Pool))
+					for num in range(4)]
+			for thd in thds:
+				thd.start()
+			for thd in thds:
+				thd.join()
+			self.assertEqual(len(set([id(pool) for pool in pools])), 1)
+			self.assertEqual(con.Pool.Size, 2)
+			con.close()
+		finally:
+			os.remove(path)
+
+	def test_KeepAliveScheduler(self):
+		calls = []
+		class Pinged(object):
+			def keepAlive(self):
+				calls.append(time.time())
+				return 0.05
+		scheduler = dabo.db.dKeepAliveScheduler(tick=0.01, wheelSize=4)
+		obj = Pinged()
+		start = time.time()
+		scheduler.register(obj, 0.02)
+		time.sleep(0.3)
+		scheduler.unregister(obj)
+		count = len(calls)
+		self.assertTrue(count >= 2)
+		self.assertTrue(calls[0] - start >= 0.015)
+		time.sleep(0.1)
+		self.assertEqual(len(calls), count)
+		scheduler.register(obj, 0.02)
+		scheduler.stop()
+		time.sleep(0.05)
+		self.assertEqual(len(calls), count)
+
+	def test_KeepAlive(self):
+		con = dabo.db.dConnection(DbType="SQLite", Database=":memory:")
+		bo = con.getBackendObject()
+		bo.KeepAliveInterval = 60
+		self.assertEqual(round(bo.keepAlive()), 60)
+		bo.lastExecuteTime -= 100
+		self.assertEqual(bo.keepAlive(), 60)
+		self.assertTrue(time.time() - bo.lastExecuteTime < 1)
+		con.close()
+		self.assertEqual(bo.KeepAliveInterval, None)
+
+
 if __name__ == "__main__":
 	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dConnectInfo)
 	unittest.TextTestRunner(verbosity=2).run(suite)
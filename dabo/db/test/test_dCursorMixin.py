@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
 import unittest
 import datetime
 from decimal import Decimal
+try:
+	import numpy
+except ImportError:
+	numpy = None
 import dabo.db
 from dabo.lib import getRandomUUID
 
@@ -288,6 +294,497 @@ insert into %s (cfield, ifield, nfield) values (NULL, NULL, NULL)
 		self.assertEqual(cur.Record.ifield, 0)
 		self.assertEqual(cur.Record.nfield, 0)
 
+	def test_pkIndex(self):
+		cur = self.cur
+		self.assertEqual(cur._getRowByPk(2), 1)
+		self.assertTrue(cur.hasPK(3))
+		self.assertFalse(cur.hasPK(42))
+		cur.sort("cfield")
+		## Carl, Edward, Paul
+		self.assertEqual(cur._getRowByPk(1), 2)
+		cur.moveToPK(2)
+		self.assertEqual(cur.RowNumber, 1)
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		self.assertEqual(cur._getRowByPk(-1), 3)
+		cur.setFieldVal("pk", 99)
+		self.assertFalse(cur.hasPK(-1))
+		self.assertEqual(cur._getRowByPk(99), 3)
+		cur.first()
+		cur.delete()
+		self.assertFalse(cur.hasPK(3))
+		self.assertEqual(cur._getRowByPk(99), 2)
+		cur.filter("ifield", 42)
+		self.assertEqual(cur._getRowByPk(2), 0)
+		self.assertFalse(cur.hasPK(1))
+		cur.removeFilter()
+		self.assertEqual(cur._getRowByPk(1), 1)
+		cur.requery()
+		self.assertFalse(cur.hasPK(99))
+		self.assertRaises(dabo.dException.RowNotFoundException, cur._getRowByPk, 99)
+
+	def test_pkIndex_compound(self):
+		cur = self.cur
+		cur.KeyField = "pk,ifield"
+		self.assertEqual(cur._getRowByPk((2, 42)), 1)
+		self.assertFalse(cur.hasPK((2, 23)))
+		cur.setFieldVal("ifield", 43, row=1)
+		self.assertEqual(cur._getRowByPk((2, 43)), 1)
+		self.assertFalse(cur.hasPK((2, 42)))
+		self.assertEqual(cur.getChangedRows(), [1])
+
+	def test_pkIndex_delete(self):
+		cur = self.cur
+		pkIndex = cur._getPKIndex()
+		cur.first()
+		cur.delete()
+		# The rows after the deleted one are shifted, not indexed again.
+		self.assertTrue(cur._getPKIndex() is pkIndex)
+		self.assertFalse(cur.hasPK(1))
+		self.assertEqual(cur._getRowByPk(2), 0)
+		self.assertEqual(cur._getRowByPk(3), 1)
+		cur.new()
+		cur.setFieldVal("pk", 99)
+		self.assertEqual(cur._getRowByPk(99), 2)
+		cur.RowNumber = 0
+		cur.delete()
+		self.assertEqual(cur._getRowByPk(3), 0)
+		self.assertEqual(cur._getRowByPk(99), 1)
+		self.assertTrue(cur._getPKIndex() is pkIndex)
+
+	def test_filteredPop(self):
+		ds = self.cur._records.__class__([{"num": num} for num in range(10)])
+		flt = ds.filter("num", 3, ">=")
+		self.assertEqual(flt.pop(2)["num"], 5)
+		positions = ds._getPositions()
+		self.assertEqual(flt.pop(0)["num"], 3)
+		flt.append({"num": 10})
+		self.assertEqual(flt.pop(1)["num"], 6)
+		self.assertEqual(flt.pop()["num"], 10)
+		# The source finds the records without scanning itself again.
+		self.assertTrue(ds._getPositions() is positions)
+		self.assertEqual([rec["num"] for rec in ds], [0, 1, 2, 4, 7, 8, 9])
+
+	def test_seek(self):
+		cur = self.cur
+		self.assertEqual(cur.seek(42, "ifield"), 1)
+		self.assertEqual(cur.RowNumber, 1)
+		self.assertEqual(cur.seek(41, "ifield"), -1)
+		self.assertEqual(cur.seek(41, "ifield", near=True), 1)
+		self.assertEqual(cur.seek(99999, "ifield", near=True), 2)
+		self.assertEqual(cur.seek("edward leafe", "cfield"), -1)
+		self.assertEqual(cur.seek("edward leafe", "cfield", caseSensitive=False), 1)
+		self.assertEqual(cur.seek("pau", "cfield", caseSensitive=False, near=True,
+				incremental=True), 0)
+		self.assertEqual(cur.seek((3, 10223), ("pk", "ifield")), 2)
+		self.assertTrue(cur.locate("Carl Karsten", "cfield"))
+		# Changing a value must be reflected by the next seek.
+		cur.setFieldVal("ifield", 7, row=0)
+		self.assertEqual(cur.seek(23, "ifield"), -1)
+		self.assertEqual(cur.seek(7, "ifield"), 0)
+		# So must adding and removing rows.
+		cur.new()
+		cur.setFieldVal("ifield", 5)
+		self.assertEqual(cur.seek(5, "ifield"), 3)
+		cur.first()
+		cur.delete()
+		self.assertEqual(cur.seek(5, "ifield"), 2)
+		self.assertEqual(cur.seek(42, "ifield", sort=False), 0)
+		# And so must a temporary key.
+		cur.new()
+		self.assertEqual(cur.seek(3, "pk", movePointer=False), 1)
+		tmpPK = cur.genTempAutoPK()
+		self.assertEqual(cur.seek(tmpPK, "pk"), 3)
+
+	def test_newDeleteInPlace(self):
+		cur = self.cur
+		records = cur._records
+		self.assertFalse(isinstance(records, tuple))
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.delete(0)
+		# The record store is modified in place, not replaced.
+		self.assertTrue(cur._records is records)
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur._getRowByPk(-1), 2)
+		# Records added while filtered survive removing the filter.
+		cur.filter("ifield", 42)
+		cur.new()
+		self.assertEqual(cur.RowCount, 2)
+		cur.removeFilter()
+		self.assertEqual(cur.RowCount, 4)
+
+	def test_conversionPlan(self):
+		cur = self.cur
+		# The types are corrected right after the fetch, one column at a time.
+		for row in range(cur.RowCount):
+			self.assertTrue(cur._records[row][dabo.dConstants.CURSOR_FIELD_TYPES_CORRECTED])
+		convert = cur._conversionPlan["nfield"]
+		self.assertEqual(convert(1.5), Decimal("1.50"))
+		self.assertTrue(cur._getFieldConverter("nfield") is convert)
+		cur._types["ifield"] = int
+		cur._clearConversionPlan()
+		self.assertEqual(cur._correctFieldType("7", "ifield"), 7)
+		# A new result structure gets a new plan.
+		cur.requery()
+		self.assertFalse(cur._getFieldConverter("nfield") is convert)
+
+	def test_fetchWindow(self):
+		cur = self.cur
+		cur.FetchWindowSize = 2
+		cur.requery()
+		self.assertEqual(len(cur._dCursorMixin__records), 2)
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.getFieldVal("cfield", 1), "Edward Leafe")
+		self.assertEqual(len(cur.getDataSet(rows=2)), 2)
+		self.assertEqual(len(cur._dCursorMixin__records), 2)
+		# Rows are fetched as they are needed.
+		cur.RowNumber = 2
+		self.assertEqual(cur.Record.cfield, "Carl Karsten")
+		self.assertEqual(len(cur._dCursorMixin__records), 3)
+		# Working with the whole data set fetches all the rows.
+		cur.requery()
+		cur.sort("ifield", "DESC")
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.getFieldVal("ifield", 0), 10223)
+		cur.FetchWindowSize = 0
+		cur.requery()
+		self.assertEqual(len(cur._dCursorMixin__records), 3)
+
+	def test_iterRecords(self):
+		cur = self.cur
+		cur.Record.cfield = "changed"
+		recs = list(cur.iterRecords(chunkSize=2))
+		self.assertEqual(len(recs), 3)
+		self.assertEqual(recs[2]["cfield"], "Carl Karsten")
+		self.assertIsInstance(recs[0]["nfield"], Decimal)
+		self.assertEqual(list(cur.iterRecords(fields=("ifield", "cfield"), asDict=False)),
+				[(23, "Paul Keith McNett"), (42, "Edward Leafe"), (10223, "Carl Karsten")])
+		# The cursor itself is left alone.
+		self.assertEqual(cur.Record.cfield, "changed")
+		self.assertEqual(cur.RowCount, 3)
+		self.assertRaises(dabo.dException.FieldNotFoundException, list,
+				cur.iterRecords(fields=("bogus",)))
+		# Another query doesn't get the types of the cursor's fields.
+		cur._types["ifield"] = int
+		cur._clearConversionPlan()
+		recs = list(cur.iterRecords(sql="select cfield as ifield from %s order by pk"
+				% self.temp_table_name))
+		self.assertEqual(recs[0]["ifield"].rstrip(), "Paul Keith McNett")
+		self.assertEqual(cur._conversionPlan, {})
+
+	def test_saveAllRowsBatched(self):
+		cur = self.cur
+		calls = []
+		aux = cur.AuxCursor
+		def executemany(sql, paramSeq, *args, **kwargs):
+			calls.append(len(paramSeq))
+			return type(aux).executemany(aux, sql, paramSeq, *args, **kwargs)
+		aux.executemany = executemany
+		cur.setFieldVal("ifield", 99, row=0)
+		cur.setFieldVal("ifield", 98, row=1)
+		cur.setFieldVal("cfield", "changed", row=2)
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.Record.cfield = "new"
+		cur.save(allRows=True)
+		# The two updates of ifield go together; the new record is saved on
+		# its own, because its PK is generated by the backend.
+		self.assertEqual(calls, [2])
+		self.assertFalse(cur.isChanged())
+		self.assertTrue(cur.Record.pk > 0)
+		cur.requery()
+		self.assertEqual([cur.getFieldVal("ifield", row) for row in range(3)], [99, 98, 10223])
+		self.assertEqual(cur.getFieldVal("cfield", 2), "changed")
+		self.assertEqual(cur.getFieldVal("cfield", 3), "new")
+		# Statements run in the order of the rows: updates of the same form
+		# aren't batched across a row that is saved differently.
+		del calls[:]
+		cur.setFieldVal("ifield", 1, row=0)
+		cur.setFieldVal("cfield", "again", row=1)
+		cur.setFieldVal("ifield", 3, row=2)
+		cur.save(allRows=True)
+		self.assertEqual(calls, [])
+		# An update of a batch that matched no record is reported.
+		noResults = []
+		cur.BackendObject.noResultsOnSave = lambda: noResults.append(True)
+		aux.executemany = lambda sql, paramSeq, *args, **kwargs: len(paramSeq) - 1
+		cur.setFieldVal("ifield", 7, row=0)
+		cur.setFieldVal("ifield", 8, row=1)
+		cur.save(allRows=True)
+		self.assertTrue(noResults)
+
+	def test_deleteRows(self):
+		cur = self.cur
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.setFieldVal("cfield", "changed", row=2)
+		cur.deleteRows([0, 2, 3])
+		self.assertEqual(cur.RowCount, 1)
+		self.assertEqual(cur.Record.cfield, "Edward Leafe")
+		self.assertEqual(cur._newRecords, {})
+		self.assertEqual(cur._mementos, {})
+		cur.requery()
+		self.assertEqual(cur.RowCount, 1)
+		self.assertEqual(cur.Record.pk, 2)
+		# Rows that are already gone from the database.
+		cur.AuxCursor.execute("delete from %s" % self.temp_table_name)
+		self.assertRaises(dabo.dException.dException, cur.deleteRows)
+
+	def test_metadataCache(self):
+		cur = self.cur
+		flds = cur.getFields()
+		bo = cur.BackendObject
+		calls = []
+		getFields = bo.getFields
+		def countingGetFields(*args):
+			calls.append(args)
+			return getFields(*args)
+		bo.getFields = countingGetFields
+		# Another cursor on the same connection uses the cached fields.
+		other = cur.AuxCursor
+		self.assertEqual(other.getFields(self.temp_table_name), flds)
+		self.assertEqual(calls, [])
+		bo.clearMetadataCache(self.temp_table_name)
+		self.assertEqual(cur.getFields(), flds)
+		self.assertEqual(len(calls), 1)
+		# The disk tier is shared by caches with the same namespace.
+		fd, fname = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(fname)
+		self.addCleanup(os.remove, fname)
+		dabo.db.dMetadataCache(fname, "db1").set("fields", "tbl", flds)
+		self.assertEqual(dabo.db.dMetadataCache(fname, "db1").get("fields", "tbl"), flds)
+		self.assertEqual(dabo.db.dMetadataCache(fname, "db2").get("fields", "tbl"), None)
+
+	def test_resultCache(self):
+		cur = self.cur
+		calls = []
+		def executeStatement(sql, *args, **kwargs):
+			calls.append(sql)
+			return type(cur)._executeStatement(cur, sql, *args, **kwargs)
+		cur._executeStatement = executeStatement
+		cur.ResultCacheInterval = 60
+		cur.requery()
+		cur.Record.cfield = "changed"
+		self.assertEqual(len(calls), 1)
+		cur.requery()
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.Record.cfield.rstrip(), "Paul Keith McNett")
+		self.assertIsInstance(cur.Record.nfield, Decimal)
+		# Changes made through any cursor of the connection invalidate it.
+		cur.AuxCursor.execute("delete from %s where pk = 1" % self.temp_table_name)
+		cur.requery()
+		self.assertEqual(len(calls), 2)
+		self.assertEqual(cur.RowCount, 2)
+		# Results larger than the cache are not kept.
+		cur.BackendObject.ResultCache.MaxSize = 10
+		self.assertEqual(len(cur.BackendObject.ResultCache), 0)
+		cur.requery()
+		cur.requery()
+		self.assertEqual(len(calls), 4)
+
+	def test_resultCacheRollback(self):
+		cur = self.cur
+		cur.ResultCacheInterval = 60
+		cur.UserSQL = "select * from %s where pk = 1" % self.temp_table_name
+		cur.beginTransaction()
+		cur.AuxCursor.execute("update %s set cfield = 'CHANGED' where pk = 1"
+				% self.temp_table_name)
+		cur.requery()
+		self.assertEqual(cur.Record.cfield.rstrip(), "CHANGED")
+		cur.rollbackTransaction()
+		# The result holding the rolled back change is dropped.
+		cur.requery()
+		self.assertEqual(cur.Record.cfield.rstrip(), "Paul Keith McNett")
+		# A committed change stays cached.
+		cur.beginTransaction()
+		cur.AuxCursor.execute("update %s set cfield = 'CHANGED' where pk = 1"
+				% self.temp_table_name)
+		cur.requery()
+		cur.commitTransaction()
+		self.assertEqual(len(cur.BackendObject.ResultCache), 1)
+		self.assertEqual(cur.BackendObject.ResultCache._uncommitted, set())
+
+	def test_bulkLoad(self):
+		cur = self.cur
+		rows = (("bulk%s" % num, num) for num in xrange(2500))
+		self.assertEqual(cur.bulkLoad(rows, ("cfield", "ifield")), 2500)
+		self.assertEqual(cur.RowCount, 3)
+		cur.requery()
+		self.assertEqual(cur.RowCount, 2503)
+		cur.RowNumber = 2502
+		self.assertEqual((cur.Record.cfield, cur.Record.ifield), ("bulk2499", 2499))
+
+	@unittest.skipIf(numpy is None, "NumPy is not installed")
+	def test_getColumnArrays(self):
+		cur = self.cur
+		self.createNullRecord()
+		cur.requery()
+		arrays = cur.getColumnArrays(("cfield", "ifield", "nfield"))
+		self.assertEqual(arrays["ifield"].dtype, numpy.dtype("int64"))
+		self.assertEqual(arrays["nfield"].dtype, numpy.dtype("float64"))
+		self.assertEqual(arrays["cfield"].dtype, numpy.dtype(object))
+		self.assertEqual(arrays["ifield"].sum(), 23 + 42 + 10223)
+		self.assertEqual(list(arrays["ifield"].mask), [False, False, False, True])
+		self.assertAlmostEqual(arrays["nfield"][1], 42.42)
+		self.assertEqual(list(cur.getColumnArrays(("ifield",), rowStart=1, rows=1)["ifield"]),
+				[42])
+		# Without a TypeStructure, the types come from the values.
+		ds = dabo.db.dDataSet([{"dfield": datetime.date(2010, 1, 2)}, {"dfield": None}])
+		darr = ds.toArrays()["dfield"]
+		self.assertEqual(darr.dtype, numpy.dtype("datetime64[D]"))
+		self.assertEqual(list(darr.mask), [False, True])
+
+	def test_paging(self):
+		cur = self.cur
+		cur.UserSQL = None
+		cur.setOrderByClause("cfield")
+		cur.PageSize = 2
+		cur.requery()
+		self.assertEqual([rec["cfield"] for rec in cur.getDataSet()],
+				["Carl Karsten", "Edward Leafe"])
+		self.assertEqual(cur.nextPage(), True)
+		self.assertEqual([rec["cfield"] for rec in cur.getDataSet()], ["Paul Keith McNett"])
+		self.assertEqual(cur.nextPage(), False)
+		self.assertEqual(cur.RowCount, 1)
+		self.assertEqual(cur.previousPage(), True)
+		self.assertEqual([rec["cfield"] for rec in cur.getDataSet()],
+				["Carl Karsten", "Edward Leafe"])
+		self.assertEqual(cur.previousPage(), False)
+		# The statement of the page that wasn't found is forgotten.
+		cur.requery()
+		lastSQL = cur.LastSQL
+		self.assertEqual(cur.previousPage(), False)
+		self.assertEqual(cur.LastSQL, lastSQL)
+		# Rows with the same order-by value are told apart by the key field.
+		cur.setOrderByClause("ifield desc")
+		cur.AuxCursor.execute("update %s set ifield = 42" % self.temp_table_name)
+		cur.PageSize = 1
+		cur.requery()
+		pks = [cur.Record.pk]
+		while cur.nextPage():
+			pks.append(cur.Record.pk)
+		self.assertEqual(pks, [1, 2, 3])
+		# UserSQL isn't paged.
+		cur.UserSQL = "select * from %s" % self.temp_table_name
+		cur.requery()
+		self.assertEqual(cur.nextPage(), False)
+		self.assertEqual(cur.RowCount, 3)
+
+	def test_getSQLCache(self):
+		cur = self.cur
+		cur.setFieldClause("*")
+		cur.setFromClause(self.temp_table_name)
+		cur.setWhereClause("ifield > 0")
+		sql = cur.getSQL()
+		# Nothing changed, so the composed statement is reused.
+		self.assertTrue(cur.getSQL() is sql)
+		cur.setWhereClause("ifield > 0")
+		self.assertTrue(cur.getSQL() is sql)
+		cur.setWhereClause("ifield > 100")
+		self.assertNotEqual(cur.getSQL(), sql)
+		self.assertTrue("ifield > 100" in cur.getSQL())
+		# The structure-only statement doesn't touch the clauses.
+		self.assertFalse("ifield > 100" in cur.getStructureOnlySql())
+		self.assertEqual(cur.getWhereClause(), "ifield > 100")
+		self.assertTrue("ifield > 100" in cur.getSQL())
+		cur.UserSQL = None
+		cur.requery()
+		self.assertEqual(cur.RowCount, 1)
+
+	def test_dataSetMirror(self):
+		cur = self.cur
+		recs = cur._records
+		loads = []
+		loadTable = recs._loadTable
+		def countingLoad(ds, alias, *args):
+			loads.append(alias)
+			loadTable(ds, alias, *args)
+		recs._loadTable = countingLoad
+		stmnt = "select cfield from dataset where ifield = 42 order by cfield"
+		self.assertEqual([rec["cfield"] for rec in recs.execute(stmnt)], ["Edward Leafe"])
+		self.assertEqual(len(loads), 1)
+		# Unchanged data isn't copied again.
+		recs.execute(stmnt)
+		self.assertEqual(len(loads), 1)
+		# Changes made through the cursor only update the changed rows.
+		cur.setFieldVal("ifield", 42, row=0)
+		cur.new()
+		cur.setFieldVal("cfield", "Newbie")
+		cur.setFieldVal("ifield", 42)
+		version = recs._version
+		cur.setNewFlag()
+		self.assertTrue(recs._version > version)
+		self.assertEqual([rec["cfield"] for rec in recs.execute(stmnt)],
+				["Edward Leafe", "Newbie", "Paul Keith McNett"])
+		self.assertEqual(len(loads), 1)
+		recs.replace("ifield", 23, scope="cfield == 'Newbie'")
+		self.assertEqual(len(recs.execute(stmnt)), 2)
+		self.assertEqual(len(loads), 1)
+		# Statements that change the table make it reload.
+		recs.execute("update dataset set ifield = 0")
+		self.assertEqual(len(recs.execute(stmnt)), 2)
+		self.assertEqual(len(loads), 2)
+		# Changes made directly to the records must be marked.
+		recs[0]["ifield"] = 0
+		recs.markChanged([0])
+		self.assertEqual(len(recs.execute(stmnt)), 1)
+		# Changes made through a filtered data set are seen by its source.
+		filtered = recs.filter("cfield", "Carl Karsten")
+		filtered[0]["ifield"] = 42
+		filtered.markChanged([0])
+		self.assertEqual(len(recs.execute(stmnt)), 2)
+		# A record that gained a field makes the table reload.
+		count = len(loads)
+		recs[0]["extra"] = 1
+		recs.markChanged([0])
+		self.assertEqual(len(recs.execute("select extra from dataset where extra = 1")), 1)
+		self.assertEqual(len(loads), count + 1)
+
+	def test_dataSetDirectChanges(self):
+		ds = dabo.db.dDataSet(({"num": 1}, {"num": 2}))
+		stmnt = "select num from dataset where num > 1"
+		self.assertEqual(len(ds.execute(stmnt)), 1)
+		# The record dicts of a dDataSet can be changed directly.
+		ds[0]["num"] = 5
+		self.assertEqual(len(ds.execute(stmnt)), 2)
+		loads = []
+		loadTable = ds._loadTable
+		def countingLoad(*args):
+			loads.append(args)
+			loadTable(*args)
+		ds._loadTable = countingLoad
+		self.assertEqual(len(ds.execute(stmnt)), 2)
+		self.assertEqual(loads, [])
+
+	def test_getDataSetView(self):
+		cur = self.cur
+		cur.VirtualFields = {"double": lambda: cur.Record.ifield * 2}
+		view = cur.getDataSetView(flds=("cfield", "ifield", "double"), rowStart=1)
+		self.assertEqual(len(view), 2)
+		self.assertEqual(list(view), list(cur.getDataSet(flds=("cfield", "ifield", "double"),
+				rowStart=1)))
+		rec = view[0]
+		self.assertEqual(sorted(rec.keys()), ["cfield", "double", "ifield"])
+		self.assertEqual(rec["double"], 84)
+		self.assertRaises(KeyError, rec.__getitem__, "nfield")
+		# The view reads the current values of the cursor's records.
+		cur.setFieldVal("ifield", 43, row=1)
+		self.assertEqual(rec["ifield"], 43)
+		# Changes made through the view don't reach the cursor.
+		rec["ifield"] = 99
+		self.assertEqual(view[0]["ifield"], 99)
+		self.assertEqual(cur.getFieldVal("ifield", 1), 43)
+		self.assertEqual(len(view.filter("ifield", 10223)), 1)
+		self.assertEqual(view[-1]["cfield"].rstrip(), "Carl Karsten")
+		self.assertEqual(len(view[:1]), 1)
+
 	def test_datatypes(self):
 		"""
 		Make sure the datatypes in the dCursor are correct.
@@ -299,6 +796,8 @@ insert into %s (cfield, ifield, nfield) values (NULL, NULL, NULL)
 		self.assertIsInstance(rec.nfield, Decimal)
 		self.assertEqual(dabo.convertFloatToDecimal, True)
 		self.assertIsInstance(rec.ffield, Decimal)
+		# Don't leak the setting into the tests that follow.
+		self.addCleanup(setattr, dabo, "convertFloatToDecimal", True)
 		dabo.convertFloatToDecimal = False
 		cur.requery()
 		self.assertEqual(dabo.convertFloatToDecimal, False)
@@ -331,6 +830,61 @@ class Test_dCursorMixin_sqlite(Test_dCursorMixin, unittest.TestCase):
 		super(Test_dCursorMixin_sqlite, self).setUp()
 
 
+class Test_dCursorMixin_sqlite_columnar(Test_dCursorMixin, unittest.TestCase):
+	def setUp(self):
+		con = dabo.db.dConnection(DbType="SQLite", Database=":memory:")
+		self.cur = con.getDaboCursor()
+		self.cur.ColumnarStorage = True
+		self.temp_table_name = "unittest%s" % getRandomUUID().replace("-", "")[-17:]
+		super(Test_dCursorMixin_sqlite_columnar, self).setUp()
+
+	def test_columnarStorage(self):
+		cur = self.cur
+		self.assertTrue(isinstance(cur._records, dabo.db.dColumnarDataSet))
+		rec = cur._records[1]
+		self.assertEqual(rec["cfield"], "Edward Leafe")
+		self.assertTrue("ifield" in rec)
+		self.assertFalse("bogus" in rec)
+		cur.Record.ifield = 43
+		self.assertEqual(cur.getFieldVal("ifield"), 43)
+		self.assertEqual(cur.oldVal("ifield"), 23)
+		usage = cur.getMemoryUsage()
+		self.assertEqual(usage["rows"], 3)
+		# Switching back gives regular dict records with the same values.
+		cur.ColumnarStorage = False
+		self.assertTrue(isinstance(cur._records[0], dict))
+		self.assertEqual(cur.getFieldVal("ifield"), 43)
+		self.assertTrue(cur.isChanged())
+
+	def test_columnarAppendRows(self):
+		from array import array
+		ds = dabo.db.dColumnarDataSet.fromRows(("num", "name"), [(1, "a"), (2, "b")])
+		store = ds._store
+		col = store.columns["num"]
+		self.assertTrue(isinstance(col, array))
+		# Values that fit go straight into the array.
+		ds.appendRows(("num", "name"), [(3, "c")])
+		ds.compact()
+		self.assertTrue(store.columns["num"] is col)
+		self.assertEqual(list(col), [1, 2, 3])
+		# Text columns aren't scanned again.
+		self.assertEqual(store._valueTypes["name"], None)
+		# Values that don't fit turn the column into a list for good.
+		ds.appendRows(("num", "name"), [(None, "d")])
+		ds.compact()
+		self.assertEqual(store.columns["num"], [1, 2, 3, None])
+		ds[3]["num"] = 4
+		ds.compact()
+		self.assertEqual(store.columns["num"], [1, 2, 3, 4])
+		# Changed values are tracked too.
+		ds = dabo.db.dColumnarDataSet.fromRows(("num",), [(1.5,), (2,)])
+		self.assertEqual(ds._store._valueTypes["num"], None)
+		ds = dabo.db.dColumnarDataSet.fromRows(("num",), [(1,), (2,)])
+		ds[0]["num"] = "x"
+		ds.compact()
+		self.assertEqual(ds._store.columns["num"], ["x", 2])
+
+
 class Test_dCursorMixin_mysql(Test_dCursorMixin, unittest.TestCase):
 	def setUp(self):
 		con = dabo.db.dConnection(DbType="MySQL", User="dabo_unittest",
@@ -426,6 +980,8 @@ if __name__ == "__main__":
 	for k, v in db_tests.items():
 		if v:
 			testClasses.append(mapping[k])
+			if k == "sqlite":
+				testClasses.append(Test_dCursorMixin_sqlite_columnar)
 	for t in testClasses:
 		suite = unittest.TestLoader().loadTestsFromTestCase(t)
 		unittest.TextTestRunner(verbosity=2).run(suite)
@@ -26,6 +26,10 @@ class connHandler(xml.sax.ContentHandler):
 				"password" : "",
 				"port" : "",
 				"KeepAliveInterval": "",
+				"PoolMinSize": "",
+				"PoolMaxSize": "",
+				"PoolIdleTimeout": "",
+				"PoolHealthCheck": "",
 				}
 		self.currDict = self.blankConn.copy()
 		self.element = None
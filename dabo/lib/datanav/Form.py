@@ -190,6 +190,12 @@ class Form(dabo.ui.dForm):
 					bmp="%s/actions/view-refresh.png" % iconPath,
 					ItemID="actions_requery",
 					help=_("Get a new recordset from the backend."), menutype="check")
+			menu.append(_("Pre&vious Page"), OnHit=self.onPreviousPage,
+					ItemID="actions_prevpage", DynamicEnabled=self.enablePaging,
+					help=_("Get the records before the current ones."))
+			menu.append(_("Next Pa&ge"), OnHit=self.onNextPage,
+					ItemID="actions_nextpage", DynamicEnabled=self.enablePaging,
+					help=_("Get the records after the current ones."))
 
 		if self.FormType != "PickList":
 			menu.append(_("&Save Changes")+"\tCtrl+S", OnHit=self.onSave,
@@ -642,6 +648,43 @@ class Form(dabo.ui.dForm):
 			return super(Form, self).requery(dataSource)
 
 
+	def enablePaging(self):
+		biz = self.getBizobj()
+		return bool(biz and biz.PageSize and not biz.UserSQL)
+
+
+	def onNextPage(self, evt):
+		self.requeryPage(forward=True)
+
+
+	def onPreviousPage(self, evt):
+		self.requeryPage(forward=False)
+
+
+	def requeryPage(self, forward=True):
+		"""
+		Replace the records of the primary bizobj with the next page of them, or
+		the previous one, when its PageSize is set.
+		"""
+		biz = self.getBizobj()
+		if not self.enablePaging():
+			return
+		self.activeControlValid()
+		if not self.confirmChanges(bizobjs=biz):
+			return
+		oldRowNumber = biz.RowNumber
+		if forward:
+			found = biz.nextPage()
+		else:
+			found = biz.previousPage()
+		if not found:
+			self.StatusText = _("No more records.")
+			return
+		self.update()
+		self.raiseEvent(dEvents.RowNumChanged, newRowNumber=biz.RowNumber,
+				oldRowNumber=oldRowNumber, bizobj=biz)
+
+
 	def onNew(self, evt):
 		self.pageFrame.newByDataSource(self.getBizobj().DataSource)
 
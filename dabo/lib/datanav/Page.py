@@ -408,7 +408,12 @@ class SelectPage(Page):
 
 	def setLimit(self, biz):
 		if "limit" in self.selectFields:
-			biz.setLimitClause(self.selectFields["limit"]["ctrl"].Value)
+			limit = self.selectFields["limit"]["ctrl"].Value
+			if biz.PageSize:
+				# The limit is the size of the pages browsed with nextPage().
+				biz.PageSize = limit
+			else:
+				biz.setLimitClause(limit)
 
 
 	def requery(self):
@@ -428,8 +433,10 @@ class SelectPage(Page):
 				self.setGroupBy(bizobj)
 				self.setLimit(bizobj)
 
-				sql = bizobj.getSQL()
-				bizobj.setSQL(sql)
+				if not bizobj.PageSize:
+					# Paging needs the SQL clauses, so it can't be frozen in UserSQL.
+					sql = bizobj.getSQL()
+					bizobj.setSQL(sql)
 
 			ret = frm.requery(_fromSelectPage=True)
 
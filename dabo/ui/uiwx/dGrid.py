@@ -3094,12 +3094,17 @@ class dGrid(cm.dControlMixin, wx.grid.Grid):
 		# Copy the specified field vals and their row numbers to a list, and
 		# add those lists to the sort list
 		sortList = []
-		for i in range(0, self.RowCount):
-			if biz:
-				val = biz.getFieldVal(fld, i, _forceNoCallback=True)
-			else:
-				val = self.DataSet[i][fld]
-			sortList.append( [val, i] )
+		if biz and fld in biz.VirtualFields:
+			# Compute the whole virtual column at once.
+			vals = biz.getVirtualFieldValues(fld)
+			sortList = [[val, i] for i, val in enumerate(vals)]
+		else:
+			for i in range(0, self.RowCount):
+				if biz:
+					val = biz.getFieldVal(fld, i, _forceNoCallback=True)
+				else:
+					val = self.DataSet[i][fld]
+				sortList.append( [val, i] )
 
 		# Determine if we are seeking string values
 		compString = False